@@ -0,0 +1,100 @@
+"""
+Import-time profile of the Cloud Functions entry point (functions/main.py).
+
+Runs `python -X importtime` on a fresh interpreter that imports main (what a cold
+start does before serving its first request), then reports the total import time,
+the slowest top-level imports and the latency of the first request to a light route.
+
+Usage (from the repository root):
+  python benchmarks/import_profile.py
+  python benchmarks/import_profile.py --top 30 --route /get-tickers/nifty100
+  python benchmarks/import_profile.py --output import_profile.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "functions")
+PROJECT_ID = "amazingstocks-benchmark"
+
+# Executed in the child interpreter: Firebase is initialized with anonymous credentials
+# (main.py only loads serviceAccountKey.json when no app exists), then main is imported
+# and the first request is served.
+CHILD = """
+import os, sys, time, json
+start = time.perf_counter()
+import firebase_admin
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+
+class LocalCredential(credentials.Base):
+    def get_credential(self):
+        return AnonymousCredentials()
+
+firebase_admin.initialize_app(LocalCredential(), {"projectId": os.environ["GOOGLE_CLOUD_PROJECT"]})
+import main
+imported = time.perf_counter()
+response = main.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({"importSeconds": imported - start, "firstRequestSeconds": served - imported,
+                  "status": response.status_code, "heavyModulesLoaded":
+                  sorted(name for name in ("backtrader", "yfinance", "matplotlib", "psutil", "yahoo_fin")
+                         if name in sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output into {module: (self_us, cumulative_us, depth)}.
+    The depth is the nesting level of the import (0 for top-level imports).
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2 - 1
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def profile(route="/"):
+    env = {**os.environ, "GOOGLE_CLOUD_PROJECT": PROJECT_ID,
+           "FIRESTORE_EMULATOR_HOST": os.environ.get("FIRESTORE_EMULATOR_HOST", "localhost:0")}
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, route], cwd=FUNCTIONS_DIR,
+                             env=env, capture_output=True, text=True)
+    report_line = [line for line in process.stdout.splitlines() if line.startswith("{")]
+    if process.returncode or not report_line:
+        raise RuntimeError(f"Profiling failed:\n{process.stderr[-2000:]}")
+    report = json.loads(report_line[-1])
+    modules = parse_importtime(process.stderr)
+    report["modules"] = len(modules)
+    report["topLevel"] = sorted(((name, cumulative) for name, (_, cumulative, depth) in modules.items() if depth == 0),
+                                key=lambda item: item[1], reverse=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--route", default="/", help="Route of the first request")
+    parser.add_argument("--top", type=int, default=15, help="Number of top-level imports to list")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    report = profile(args.route)
+    print(f"Import of main: {report['importSeconds'] * 1000:.1f} ms, {report['modules']} modules")
+    print(f"First request {args.route}: {report['firstRequestSeconds'] * 1000:.1f} ms (HTTP {report['status']})")
+    print(f"Heavy modules loaded: {', '.join(report['heavyModulesLoaded']) or 'none'}")
+    print(f"\nSlowest top-level imports (cumulative):")
+    for name, cumulative in report["topLevel"][:args.top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {name}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
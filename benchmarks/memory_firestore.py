@@ -0,0 +1,343 @@
+"""
+In-memory stand-in for the subset of the Firestore client API used by firestore_util
+and yf_to_firestore: documents, nested collections, create, set/merge (with server
+timestamps), get, get_all, delete, write batches, bulk writers and queries with
+where/order_by/limit/select/start_after, plus an async wrapper for the async client.
+Every document read and write is counted so the benchmarks can report docs/s without
+a Firestore backend.
+"""
+import copy
+import datetime
+import operator
+import threading
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+}
+
+
+def _merge(target, data):
+    # Like Firestore merges, nested maps are merged field by field
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+class MemoryFirestore:
+    def __init__(self):
+        # {collection path: {document id: data}}
+        self._collections = {}
+        self._lock = threading.Lock()
+        # Held by a MemoryTransaction from its begin to its commit or rollback
+        self._transaction_lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name):
+        return MemoryCollection(self, (name,))
+
+    def batch(self):
+        return MemoryBatch(self)
+
+    def bulk_writer(self):
+        return MemoryBulkWriter(self)
+
+    def transaction(self):
+        return MemoryTransaction(self)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            snapshot = reference.get()
+            if field_paths is not None and snapshot.exists:
+                snapshot._data = {field: snapshot._data[field] for field in field_paths if field in snapshot._data}
+            yield snapshot
+
+    def reset_counters(self):
+        self.reads = 0
+        self.writes = 0
+
+    @staticmethod
+    def _resolve(data):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return {key: now if value is SERVER_TIMESTAMP else value for key, value in data.items()}
+
+    def _set(self, path, data, merge=False):
+        data = self._resolve(data)
+        with self._lock:
+            self.writes += 1
+            documents = self._collections.setdefault(path[:-1], {})
+            if merge and path[-1] in documents:
+                _merge(documents[path[-1]], copy.deepcopy(data))
+            else:
+                documents[path[-1]] = copy.deepcopy(data)
+
+    def _create(self, path, data):
+        data = self._resolve(data)
+        with self._lock:
+            if path[-1] in self._collections.get(path[:-1], {}):
+                raise AlreadyExists(f"Document already exists: {'/'.join(path)}")
+            self.writes += 1
+            self._collections.setdefault(path[:-1], {})[path[-1]] = copy.deepcopy(data)
+
+    def _get(self, path):
+        with self._lock:
+            self.reads += 1
+            data = self._collections.get(path[:-1], {}).get(path[-1])
+            return copy.deepcopy(data) if data is not None else None
+
+    def _delete(self, path):
+        with self._lock:
+            self.writes += 1
+            self._collections.get(path[:-1], {}).pop(path[-1], None)
+
+    def _children(self, collection_path):
+        with self._lock:
+            return [(collection_path + (document_id,), data)
+                    for document_id, data in self._collections.get(collection_path, {}).items()]
+
+
+class MemorySnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return self._data
+
+
+class MemoryDocument:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return MemoryCollection(self._store, self.path + (name,))
+
+    def create(self, data):
+        self._store._create(self.path, data)
+
+    def set(self, data, merge=False):
+        self._store._set(self.path, data, merge=merge)
+
+    def update(self, data):
+        self._store._set(self.path, data, merge=True)
+
+    def get(self, field_paths=None, transaction=None):
+        data = self._store._get(self.path)
+        if field_paths is not None and data is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return MemorySnapshot(self, data)
+
+    def delete(self):
+        self._store._delete(self.path)
+
+
+class MemoryQuery:
+    def __init__(self, store, path, filters=(), orders=(), limit=None, fields=None, cursor=None):
+        self._store = store
+        self.path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._fields = fields
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, fields=self._fields,
+                     cursor=self._cursor)
+        state.update(changes)
+        return MemoryQuery(self._store, self.path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, values):
+        """Cursor on the ordered fields; only ascending orders are supported."""
+        return self._copy(cursor=tuple(values[field] for field, _ in self._orders))
+
+    def stream(self):
+        documents = []
+        for path, data in self._store._children(self.path):
+            if all(field in data and compare(data[field], value) for field, compare, value in self._filters):
+                documents.append((path, data))
+        for field, descending in reversed(self._orders):
+            documents.sort(key=lambda item: item[1].get(field), reverse=descending)
+        if self._cursor is not None:
+            documents = [(path, data) for path, data in documents
+                         if tuple(data.get(field) for field, _ in self._orders) > self._cursor]
+        if self._limit is not None:
+            documents = documents[:self._limit]
+        for path, data in documents:
+            with self._store._lock:
+                self._store.reads += 1
+            data = copy.deepcopy(data)
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield MemorySnapshot(MemoryDocument(self._store, path), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+        self.id = path[-1]
+
+    def document(self, document_id):
+        return MemoryDocument(self._store, self.path + (document_id,))
+
+
+class MemoryBatch:
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        for reference, data, merge in self._writes:
+            reference.set(data, merge=merge)
+        self._writes = []
+
+
+class MemoryTransaction:
+    """
+    Transaction for firestore.transactional. Transactions are serialized by one lock
+    of the store, held from _begin to the commit or rollback, and their writes are
+    applied on commit, so a read-check-write in a transaction is atomic against other
+    transactions (plain writes are not blocked).
+    """
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, store):
+        self._store = store
+        self._id = None
+        self._writes = []
+
+    def _clean_up(self):
+        self._writes = []
+
+    def _begin(self, retry_id=None):
+        self._store._transaction_lock.acquire()
+        self._id = id(self).to_bytes(8, "little")
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._store._transaction_lock.release()
+
+    def _commit(self):
+        try:
+            for operation, reference, data in self._writes:
+                operation(reference, data)
+        finally:
+            self._writes = []
+            self._release()
+
+    def _rollback(self):
+        self._writes = []
+        self._release()
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((lambda ref, value: ref.set(value, merge=merge), reference, data))
+
+    def create(self, reference, data):
+        self._writes.append((lambda ref, value: ref.create(value), reference, data))
+
+    def update(self, reference, data):
+        self._writes.append((lambda ref, value: ref.update(value), reference, data))
+
+    def delete(self, reference):
+        self._writes.append((lambda ref, value: ref.delete(), reference, None))
+
+
+class MemoryBulkWriter(MemoryBatch):
+    """Writes are applied on close; the memory store never fails a write."""
+
+    def on_write_error(self, callback):
+        pass
+
+    def flush(self):
+        self.commit()
+
+    def close(self):
+        self.commit()
+
+
+class AsyncMemoryFirestore:
+    """Async client API over a MemoryFirestore (see firestore_util.get_async_client)."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def collection(self, name):
+        return AsyncMemoryQuery(self._store.collection(name))
+
+    async def get_all(self, references, field_paths=None):
+        for snapshot in self._store.get_all([reference._document for reference in references], field_paths):
+            yield snapshot
+
+
+class AsyncMemoryDocument:
+    def __init__(self, document):
+        self._document = document
+        self.id = document.id
+
+    def collection(self, name):
+        return AsyncMemoryQuery(self._document.collection(name))
+
+    async def get(self):
+        return self._document.get()
+
+    async def set(self, data, merge=False):
+        self._document.set(data, merge=merge)
+
+
+class AsyncMemoryQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        # where/order_by/limit/select/start_after return wrapped queries
+        method = getattr(self._query, name)
+        return lambda *args, **kwargs: AsyncMemoryQuery(method(*args, **kwargs))
+
+    def document(self, document_id):
+        return AsyncMemoryDocument(self._query.document(document_id))
+
+    async def stream(self):
+        for snapshot in self._query.stream():
+            yield snapshot
+
+    async def get(self):
+        return self._query.get()
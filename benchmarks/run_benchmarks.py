@@ -0,0 +1,262 @@
+"""
+Reproducible benchmarks of the data and signal pipeline.
+
+Synthetic, seeded OHLCV histories for 50/100/500 symbols are written through
+save_to_firestore and read back through get_data_from_firestore (and the bulk
+load_histories), then scanned with
+tradesignals.backtest, the vectorized engine and async_backtest. Each stage reports
+throughput (symbols/s, docs/s), latency percentiles and peak RSS.
+
+Backends:
+  memory    in-process stand-in for the Firestore client (default, no network)
+  emulator  the Firestore emulator from firebase.json (`firebase emulators:start --only firestore`)
+
+Usage (from the repository root):
+  python benchmarks/run_benchmarks.py --sizes 50 100 500
+  python benchmarks/run_benchmarks.py --save-baseline      # write benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --compare            # diff against the baseline
+  python benchmarks/run_benchmarks.py --price-dtype float64 --memory-budget 0   # full precision, no budget
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "functions")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+PROJECT_ID = "amazingstocks-benchmark"
+
+
+def synthetic_history(symbol_index, bars=260, seed=42):
+    """
+    Deterministic daily OHLCV history for one synthetic symbol (geometric random walk).
+    Prices depend only on (seed, symbol_index); the dates end on the last working day so
+    the period filters of the read path keep all bars.
+    """
+    rng = np.random.default_rng([seed, symbol_index])
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, bars)))
+    open_ = close * (1 + rng.normal(0, 0.005, bars))
+    spread = np.abs(rng.normal(0, 0.01, bars))
+    last_working_day = (pd.Timestamp.today() - pd.tseries.offsets.BDay(1)).normalize()
+    index = pd.bdate_range(end=last_working_day, periods=bars, name="Date")
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + spread),
+        "low": np.minimum(open_, close) * (1 - spread),
+        "close": close,
+        "volume": rng.integers(10_000, 1_000_000, bars).astype(float),
+    }, index=index)
+
+
+def setup_backend(backend):
+    """
+    Initializes Firebase for the chosen backend before the app modules are imported and
+    returns the in-memory store (None for the emulator).
+    """
+    os.environ.setdefault("OHLCV_CACHE_DIR", tempfile.mkdtemp(prefix="ohlcv_cache_bench_"))
+    os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
+    if backend == "emulator":
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+    else:
+        # The clients are never used for I/O, but constructing them must not need credentials
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:0")
+
+    import firebase_admin
+    from firebase_admin import credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    class LocalCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(LocalCredential(), {"projectId": PROJECT_ID})
+
+    os.chdir(FUNCTIONS_DIR)
+    sys.path.insert(0, FUNCTIONS_DIR)
+    if backend == "emulator":
+        return None
+
+    from memory_firestore import AsyncMemoryFirestore, MemoryFirestore
+    import firestore_util
+
+    # Every module reads and writes through the shared clients of firestore_util
+    store = MemoryFirestore()
+    firestore_util.firestore_client = store
+    firestore_util.async_firestore_client = AsyncMemoryFirestore(store)
+    return store
+
+
+class PeakRSS:
+    """Samples the RSS of this process in a background thread and keeps the peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def run_stage(name, items, func, store=None, symbols=None):
+    """
+    Runs func(item) for every item and returns the stage metrics. `symbols` overrides the
+    symbol count for stages that process the whole universe in a single call.
+    """
+    latencies = []
+    if store is not None:
+        store.reset_counters()
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        for item in items:
+            item_start = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - item_start)
+        elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    docs = (store.reads + store.writes) if store is not None else None
+    symbols = symbols or len(items)
+    result = {
+        "stage": name,
+        "symbols": symbols,
+        "seconds": round(elapsed, 4),
+        "symbolsPerSecond": round(symbols / elapsed, 2) if elapsed else None,
+        "docsRead": store.reads if store is not None else None,
+        "docsWritten": store.writes if store is not None else None,
+        "docsPerSecond": round(docs / elapsed, 2) if docs is not None and elapsed else None,
+        "latencyMs": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p90": round(float(np.percentile(latencies_ms, 90)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+        "peakRssMb": round(rss.peak / (1024 * 1024), 2),
+        "rssBeforeMb": round(rss_before / (1024 * 1024), 2),
+        "rssAfterMb": round(process.memory_info().rss / (1024 * 1024), 2),
+    }
+    print(f"  {name:<16} {result['symbolsPerSecond']!s:>10} sym/s  {result['docsPerSecond']!s:>10} docs/s  "
+          f"p50 {result['latencyMs']['p50']:.2f} ms  p99 {result['latencyMs']['p99']:.2f} ms  "
+          f"RSS {result['rssBeforeMb']:.1f} -> peak {result['peakRssMb']:.1f} -> {result['rssAfterMb']:.1f} MB")
+    return result
+
+
+def run_size(size, store, seed=42):
+    import firestore_util
+    import signal_engine
+    import tradesignals
+    import yf_to_firestore
+    from ohlcv_cache import cache
+
+    symbols = [f"SYN{i:04d}.BM" for i in range(size)]
+    histories = {symbol: synthetic_history(i, seed=seed) for i, symbol in enumerate(symbols)}
+    print(f"{size} symbols")
+
+    stages = [
+        run_stage("save_to_firestore", symbols,
+                  lambda symbol: yf_to_firestore.save_to_firestore(histories[symbol].copy(), symbol), store),
+        run_stage("read_uncached", symbols,
+                  lambda symbol: yf_to_firestore.get_data_from_firestore(symbol, use_cache=False), store),
+        run_stage("read_bulk", [symbols],
+                  lambda batch: yf_to_firestore.load_histories(batch, use_cache=False), store, symbols=size),
+    ]
+    cache.invalidate()
+    stages.append(run_stage("read_cache_cold", symbols, yf_to_firestore.get_data_from_firestore, store))
+    stages.append(run_stage("read_cache_warm", symbols, yf_to_firestore.get_data_from_firestore, store))
+    stages.append(run_stage("backtest", symbols, tradesignals.backtest, store))
+    stages.append(run_stage("vectorized_scan", [symbols], signal_engine.scan, store, symbols=size))
+
+    # async_backtest resolves the universe itself; point it at the synthetic symbols
+    tradesignals.get_all_tickers = lambda segment: symbols
+    process_id = tradesignals.get_process_id(f"synthetic{size}")
+    stages.append(run_stage("async_backtest", [process_id],
+                            lambda pid: tradesignals.async_backtest(f"synthetic{size}", pid), store, symbols=size))
+    firestore_util.delete_document("process-list", process_id)
+    return {"symbols": size, "stages": stages}
+
+
+def compare(results, baseline):
+    """Prints the relative change of symbols/s and p50 latency per stage against the baseline."""
+    base = {(run["symbols"], stage["stage"]): stage for run in baseline["runs"] for stage in run["stages"]}
+    print("\nChange vs baseline (symbols/s, p50 latency):")
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            reference = base.get((run["symbols"], stage["stage"]))
+            if not reference or not reference["symbolsPerSecond"]:
+                continue
+            throughput = stage["symbolsPerSecond"] / reference["symbolsPerSecond"] - 1
+            latency = stage["latencyMs"]["p50"] / reference["latencyMs"]["p50"] - 1 if reference["latencyMs"]["p50"] else 0
+            print(f"  {run['symbols']:>4} {stage['stage']:<16} {throughput:+8.1%} throughput  {latency:+8.1%} p50")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 500])
+    parser.add_argument("--backend", choices=["memory", "emulator"], default="memory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Results file, defaults to benchmarks/results/<timestamp>.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline")
+    parser.add_argument("--price-dtype", choices=["float32", "float64"], default="float64",
+                        help="dtype of the OHLC columns (BAR_PRICE_DTYPE)")
+    parser.add_argument("--memory-budget", type=float, default=0,
+                        help="Memory budget mode of the scans in MB (MEMORY_BUDGET_MB), 0 disables it")
+    args = parser.parse_args()
+
+    # Read by the app modules at import
+    os.environ["BAR_PRICE_DTYPE"] = args.price_dtype
+    os.environ["MEMORY_BUDGET_MB"] = str(args.memory_budget)
+    store = setup_backend(args.backend)
+    results = {
+        "createdAt": datetime.datetime.now().isoformat(),
+        "backend": args.backend,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "priceDtype": args.price_dtype,
+        "memoryBudgetMb": args.memory_budget,
+        "runs": [run_size(size, store, seed=args.seed) for size in args.sizes],
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {BASELINE_PATH}")
+    if args.compare and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
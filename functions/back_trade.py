@@ -1,13 +1,41 @@
 import backtrader as bt
 import yfinance as yf
 import datetime
+import io
+import os
+import time
+import threading
 import matplotlib
 from tradingstrategies.MeanReversionStrategy import MeanReversionStrategy
 from tradingstrategies.MovingAverageCrossoverStrategy import MovingAverageCrossoverStrategy
 matplotlib.use("Agg")  # Use Agg backend for non-GUI environments
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import cloud_storage_util
+import firestore_util
+from metrics import span
 
 profit = {}
+# Shared capital of a portfolio backtest, split equally over at most PORTFOLIO_MAX_POSITIONS holdings
+PORTFOLIO_CASH = 1000000
+PORTFOLIO_MAX_POSITIONS = 20
+# Plots are rendered off the request path, but not on a thread of the request's instance:
+# Cloud Functions throttles the CPU once the response is sent. Instead a plot request
+# document is written and rendered by its own invocation:
+# "trigger": a plot-requests/{id} document turning pending starts main.on_plot_requested,
+#   which calls render_plot
+# "local": the plot is rendered in this process before backtest returns, for local runs
+PLOT_RUNNER = os.environ.get("PLOT_RUNNER", "trigger")
+PLOT_REQUESTS = "plot-requests"
+# A request still pending after this long is considered lost and is requested again;
+# on_plot_requested times out after 300 seconds
+PLOT_TIMEOUT = datetime.timedelta(minutes=10)
+# pyplot is not thread safe
+_plot_lock = threading.Lock()
+_plots_uploaded = set()
+
 # Download Historical Data from Yahoo Finance
 def get_data(symbol, period="5y", interval="1d"):
     data = yf.download(symbol, period=period, interval=interval, multi_level_index=False)
@@ -21,10 +49,85 @@ def get_data(symbol, period="5y", interval="1d"):
     # data.columns = data.columns.droplevel(0) # Drop the first level (Ticker Names)
     return data
 
-# Backtest Function
-def backtest(symbol):
+def plot_path(symbol, strategy, watermark):
+    """Storage path of the backtest plot of a symbol and strategy on data ending at `watermark`."""
+    return f"backtest_plots/{strategy}/{symbol}/{watermark.strftime('%Y-%m-%d')}.png"
+
+def _render_plot(cerebro, path):
+    with _plot_lock, span("plot_render"):
+        fig = cerebro.plot()[0][0]
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")  # Save as PNG in memory
+        plt.close(fig)
+    with span("plot_upload"):
+        cloud_storage_util.upload_bytes(path, buffer.getvalue(), content_type="image/png")
+    _plots_uploaded.add(path)
+
+def _plot_request_id(path):
+    # Document IDs cannot contain "/"; one request per image
+    return path.replace("/", "|")
+
+def _request_plot(transaction, request_ref, symbol, path):
+    """
+    Sets the plot request to pending unless a request is pending already. A request
+    that failed, finished without the image ending up in the bucket or has been pending
+    longer than PLOT_TIMEOUT is requested again.
+    """
+    request = request_ref.get(transaction=transaction).to_dict()
+    if request is not None and request.get("status") == "pending":
+        requested = datetime.datetime.fromisoformat(request["requestedAt"])
+        if datetime.datetime.now() - requested < PLOT_TIMEOUT:
+            return
+    transaction.set(request_ref, {
+        "symbol": symbol,
+        "path": path,
+        "status": "pending",
+        "attempts": (request or {}).get("attempts", 0) + 1,
+        "requestedAt": datetime.datetime.now().isoformat()
+    })
+
+def queue_plot(cerebro, symbol, path):
+    """
+    Requests the plot of a finished run unless the image already exists in the bucket or
+    is requested already (see _request_plot). With PLOT_RUNNER=local the plot is
+    rendered right here.
+
+    Returns:
+        str: "cached", "queued" or "rendered"
+    """
+    if path in _plots_uploaded:
+        return "cached"
+    if cloud_storage_util.file_exists(path):
+        _plots_uploaded.add(path)
+        return "cached"
+    if PLOT_RUNNER == "local":
+        _render_plot(cerebro, path)
+        return "rendered"
+    request_ref = firestore_util.get_client().collection(PLOT_REQUESTS).document(_plot_request_id(path))
+    firestore_util.run_transaction(_request_plot, request_ref, symbol, path)
+    return "queued"
+
+def render_plot(symbol, path):
+    """
+    Worker of a plot request: reruns the backtest of the symbol and uploads its plot to
+    `path`. Runs in its own invocation (main.on_plot_requested), so the render gets a
+    full CPU instead of the throttled remainder of the request that asked for it.
+    """
+    request_ref = firestore_util.get_client().collection(PLOT_REQUESTS).document(_plot_request_id(path))
+    try:
+        cerebro, df, _ = _run_backtest(symbol)
+        if plot_path(symbol, MovingAverageCrossoverStrategy.__name__, df.index.max()) != path:
+            # A new bar arrived since the request; the image then shows it as well
+            print(f"Plot {path} includes bars up to {df.index.max():%Y-%m-%d}")
+        _render_plot(cerebro, path)
+        request_ref.set({"status": "done"}, merge=True)
+    except Exception as e:
+        print(f"Error rendering plot {path}: {e}")
+        request_ref.set({"status": "error", "error": str(e)}, merge=True)
+
+def _run_backtest(symbol, strategy=MovingAverageCrossoverStrategy):
     cerebro = bt.Cerebro()
-    cerebro.addstrategy(MovingAverageCrossoverStrategy, chk_last_weeks=999, symbol=symbol, print_signals=True)
+    cerebro.addstrategy(strategy, chk_last_weeks=999, symbol=symbol, print_signals=True)
 
     # Load Data
     df = get_data(symbol)
@@ -41,21 +144,263 @@ def backtest(symbol):
     cerebro.run()
     ending_capital = cerebro.broker.getvalue()
     print(f"Final Portfolio Value: {ending_capital:.2f}")
-    profit[symbol] = ending_capital - starting_capital
 
-    # Save the plot as an image file instead of displaying it
-    fig = cerebro.plot()[0][0]
-    fig.savefig(f"backtest_images/backtest_plot_{symbol}.png")  # Save as PNG file
-    plt.close(fig)
-    
     result = {
         "symbol": symbol,
         "starting_capital": starting_capital,
         "ending_capital": ending_capital,
         "profit_loss": ending_capital - starting_capital
     }
+    return cerebro, df, result
+
+# Backtest Function
+def backtest(symbol, plot=True):
+    """
+    Backtests the Moving Average Crossover strategy on 5 years of data.
+
+    The plot is not rendered on the request path: with plot=True a plot request is
+    written (see queue_plot), keyed by symbol, strategy and last bar date, and the URL
+    of the image is returned right away. An existing image for the same data is reused.
+    Without a Storage bucket the result has no plot.
+    """
+    strategy = MovingAverageCrossoverStrategy
+    cerebro, df, result = _run_backtest(symbol, strategy)
+    profit[symbol] = result["profit_loss"]
+    if plot and not df.empty:
+        path = plot_path(symbol, strategy.__name__, df.index.max())
+        url = cloud_storage_util.download_url(path)
+        if url is not None:
+            result["plot_url"] = url
+            result["plot_status"] = queue_plot(cerebro, symbol, path)
     return result
 
+class SignalData(bt.feeds.PandasData):
+    """
+    Daily bars with the precomputed entry/exit conditions of a strategy as extra lines.
+
+    PandasData reads every field of every bar with DataFrame.iloc, which dominates a run
+    over many feeds; here the columns are converted once in start() and bars are loaded
+    from plain lists.
+    """
+    lines = ("entry", "exit")
+    params = (("entry", -1), ("exit", -1))
+
+    def start(self):
+        super().start()
+        df = self.p.dataname
+        self._columns = [(getattr(self.lines, field), df.iloc[:, column].to_numpy(dtype=np.float64).tolist())
+                         for field, column in self._colmapping.items()
+                         if field != "datetime" and column is not None]
+        # bt.date2num: days since 0001-01-01 (proleptic ordinal), 719163 is 1970-01-01
+        self._datetimes = (df.index.values.astype("datetime64[ns]").astype(np.int64) / 86400e9 + 719163).tolist()
+
+    def _load(self):
+        self._idx += 1
+        if self._idx >= len(self._datetimes):
+            return False
+        for line, values in self._columns:
+            line[0] = values[self._idx]
+        self.lines.datetime[0] = self._datetimes[self._idx]
+        return True
+
+
+class PortfolioStrategy(bt.Strategy):
+    """
+    Long-only portfolio over all data feeds of one Cerebro with one shared broker.
+
+    Entry and exit conditions are precomputed per symbol (see portfolio_backtest), so
+    the strategy only places the orders. Like the single-symbol strategies, a condition
+    on bar t is traded at the open of bar t + 1: with cheat_on_open the orders are
+    placed in next_open, on the conditions of the previous bar, and sized on the actual
+    fill price. Open positions are closed on their exit condition first, then symbols
+    with an entry condition are bought in data order while fewer than `max_positions`
+    are held. Each new position gets an equal share (1 / max_positions) of the portfolio
+    value, bounded by the cash left.
+    """
+    params = (
+        ("max_positions", PORTFOLIO_MAX_POSITIONS),
+    )
+
+    def __init__(self):
+        self.equity = []
+        self.traded_value = 0.0
+        self.trades = 0
+        self.rejected = 0
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.traded_value += abs(order.executed.size) * order.executed.price
+            self.trades += 1
+        elif order.status in (order.Margin, order.Rejected):
+            self.rejected += 1
+
+    def prenext_open(self):
+        # Symbols listed later than the first one have no bars yet; trade the others
+        self.next_open()
+
+    def prenext(self):
+        self.next()
+
+    def next_open(self):
+        # The strategy clock only advances after next_open; the newest bar of the feeds is today
+        today = max(data.datetime[0] for data in self.datas if len(data))
+        # Feeds without a bar today (not listed yet, suspended or delisted) are skipped
+        datas = [data for data in self.datas if len(data) > 1 and data.datetime[0] == today]
+        held = sum(1 for data in self.datas if self.getposition(data).size)
+
+        cash = self.broker.getcash()
+        for data in datas:
+            position = self.getposition(data)
+            if position.size and data.exit[-1]:
+                self.close(data=data)
+                commission = self.broker.getcommissioninfo(data).p.commission
+                cash += position.size * data.open[0] * (1 - commission)
+                held -= 1
+
+        target = self.broker.getvalue() / self.p.max_positions
+        for data in datas:
+            if held >= self.p.max_positions:
+                break
+            if self.getposition(data).size or not data.entry[-1]:
+                continue
+            commission = self.broker.getcommissioninfo(data).p.commission
+            size = int(min(target, cash) / (data.open[0] * (1 + commission)))
+            if size <= 0:
+                continue
+            self.buy(data=data, size=size)
+            cash -= size * data.open[0] * (1 + commission)
+            held += 1
+
+    def next(self):
+        # Portfolio value marked to the close
+        self.equity.append((self.datetime.date(0), self.broker.getvalue()))
+
+
+def _signal_frames(frames, strategy, params):
+    """
+    Adds the entry/exit conditions of `strategy` to the bars of every symbol, computed
+    for all symbols at once with the vectorized conditions of signal_engine. A condition
+    only holds from the bar at which the backtrader strategy's next() would first run.
+    """
+    import signal_engine
+
+    panel = signal_engine.load_panel(list(frames), frames=frames)
+    strategy_params = {**signal_engine.STRATEGY_PARAMS[strategy], **(params or {})}
+    entry, exit, start = signal_engine.CONDITIONS[strategy](panel, **strategy_params)
+    rows = np.arange(entry.shape[0])
+    signal_frames = {}
+    for col, symbol in enumerate(panel["symbols"]):
+        first = entry.shape[0] - panel["lengths"][col]
+        active = rows[first:] >= start[col]
+        df = frames[symbol][["open", "high", "low", "close", "volume"]].copy()
+        df["entry"] = (entry[first:, col] & active).astype(np.float64)
+        df["exit"] = (exit[first:, col] & active).astype(np.float64)
+        signal_frames[symbol] = df
+    return signal_frames
+
+
+def _portfolio_report(equity, starting_capital, traded_value, trades, rejected):
+    """Return, CAGR, maximum drawdown and annualized turnover of a daily equity curve."""
+    curve = pd.Series([value for _, value in equity], index=pd.DatetimeIndex([day for day, _ in equity]))
+    ending_capital = float(curve.iloc[-1])
+    years = max((curve.index[-1] - curve.index[0]).days / 365.25, 1 / 365.25)
+    drawdown = 1 - curve / curve.cummax()
+    return {
+        "start": curve.index[0].strftime('%Y-%m-%d'),
+        "end": curve.index[-1].strftime('%Y-%m-%d'),
+        "starting_capital": starting_capital,
+        "ending_capital": ending_capital,
+        "profit_loss": ending_capital - starting_capital,
+        "return_pct": (ending_capital / starting_capital - 1) * 100,
+        "cagr_pct": ((ending_capital / starting_capital) ** (1 / years) - 1) * 100,
+        "max_drawdown_pct": float(drawdown.max()) * 100,
+        "max_drawdown_date": drawdown.idxmax().strftime('%Y-%m-%d'),
+        # Traded value (buys and sells) per year relative to the average portfolio value
+        "turnover": traded_value / float(curve.mean()) / years,
+        "trades": trades,
+        "rejected_orders": rejected,
+        "equity": [[day.strftime('%Y-%m-%d'), round(float(value), 2)] for day, value in curve.items()],
+    }
+
+
+def portfolio_backtest(tickers, strategy="MovingAverageCrossoverStrategy", frames=None, period="5y",
+                       cash=PORTFOLIO_CASH, max_positions=PORTFOLIO_MAX_POSITIONS, commission=0.001, params=None,
+                       backfill=True):
+    """
+    Backtests a strategy on a whole ticker list as one portfolio with shared capital.
+
+    Unlike backtest, which runs an isolated 100k account per symbol, all symbols are fed
+    into one Cerebro and trade from one broker, with equal-weight position sizing (see
+    PortfolioStrategy). The bars are loaded once in bulk and the strategy conditions are
+    computed for all symbols together, so the run scales to e.g. nifty100 over 5 years.
+
+    Args:
+        tickers (list): The stock symbols.
+        strategy (str): Strategy name in signal_engine.STRATEGY_PARAMS.
+        frames (dict): Optional preloaded {symbol: DataFrame}. Missing symbols are bulk
+            loaded from Firestore with load_histories.
+        period (str): History period when loading from Firestore. Ingestion stores one
+            year of a new symbol; with `backfill` the older bars of a longer period are
+            downloaded (and stored) on the first run.
+        cash (float): Starting capital of the portfolio.
+        max_positions (int): Maximum number of simultaneous holdings.
+        commission (float): Commission on the traded value.
+        params (dict): Overrides for the strategy parameters.
+        backfill (bool): Complete histories loaded from Firestore that start after the
+            period start from Yahoo Finance (see yf_to_firestore.backfill_histories).
+
+    Returns:
+        dict: Portfolio value, return, CAGR, maximum drawdown, annualized turnover, trade
+        count and the daily equity curve as [date, value] pairs.
+
+    Raises:
+        ValueError: For an unsupported strategy, max_positions below 1 or when no
+            symbol has data.
+    """
+    import signal_engine
+    from yf_to_firestore import backfill_histories, load_histories
+
+    if strategy not in signal_engine.CONDITIONS:
+        raise ValueError(f"Unsupported strategy for portfolio backtest: {strategy}")
+    if max_positions < 1:
+        raise ValueError(f"max_positions must be at least 1, got {max_positions}")
+    frames = dict(frames or {})
+    missing = [symbol for symbol in tickers if symbol not in frames]
+    if missing:
+        with span("data_load"):
+            loaded = load_histories(missing, period=period)
+        if backfill:
+            with span("backfill"):
+                backfill_histories(loaded, period)
+        frames.update(loaded)
+    frames = {symbol: frames[symbol] for symbol in tickers if symbol in frames and not frames[symbol].empty}
+    if not frames:
+        raise ValueError("No data for any of the tickers")
+
+    with span("signal_compute"):
+        signal_frames = _signal_frames(frames, strategy, params)
+
+    # No observers: the strategy records the portfolio equity itself
+    cerebro = bt.Cerebro(stdstats=False, cheat_on_open=True)
+    for symbol, df in signal_frames.items():
+        cerebro.adddata(SignalData(dataname=df), name=symbol)
+    cerebro.addstrategy(PortfolioStrategy, max_positions=max_positions)
+    cerebro.broker.set_cash(cash)
+    cerebro.broker.setcommission(commission=commission)
+
+    started = time.perf_counter()
+    with span("cerebro_run"):
+        result = cerebro.run()[0]
+    print(f"Portfolio backtest of {len(signal_frames)} symbols ran in {time.perf_counter() - started:.2f}s")
+
+    report = _portfolio_report(result.equity, cash, result.traded_value, result.trades, result.rejected)
+    report.update({"strategy": strategy, "symbols": len(signal_frames), "max_positions": max_positions,
+                   "positions": [data._name for data in result.datas if result.getposition(data).size]})
+    print(f"Portfolio {report['start']} - {report['end']}: {report['starting_capital']:.2f} -> "
+          f"{report['ending_capital']:.2f} ({report['return_pct']:.2f}%), max drawdown "
+          f"{report['max_drawdown_pct']:.2f}%, turnover {report['turnover']:.2f}x/year, {report['trades']} trades")
+    return report
+
 def main(filepath):
     tickers = load_tickers(filepath)
     for symbol in tickers:
@@ -80,4 +425,19 @@ def load_tickers(file_path):
 
 # Run Backtest for Reliance Industries (NSE)
 if __name__ == "__main__":
-    main("data/tickers_backtest.txt")
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "portfolio":
+        from yf_to_firestore import get_data_multi
+        tickers = load_tickers("data/tickers_nifty100.txt")
+        start = (pd.Timestamp.today() - pd.DateOffset(years=5)).strftime('%Y-%m-%d')
+        # One grouped download per 50 tickers instead of one per ticker
+        frames = {}
+        for i in range(0, len(tickers), 50):
+            frames.update(get_data_multi(tickers[i:i + 50], start=start))
+        report = portfolio_backtest(tickers, frames=frames)
+        report.pop("equity")
+        print(report)
+    else:
+        # Render the plots here rather than through the deployed trigger
+        PLOT_RUNNER = "local"
+        main("data/tickers_backtest.txt")
@@ -1,6 +1,7 @@
 import firebase_admin
 from firebase_admin import storage
 import datetime # Needed for getting a timestamp for the filename
+from urllib.parse import quote
 
 # Initialize the Admin SDK.
 # In a standard Cloud Functions environment, this often picks up credentials automatically.
@@ -17,6 +18,46 @@ except Exception as e:
     bucket = None # Ensure bucket is None if connection fails
 
 
+def download_url(file_path):
+    """
+    Returns the Firebase Storage download URL of a file in the bucket. The URL is
+    deterministic, so it can be handed out before the file is uploaded; reading it
+    requires the Storage rules to allow the path. None when the bucket is not available.
+    """
+    if bucket is None:
+        return None
+    return (f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/"
+            f"{quote(file_path, safe='')}?alt=media")
+
+
+def file_exists(file_path):
+    """
+    Checks whether a file exists in the bucket.
+    """
+    if bucket is None:
+        return False
+    try:
+        return bucket.blob(file_path).exists()
+    except Exception as e:
+        print(f"Error checking gs://{bucket.name}/{file_path}: {e}")
+        return False
+
+
+def upload_bytes(file_path, content, content_type="application/octet-stream"):
+    """
+    Uploads bytes to a file in the bucket.
+
+    Args:
+        file_path (str): Path within the bucket.
+        content (bytes): The file content.
+        content_type (str): The MIME type stored with the file.
+    """
+    if bucket is None:
+        raise RuntimeError("Bucket is not initialized")
+    bucket.blob(file_path).upload_from_string(content, content_type=content_type)
+    print(f"Successfully saved file to gs://{bucket.name}/{file_path}")
+
+
 def save_file_from_python_function():
     """
     HTTP Cloud Function that saves a simple text file to Firebase Storage.
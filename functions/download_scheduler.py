@@ -0,0 +1,178 @@
+import datetime
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firestore_util import delete_document, get_document, update_document
+
+# Yahoo Finance throttles by request rate; these bound all downloads of an instance.
+DOWNLOADS_PER_MINUTE = float(os.environ.get("YF_DOWNLOADS_PER_MINUTE", "60"))
+DOWNLOAD_BURST = int(os.environ.get("YF_DOWNLOAD_BURST", "5"))
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("YF_MAX_CONCURRENT_DOWNLOADS", "4"))
+MAX_ATTEMPTS = 5
+# Backoff of attempt n is uniform in [0, min(MAX_BACKOFF, BASE_BACKOFF * 2**n)] ("full jitter")
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+
+CHECKPOINT_COLLECTION = "refresh-checkpoints"
+
+
+def _is_rate_limit(error):
+    # yfinance is imported lazily by the callers; match its exception by name
+    return type(error).__name__ == "YFRateLimitError"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate_per_minute` tokens are refilled continuously up to
+    `burst`. acquire() blocks until a token is available. pause() empties the bucket and
+    holds back all callers for a while, e.g. after a rate-limit response.
+    """
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._paused_until:
+            start = max(self._updated, self._paused_until)
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class DownloadScheduler:
+    """
+    Coordinates all Yahoo Finance downloads of the instance: every call takes a token
+    from one shared TokenBucket and at most `max_concurrency` calls run at a time.
+    Rate-limited calls are retried with jittered exponential backoff, and a rate-limit
+    response pauses the whole bucket so concurrent callers back off too.
+
+    Example:
+        frames = scheduler.call(yf.download, symbols, start=start, end=end)
+    """
+
+    def __init__(self, rate_per_minute=DOWNLOADS_PER_MINUTE, burst=DOWNLOAD_BURST,
+                 max_concurrency=MAX_CONCURRENT_DOWNLOADS, max_attempts=MAX_ATTEMPTS):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._started = None
+        self.downloads = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def _count(self, **counts):
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Runs one download under the rate limit and the concurrency bound.
+
+        Raises:
+            The last rate-limit error after max_attempts attempts, or any other error
+            of func right away.
+        """
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            with self._slots:
+                try:
+                    result = func(*args, **kwargs)
+                    self._count(downloads=1)
+                    return result
+                except Exception as e:
+                    if not _is_rate_limit(e):
+                        self._count(failures=1)
+                        raise
+                    self._count(rate_limited=1)
+                    if attempt + 1 == self.max_attempts:
+                        self._count(failures=1)
+                        raise
+            wait = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+            print(f"Rate-limited; pausing downloads for {wait:.1f}s (attempt {attempt + 1}/{self.max_attempts})")
+            self.bucket.pause(wait)
+            self._count(retries=1)
+
+    def map(self, func, items):
+        """Calls func(item) for all items on `max_concurrency` threads; func should use call() for its downloads."""
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(func, items))
+
+    def stats(self):
+        """Download counters since the first download and the achieved downloads per minute."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+            return {
+                "downloads": self.downloads,
+                "retries": self.retries,
+                "rateLimited": self.rate_limited,
+                "failures": self.failures,
+                "elapsedSeconds": round(elapsed, 1),
+                "downloadsPerMinute": round(self.downloads / elapsed * 60, 2) if elapsed else 0.0,
+            }
+
+
+scheduler = DownloadScheduler()
+
+
+class RefreshCheckpoint:
+    """
+    Persisted set of the symbols a universe refresh already completed, in
+    refresh-checkpoints/{name}. An interrupted refresh (timeout, crash, redeploy)
+    started again with the same name skips these symbols.
+
+    Symbols are recorded with merge writes of {"completed": {symbol: True}}, so
+    concurrent workers only ever add to the set.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def load(self):
+        """Returns the set of completed symbols (empty for a new checkpoint)."""
+        doc = get_document(CHECKPOINT_COLLECTION, self.name) or {}
+        return set(doc.get("completed", {}))
+
+    def mark(self, symbols):
+        if symbols:
+            update_document(CHECKPOINT_COLLECTION, self.name, {
+                "completed": {symbol: True for symbol in symbols},
+                "updatedAt": datetime.datetime.now().isoformat()
+            })
+
+    def finish(self, summary):
+        update_document(CHECKPOINT_COLLECTION, self.name, {
+            "finishedAt": datetime.datetime.now().isoformat(),
+            "summary": summary
+        })
+
+    def clear(self):
+        delete_document(CHECKPOINT_COLLECTION, self.name)
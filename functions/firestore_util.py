@@ -1,17 +1,180 @@
+import asyncio
+import threading
 
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, get_app, initialize_app
 
 
+# Shared Firestore clients of the default Firebase app, created on first use so importing
+# this module stays cheap. Every module goes through get_client/get_async_client, so one
+# process holds one gRPC channel pool instead of a client per module.
+firestore_client = None
+async_firestore_client = None
 
-# Initialize Firestore client
-firestore_client = firestore.Client()
+# Maximum document references per BatchGetDocuments call of get_documents.
+GET_ALL_CHUNK = 300
+# Attempts of a failed bulk write before it is reported (see bulk_write).
+BULK_WRITE_ATTEMPTS = 5
+
+_client_lock = threading.Lock()
+# Event loop of the async client, running on a daemon thread (see run_async)
+_loop = None
+
+
+def _ensure_app():
+    try:
+        get_app()
+    except ValueError:
+        initialize_app(credentials.Certificate("serviceAccountKey.json"))
+
+
+def get_client():
+    """
+    Returns the shared Firestore client, creating it on first use.
+    """
+    global firestore_client
+    if firestore_client is None:
+        with _client_lock:
+            if firestore_client is None:
+                _ensure_app()
+                firestore_client = firestore.client()
+    return firestore_client
+
+
+def _event_loop():
+    global _loop
+    with _client_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="firestore-async", daemon=True).start()
+    return _loop
+
+
+def run_async(coroutine):
+    """
+    Runs a coroutine on the event loop of the async client and returns its result.
+
+    The loop lives on a daemon thread for the lifetime of the process, so the async
+    client (whose gRPC channel is bound to one loop) is reused by every call, from any
+    thread, including request handlers that already run inside another loop.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _event_loop()).result()
+
+
+def get_async_client():
+    """
+    Returns the shared async Firestore client, creating it on first use. Only use it in
+    coroutines executed with run_async.
+    """
+    global async_firestore_client
+    if async_firestore_client is None:
+        # firestore_async pulls in the grpc.aio transport; only load it when needed
+        from firebase_admin import firestore_async
+        _ensure_app()
+        async_firestore_client = firestore_async.client()
+    return async_firestore_client
+
+
+def get_documents(collection_name, document_ids, field_paths=None):
+    """
+    Retrieves many documents of a collection with batched get_all calls (one round-trip
+    per GET_ALL_CHUNK documents) instead of one get per document.
+
+    Args:
+        collection_name (str): The collection.
+        document_ids (list): The document IDs to read.
+        field_paths (list): Optional projection of the returned fields.
+
+    Returns:
+        dict: {document_id: data}, with None for documents that do not exist.
+    """
+    collection_ref = get_client().collection(collection_name)
+    documents = dict.fromkeys(document_ids)
+    ids = list(documents)
+    for i in range(0, len(ids), GET_ALL_CHUNK):
+        refs = [collection_ref.document(document_id) for document_id in ids[i:i + GET_ALL_CHUNK]]
+        for snapshot in get_client().get_all(refs, field_paths=field_paths):
+            if snapshot.exists:
+                documents[snapshot.id] = snapshot.to_dict()
+    return documents
+
+
+async def get_documents_async(collection_name, document_ids, field_paths=None):
+    """Async variant of get_documents on the async client; the chunks are read concurrently."""
+    client = get_async_client()
+    collection_ref = client.collection(collection_name)
+    ids = list(dict.fromkeys(document_ids))
+
+    async def read_chunk(chunk):
+        refs = [collection_ref.document(document_id) for document_id in chunk]
+        return [snapshot async for snapshot in client.get_all(refs, field_paths=field_paths)]
+
+    chunks = await asyncio.gather(*(read_chunk(ids[i:i + GET_ALL_CHUNK]) for i in range(0, len(ids), GET_ALL_CHUNK)))
+    documents = dict.fromkeys(ids)
+    for snapshots in chunks:
+        for snapshot in snapshots:
+            if snapshot.exists:
+                documents[snapshot.id] = snapshot.to_dict()
+    return documents
+
+
+async def gather_bounded(coroutines, concurrency=16):
+    """Awaits the coroutines with at most `concurrency` of them in flight, returning their results in order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(bounded(coroutine) for coroutine in coroutines))
+
+
+def run_transaction(func, *args, **kwargs):
+    """
+    Runs func(transaction, *args, **kwargs) in a Firestore transaction and returns its
+    result. The transaction is retried when it conflicts with a concurrent write, so
+    func must do its reads through the transaction (doc_ref.get(transaction=transaction))
+    before any of its writes and must not have other side effects.
+    """
+    return firestore.transactional(func)(get_client().transaction(), *args, **kwargs)
+
+
+def bulk_write(writes, merge=False):
+    """
+    Writes many independent documents with a BulkWriter, which sends the writes in
+    parallel batches, ramps up the write rate and retries failed writes. Unlike a
+    WriteBatch the writes are not atomic and there is no limit of 500 per call.
+
+    Args:
+        writes (iterable): (DocumentReference, data) pairs.
+        merge (bool): Merge into existing documents instead of replacing them.
+
+    Returns:
+        dict: {document path: error message} of the writes that failed after
+        BULK_WRITE_ATTEMPTS attempts; empty when everything was written.
+    """
+    failures = {}
+
+    def on_error(failure, _):
+        if failure.attempts < BULK_WRITE_ATTEMPTS:
+            return True
+        failures[failure.operation.reference.path] = failure.message
+        return False
+
+    writer = get_client().bulk_writer()
+    writer.on_write_error(on_error)
+    for reference, data in writes:
+        writer.set(reference, data, merge=merge)
+    writer.close()
+    for path, message in failures.items():
+        print(f"Error writing {path}: {message}")
+    return failures
 
 def create_document(collection_name, document_id, data):
     """
     Create a Firestore document with the provided data and cleanup after creation.
     """
     try:
-        doc_ref = firestore_client.collection(collection_name).document(document_id)
+        doc_ref = get_client().collection(collection_name).document(document_id)
         doc_ref.set(data)
         print(f"Document {document_id} created successfully in collection {collection_name}.")
     except Exception as e:
@@ -28,7 +191,7 @@ def update_document(collection_name, document_id, data):
     Update a Firestore collection with the provided data.
     """
     try:
-        doc_ref = firestore_client.collection(collection_name).document(document_id)
+        doc_ref = get_client().collection(collection_name).document(document_id)
         doc_ref.set(data, merge=True)
     except Exception as e:
         print(f"Error updating document {document_id} in collection {collection_name}: {e}")
@@ -43,7 +206,7 @@ def get_collection(collection_name):
     Retrieve all documents from a Firestore collection.
     """
     try:
-        collection_ref = firestore_client.collection(collection_name)
+        collection_ref = get_client().collection(collection_name)
         docs = collection_ref.stream()
         return {doc.id: doc.to_dict() for doc in docs}
     except Exception as e:
@@ -55,7 +218,7 @@ def get_document(collection_name, document_id):
     Retrieve a specific document from a Firestore collection.
     """
     try:
-        doc_ref = firestore_client.collection(collection_name).document(document_id)
+        doc_ref = get_client().collection(collection_name).document(document_id)
         doc = doc_ref.get()
         if doc.exists:
             return doc.to_dict()
@@ -71,7 +234,7 @@ def delete_document(collection_name, document_id):
     Delete a specific document from a Firestore collection.
     """
     try:
-        doc_ref = firestore_client.collection(collection_name).document(document_id)
+        doc_ref = get_client().collection(collection_name).document(document_id)
         doc_ref.delete()
         print(f"Document {document_id} deleted successfully from collection {collection_name}.")
     except Exception as e:
@@ -84,7 +247,7 @@ def delete_collection(collection_name):
     Delete all documents in a Firestore collection.
     """ 
     try:
-        collection_ref = firestore_client.collection(collection_name)
+        collection_ref = get_client().collection(collection_name)
         docs = collection_ref.stream()
         for doc in docs:
             doc.reference.delete()
@@ -0,0 +1,281 @@
+import datetime as dt
+import itertools
+import math
+import pandas as pd
+
+import firestore_util
+from firestore_util import bulk_write, get_document, get_documents, update_document
+from yf_to_firestore import get_data_from_firestore, iter_histories, load_new_bars, read_history
+import signal_engine
+
+STATE_COLLECTION = "signal-state"
+# Strategies with a rolling-state implementation in update_state
+INCREMENTAL_STRATEGIES = ("MovingAverageCrossoverStrategy", "MeanReversionStrategy")
+# Signals older than this are dropped from the persisted state to bound the document size.
+KEEP_SIGNALS_WEEKS = 53
+
+
+def new_state(strategy, symbol, **params):
+    """
+    Creates the empty rolling state of a strategy for one symbol.
+
+    The state keeps the last closes needed for the SMA / Bollinger windows (window sums
+    are recomputed from them with math.fsum, so they never drift), the Wilder RSI
+    accumulators, the current position and the signals of the last KEEP_SIGNALS_WEEKS.
+    """
+    if strategy not in INCREMENTAL_STRATEGIES:
+        raise ValueError(f"Unsupported strategy for incremental evaluation: {strategy}")
+    return {
+        "strategy": strategy,
+        "symbol": symbol,
+        "params": {**signal_engine.STRATEGY_PARAMS[strategy], **params},
+        "origin_date": None,
+        "last_date": None,
+        "bars": 0,
+        "closes": [],
+        "position": False,
+        "prev_close": None,
+        "changes": 0,
+        "seed_up": [],
+        "seed_down": [],
+        "maup": None,
+        "madown": None,
+        "signals": [],
+    }
+
+
+def _window(state):
+    params = state["params"]
+    if state["strategy"] == "MovingAverageCrossoverStrategy":
+        return max(params["short_period"], params["long_period"])
+    return params["boll_period"]
+
+
+def _crossover_decision(state):
+    params = state["params"]
+    closes = state["closes"]
+    if state["bars"] < max(params["short_period"], params["long_period"]):
+        return False, False
+    sma_short = math.fsum(closes[-params["short_period"]:]) / params["short_period"]
+    sma_long = math.fsum(closes[-params["long_period"]:]) / params["long_period"]
+    return sma_short > sma_long, sma_short < sma_long
+
+
+def _update_rsi(state, close):
+    params = state["params"]
+    period = params["rsi_period"]
+    prev_close = state["prev_close"]
+    state["prev_close"] = close
+    if prev_close is None:
+        return
+    up = max(close - prev_close, 0.0)
+    down = max(prev_close - close, 0.0)
+    state["changes"] += 1
+    if state["changes"] <= period:
+        state["seed_up"].append(up)
+        state["seed_down"].append(down)
+        if state["changes"] == period:
+            state["maup"] = math.fsum(state["seed_up"]) / period
+            state["madown"] = math.fsum(state["seed_down"]) / period
+            state["seed_up"], state["seed_down"] = [], []
+        return
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    state["maup"] = state["maup"] * alpha1 + up * alpha
+    state["madown"] = state["madown"] * alpha1 + down * alpha
+
+
+def _mean_reversion_decision(state, close):
+    params = state["params"]
+    if state["bars"] < max(params["boll_period"], params["rsi_period"] + 1):
+        return False, False
+    period = params["boll_period"]
+    closes = state["closes"][-period:]
+    mid = math.fsum(closes) / period
+    mean_sq = math.fsum(value * value for value in closes) / period
+    bot = mid - 2.0 * abs(mean_sq - mid ** 2) ** 0.5
+    maup, madown = state["maup"], state["madown"]
+    if madown:
+        rsi = 100.0 - 100.0 / (1.0 + maup / madown)
+    else:
+        rsi = 100.0 if maup else float("nan")
+    return close <= bot and rsi < params["rsi_lower"], close > mid
+
+
+def update_state(state, date, close):
+    """
+    Advances the state by one bar and returns the signal emitted on it, or None.
+
+    Mirrors the BaseStrategy position handling: BUY when flat and the entry condition
+    holds, SELL when in position and the exit condition holds.
+    """
+    close = float(close)
+    state["closes"].append(close)
+    del state["closes"][:-_window(state)]
+    state["bars"] += 1
+    if state["strategy"] == "MovingAverageCrossoverStrategy":
+        entry, exit = _crossover_decision(state)
+    else:
+        _update_rsi(state, close)
+        entry, exit = _mean_reversion_decision(state, close)
+
+    date = pd.Timestamp(date).strftime('%Y-%m-%d')
+    if state["origin_date"] is None:
+        state["origin_date"] = date
+    state["last_date"] = date
+
+    signal = None
+    if not state["position"] and entry:
+        signal = {"date": date, "signal_type": "BUY", "price": close}
+        state["position"] = True
+    elif state["position"] and exit:
+        signal = {"date": date, "signal_type": "SELL", "price": close}
+        state["position"] = False
+    if signal:
+        state["signals"].append(signal)
+    return signal
+
+
+def _state_id(strategy, symbol):
+    return f"{strategy}_{symbol}"
+
+
+def load_state(strategy, symbol):
+    return get_document(STATE_COLLECTION, _state_id(strategy, symbol))
+
+
+def load_states(strategy, symbols):
+    """{symbol: state or None} of many symbols, read with batched get_all calls."""
+    states = get_documents(STATE_COLLECTION, [_state_id(strategy, symbol) for symbol in symbols])
+    return {symbol: states[_state_id(strategy, symbol)] for symbol in symbols}
+
+
+def _trim_signals(state):
+    last_date = pd.Timestamp(state["last_date"])
+    cutoff = (last_date - dt.timedelta(weeks=KEEP_SIGNALS_WEEKS)).strftime('%Y-%m-%d')
+    state["signals"] = [signal for signal in state["signals"] if signal["date"] >= cutoff]
+    return state
+
+
+def save_state(state):
+    update_document(STATE_COLLECTION, _state_id(state["strategy"], state["symbol"]), _trim_signals(state))
+
+
+def save_states(states):
+    """Saves many states with the bulk writer instead of one write round-trip each."""
+    collection_ref = firestore_util.get_client().collection(STATE_COLLECTION)
+    return bulk_write(((collection_ref.document(_state_id(state["strategy"], state["symbol"])), _trim_signals(state))
+                       for state in states), merge=True)
+
+
+def recent_signals(state, chk_last_weeks=1):
+    """Signals within `chk_last_weeks` of the last bar, None when the state never signalled (like BaseStrategy.stop)."""
+    if not state["signals"]:
+        return None
+    cutoff = (pd.Timestamp(state["last_date"]) - dt.timedelta(weeks=chk_last_weeks)).strftime('%Y-%m-%d')
+    return [signal for signal in state["signals"] if signal["date"] >= cutoff]
+
+
+def _advance_state(symbol, strategy, state, df=None):
+    """
+    Advances a loaded state (or None) with the bars since its last run.
+
+    For an existing state only the bars after its last_date are read. Without a
+    persisted state the full history is read and replayed, which gives the same signals
+    as a full backtest over that history. `df` passes bars the caller already loaded:
+    the new bars of an existing state or the history to bootstrap from.
+
+    Returns:
+        tuple: (state, advanced), state is None without history.
+    """
+    if state is None:
+        if df is None:
+            df = get_data_from_firestore(symbol)
+        if df.empty:
+            return None, False
+        print(f"Bootstrapping {strategy} state for {symbol} from {len(df)} bars")
+        state = new_state(strategy, symbol)
+    else:
+        last_date = pd.Timestamp(state["last_date"])
+        if df is None:
+            df = read_history(symbol, after=last_date)
+        df = df[df.index > last_date]
+
+    for date, close in zip(df.index, df["close"].to_numpy()):
+        update_state(state, date, close)
+    return state, len(df) > 0
+
+
+def evaluate_symbol(symbol, strategy="MovingAverageCrossoverStrategy", chk_last_weeks=1):
+    """
+    Updates the persisted state of a symbol with the bars since its last run and returns
+    its recent signals.
+    """
+    state, advanced = _advance_state(symbol, strategy, load_state(strategy, symbol))
+    if state is None:
+        return None
+    if advanced:
+        save_state(state)
+    return recent_signals(state, chk_last_weeks)
+
+
+def _new_bars_blocks(states, block_size=100):
+    """Yields (symbol, bars after the state's last_date) of the symbols with a state, read in blocks."""
+    symbols = list(states)
+    for i in range(0, len(symbols), block_size):
+        block = symbols[i:i + block_size]
+        try:
+            frames = load_new_bars({symbol: pd.Timestamp(states[symbol]["last_date"]) for symbol in block})
+        except Exception as e:
+            # Fall back to reading the symbols one by one in _advance_state
+            print(f"Error loading the new bars of {len(block)} symbols: {e}")
+            frames = {}
+        for symbol in block:
+            yield symbol, frames.get(symbol)
+
+
+def incremental_scan(tickers, strategy="MovingAverageCrossoverStrategy", chk_last_weeks=1):
+    """
+    Incremental counterpart of the segment scan: {symbol: signals} for every ticker.
+
+    The states of all tickers are read with batched get_all calls up front. Symbols with
+    a state only read their bars after the state's last_date; the full histories are
+    only bulk loaded to bootstrap the symbols without one. The advanced states are
+    saved with one bulk writer at the end.
+    """
+    states = load_states(strategy, tickers)
+    existing = {symbol: state for symbol, state in states.items() if state is not None}
+    bootstrap = [symbol for symbol in tickers if symbol not in existing]
+    all_signals = {}
+    advanced_states = []
+    for symbol, df in itertools.chain(_new_bars_blocks(existing), iter_histories(bootstrap)):
+        try:
+            state, advanced = _advance_state(symbol, strategy, states[symbol], df=df)
+        except Exception as e:
+            print(f"Error processing {symbol}: {e}")
+            continue
+        if advanced:
+            advanced_states.append(_trim_signals(state))
+        all_signals[symbol] = recent_signals(state, chk_last_weeks) if state is not None else None
+    save_states(advanced_states)
+    return {symbol: all_signals[symbol] for symbol in tickers if symbol in all_signals}
+
+
+def verify_symbol(symbol, strategy="MovingAverageCrossoverStrategy"):
+    """
+    Verifies the persisted state against a full recompute with the vectorized engine over
+    the same bars (origin_date to last_date).
+
+    Returns:
+        tuple: (matches, incremental_signals, recomputed_signals)
+    """
+    state = load_state(strategy, symbol)
+    if state is None:
+        return True, None, None
+    df = read_history(symbol, since=pd.Timestamp(state["origin_date"]))
+    df = df[df.index <= pd.Timestamp(state["last_date"])]
+    recomputed = signal_engine.scan([symbol], strategy=strategy, chk_last_weeks=KEEP_SIGNALS_WEEKS,
+                                    frames={symbol: df}, **state["params"]).get(symbol)
+    incremental = recent_signals(state, KEEP_SIGNALS_WEEKS)
+    # A state whose signals all aged out reads as None, the recompute as []
+    return signal_engine.same_signals(incremental or None, recomputed or None), incremental, recomputed
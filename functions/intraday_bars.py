@@ -0,0 +1,295 @@
+import os
+
+import numpy as np
+import pandas as pd
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_util import bulk_write, gather_bounded, get_async_client, get_client, run_async
+from metrics import increment, span
+from ohlcv_cache import COLUMN_DTYPES
+from tickers_util import get_all_tickers
+from yf_to_firestore import get_data, get_data_multi, get_timedelta_from_period
+
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# Intraday bars are stored at this interval only; coarser intervals are resampled on read.
+INTRADAY_BASE_INTERVAL = os.environ.get("INTRADAY_BASE_INTERVAL", "5m")
+# "week": one document per symbol-week under stocks/{symbol}/intraday_{interval}/{monday}
+# "day": one document per symbol-day under stocks/{symbol}/intraday_{interval}/{YYYY-MM-DD}
+# Each document holds columnar arrays, e.g. 75 bars x 5 days of NSE 5m bars in one week document.
+INTRADAY_BUCKET = os.environ.get("INTRADAY_BUCKET", "week")
+# The bars are stored in the wall-clock time of this exchange (NSE), see _local_index
+EXCHANGE_TIMEZONE = os.environ.get("EXCHANGE_TIMEZONE", "Asia/Kolkata")
+
+# How far back Yahoo Finance serves each intraday interval (days)
+YAHOO_MAX_DAYS = {"1m": 7, "2m": 60, "5m": 60, "15m": 60, "30m": 60, "60m": 730, "90m": 60, "1h": 730}
+
+# pandas offsets of the supported intervals
+RESAMPLE_RULES = {"1m": "1min", "2m": "2min", "5m": "5min", "15m": "15min", "30m": "30min",
+                  "60m": "60min", "90m": "90min", "1h": "60min", "2h": "120min", "4h": "240min", "1d": "1D"}
+
+RESAMPLE_AGGREGATION = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+
+def _bucket_id(timestamps):
+    """Bucket document IDs (the first day of the bucket) of a DatetimeIndex."""
+    days = timestamps.normalize()
+    if INTRADAY_BUCKET == "week":
+        days = days - pd.to_timedelta(days.dayofweek, unit="D")
+    return days.strftime('%Y-%m-%d')
+
+
+def _bucket_ref(symbol, interval):
+    return get_client().collection("stocks").document(symbol).collection(f"intraday_{interval}")
+
+
+def _local_index(index):
+    """Exchange wall-clock times without timezone, like the dates of the daily bars."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index
+
+
+def _exchange_now():
+    """The current exchange wall-clock time without timezone, comparable with the stored bars."""
+    return pd.Timestamp.now(tz=EXCHANGE_TIMEZONE).tz_localize(None)
+
+
+def _frame_to_bucket(df, bucket):
+    df = df.sort_index()
+    # Epoch seconds of the exchange wall-clock time: compact and parsed without strings
+    times = df.index.values.astype("datetime64[s]").astype(np.int64)
+    doc = {"bucket": bucket, "t": times.tolist()}
+    for column in BAR_COLUMNS:
+        doc[column] = df[column].astype(float).tolist()
+    doc["last_t"] = int(times[-1])
+    doc["count"] = len(df)
+    return doc
+
+
+def _bucket_to_frame(doc):
+    df = pd.DataFrame({column: doc.get(column, []) for column in BAR_COLUMNS},
+                      index=pd.DatetimeIndex(pd.to_datetime(np.asarray(doc.get("t", []), dtype=np.int64), unit="s"),
+                                             name="Datetime"))
+    return df
+
+
+def _intraday_writes(data, symbol, interval):
+    """
+    Packs intraday bars into one columnar document per bucket, merged into the stored
+    bucket (one read per touched bucket, normally only the current one).
+    """
+    data = data.reindex(columns=BAR_COLUMNS).dropna(subset=["close"])
+    data.index = _local_index(data.index)
+    collection_ref = _bucket_ref(symbol, interval)
+    writes = []
+    for bucket, bars in data.groupby(_bucket_id(data.index)):
+        doc = collection_ref.document(bucket)
+        existing = doc.get()
+        if existing.exists:
+            stored = _bucket_to_frame(existing.to_dict())
+            bars = pd.concat([stored[~stored.index.isin(bars.index)], bars])
+        writes.append((doc, _frame_to_bucket(bars, bucket)))
+    return writes
+
+
+def save_intraday(data, symbol, interval=INTRADAY_BASE_INTERVAL):
+    """
+    Writes intraday bars of a symbol into its bucket documents.
+
+    Raises:
+        RuntimeError: When some buckets could not be written.
+    """
+    print(f"Saving {len(data)} {interval} bars to Firestore for {symbol}...")
+    failures = bulk_write(_intraday_writes(data, symbol, interval))
+    if failures:
+        raise RuntimeError(f"{len(failures)} intraday writes of {symbol} failed")
+
+
+def _last_bucket_query(collection_ref):
+    return collection_ref.order_by("bucket", direction=firestore.Query.DESCENDING).limit(1).select(["last_t"])
+
+
+async def _last_intraday_time_async(symbol, interval):
+    query = _last_bucket_query(get_async_client().collection("stocks").document(symbol)
+                               .collection(f"intraday_{interval}"))
+    async for doc in query.stream():
+        return pd.to_datetime(doc.to_dict()["last_t"], unit="s")
+    return None
+
+
+def get_last_intraday_times(symbols, interval=INTRADAY_BASE_INTERVAL, concurrency=16):
+    """{symbol: time of the newest stored bar or None}, read concurrently on the async client."""
+    times = run_async(gather_bounded((_last_intraday_time_async(symbol, interval) for symbol in symbols),
+                                     concurrency))
+    return dict(zip(symbols, times))
+
+
+def _intraday_start(last_time, interval):
+    """Download start: the day of the last stored bar, bounded by how far back Yahoo serves the interval."""
+    earliest = pd.Timestamp.today().normalize() - pd.Timedelta(days=YAHOO_MAX_DAYS.get(interval, 60) - 1)
+    if last_time is None:
+        return earliest.strftime('%Y-%m-%d')
+    return max(last_time.normalize(), earliest).strftime('%Y-%m-%d')
+
+
+def intraday_to_firestore(symbol, interval=INTRADAY_BASE_INTERVAL):
+    """
+    Fetches the intraday bars of a symbol since its last stored bar from Yahoo Finance
+    and merges them into its bucket documents. The day of the last stored bar is
+    downloaded again, so a partial day is completed.
+    """
+    start = _intraday_start(get_last_intraday_times([symbol], interval)[symbol], interval)
+    end = (pd.Timestamp.today() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    data = get_data(symbol, start=start, end=end, interval=interval)
+    if data is None or data.empty:
+        print(f"No new {interval} bars to save for {symbol}.")
+        return
+    save_intraday(data, symbol, interval)
+
+
+def bulk_intraday_to_firestore(segment, interval=INTRADAY_BASE_INTERVAL, group_size=50, concurrency=16):
+    """
+    Refreshes the intraday bars of all symbols of a segment.
+
+    Like bulk_yf_to_firestore, symbols sharing a download start are fetched in grouped
+    multi-ticker downloads and all bucket writes go through one bulk writer.
+
+    Returns:
+        dict: Summary with the saved and failed symbols.
+    """
+    tickers = get_all_tickers(segment)
+    end = (pd.Timestamp.today() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    groups = {}
+    for symbol, last_time in get_last_intraday_times(tickers, interval, concurrency).items():
+        groups.setdefault(_intraday_start(last_time, interval), []).append(symbol)
+
+    saved = set()
+    downloads = 0
+
+    def download_writes():
+        nonlocal downloads
+        for start, symbols in groups.items():
+            for i in range(0, len(symbols), group_size):
+                chunk = symbols[i:i + group_size]
+                frames = get_data_multi(chunk, start=start, end=end, interval=interval)
+                downloads += 1
+                for symbol in chunk:
+                    if symbol in frames:
+                        yield from _intraday_writes(frames[symbol], symbol, interval)
+                        saved.add(symbol)
+
+    failed = {}
+    for path, message in bulk_write(download_writes()).items():
+        failed.setdefault(path.split("/")[1], message)
+    saved = [symbol for symbol in tickers if symbol in saved and symbol not in failed]
+    print(f"Intraday {interval} ingest of {segment}: {len(saved)} saved with {downloads} downloads")
+    return {"segment": segment, "interval": interval, "saved": saved, "failed": failed, "downloads": downloads}
+
+
+def resample_bars(df, interval):
+    """
+    Resamples OHLCV bars to a coarser interval (first open, max high, min low, last close,
+    summed volume). Bins are anchored at the earliest bar time of day, i.e. the session
+    open, so 1h bins of an exchange opening at 9:15 run 9:15-10:15 like the hourly bars
+    of Yahoo Finance. Daily bins are calendar days labelled at midnight, like the daily
+    bars. Bins without bars (nights, holidays) are dropped.
+    """
+    if df.empty:
+        return df
+    rule = RESAMPLE_RULES[interval]
+    if pd.Timedelta(rule) >= pd.Timedelta(days=1):
+        # pandas ignores (and warns about) an offset for day bins
+        resampled = df.resample(rule, label="left", closed="left").agg(RESAMPLE_AGGREGATION)
+    else:
+        session_open = (df.index - df.index.normalize()).min()
+        resampled = df.resample(rule, label="left", closed="left", origin="start_day",
+                                offset=session_open).agg(RESAMPLE_AGGREGATION)
+    return resampled[resampled["close"].notna()]
+
+
+def _interval_minutes(interval):
+    return pd.Timedelta(RESAMPLE_RULES[interval]).total_seconds() / 60
+
+
+def _bucket_query(symbol, since, client=None):
+    query = (client or get_client()).collection("stocks").document(symbol).collection(f"intraday_{INTRADAY_BASE_INTERVAL}")
+    if since is not None:
+        query = query.where(filter=FieldFilter("bucket", ">=", _bucket_id(pd.DatetimeIndex([since]))[0]))
+    return query.order_by("bucket")
+
+
+def _frames_from_buckets(symbols, buckets, since, interval):
+    """Builds the per-symbol frames from their bucket documents, parsing the times of all symbols at once."""
+    with span("frame_build"):
+        counts = [sum(len(doc["t"]) for doc in docs) for docs in buckets]
+        times = pd.to_datetime(np.fromiter((t for docs in buckets for doc in docs for t in doc["t"]),
+                                           dtype=np.int64, count=sum(counts)), unit="s")
+        values = {column: np.fromiter((value for docs in buckets for doc in docs for value in doc[column]),
+                                      dtype=COLUMN_DTYPES[column], count=sum(counts)) for column in BAR_COLUMNS}
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        frames = {}
+        for i, symbol in enumerate(symbols):
+            df = pd.DataFrame({column: values[column][bounds[i]:bounds[i + 1]] for column in BAR_COLUMNS},
+                              index=pd.DatetimeIndex(times[bounds[i]:bounds[i + 1]], name="Datetime"))
+            if since is not None:
+                df = df[df.index >= since]
+            if interval != INTRADAY_BASE_INTERVAL:
+                df = resample_bars(df, interval)
+            frames[symbol] = df
+    return frames
+
+
+def _check_interval(interval):
+    if interval not in RESAMPLE_RULES:
+        raise ValueError(f"Unsupported interval: {interval}")
+    if _interval_minutes(interval) < _interval_minutes(INTRADAY_BASE_INTERVAL):
+        raise ValueError(f"Interval {interval} is finer than the stored {INTRADAY_BASE_INTERVAL} bars")
+
+
+def get_intraday_from_firestore(symbol, interval="15m", period="30d"):
+    """
+    Reads the stored intraday bars of a symbol, resampled to `interval`.
+
+    Args:
+        symbol (str): The stock symbol.
+        interval (str): Bar interval, the stored INTRADAY_BASE_INTERVAL or coarser (e.g. '15m', '1h').
+        period (str): Period as a string (e.g. '30d', '2w') relative to now.
+
+    Returns:
+        pandas.DataFrame: Datetime index (exchange time) with OHLCV columns.
+
+    Raises:
+        ValueError: For an unsupported interval or one finer than the stored bars.
+    """
+    return load_intraday([symbol], interval=interval, period=period)[symbol]
+
+
+def load_intraday(symbols, interval="15m", period="30d", concurrency=16):
+    """
+    Bulk read of the intraday bars of many symbols, resampled to `interval`. The bucket
+    queries run concurrently on the async client.
+
+    Returns:
+        dict: {symbol: DataFrame} (see get_intraday_from_firestore); symbols without
+        stored bars map to an empty frame.
+    """
+    _check_interval(interval)
+    # The stored times are exchange wall-clock times; the server clock runs on UTC
+    since = _exchange_now() - get_timedelta_from_period(period)
+
+    async def read(symbol):
+        return [doc.to_dict() async for doc in _bucket_query(symbol, since, client=get_async_client()).stream()]
+
+    with span("firestore_read"):
+        buckets = run_async(gather_bounded((read(symbol) for symbol in symbols), concurrency))
+    increment("documents_read", sum(len(docs) for docs in buckets))
+    return _frames_from_buckets(symbols, buckets, since, interval)
+
+
+if __name__ == "__main__":
+    symbol = "ADANIENT.NS"
+    intraday_to_firestore(symbol)
+    print(get_intraday_from_firestore(symbol, interval="1h", period="5d").tail())
@@ -2,13 +2,17 @@
 # To get started, simply uncomment the below code or create your own.
 # Deploy with `firebase deploy`
 
-from firebase_functions import https_fn, firestore_fn    
+from firebase_functions import https_fn, firestore_fn, scheduler_fn
 from firebase_admin import initialize_app, auth, credentials, firestore, get_app
-from flask import Flask, abort, request
+from flask import Flask, Response, abort, request
 import json
 import tickers_util
-import tradesignals
-import back_trade
+import metrics
+
+# tradesignals, back_trade, yf_to_firestore and ohlcv_cache pull in backtrader, yfinance,
+# matplotlib, psutil and the Firestore clients. They are imported inside the routes and
+# triggers that need them, so a cold start serving "/" or "/get-tickers" skips them
+# (see benchmarks/import_profile.py).
 
 # Initialize the Firebase Admin SDK (adjust the credentials as needed)
 try:
@@ -18,10 +22,12 @@ except ValueError:
     initialize_app(cred)
 
 
-from yf_to_firestore import yf_to_firestore
-
 app = Flask(__name__)
 
+# Segment universes are resolved by tickers_util.registry on first use and kept per
+# instance; preloading them here would import yahoo_fin and create the Firestore client
+# on every cold start
+
 def verify_firebase_token(request):
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
@@ -34,6 +40,11 @@ def verify_firebase_token(request):
     except Exception as e:
         abort(401, description=f"Token verification failed: {e}")
 
+@app.errorhandler(tickers_util.UniverseUnavailableError)
+def universe_unavailable(e):
+    # A segment whose source is down and that has no snapshot yet; the scan can be retried later
+    return str(e), 503
+
 @app.route('/')
 def home():
 	return 'Hello from the home page!'
@@ -44,33 +55,83 @@ def about():
 
 @app.route('/tradesignals')  # Original route remains, if needed
 def contact():
+	import tradesignals
 	return tradesignals.main("data/tickers_nse50.txt")
 
 
 @app.route('/tradesignals/getresult/<process_id>')
 def tradesignals_process(process_id):
-    # Call get_backtest_status with the provided process_id
-    status = tradesignals.get_backtest_status(process_id)
+    import tradesignals
+    # ?page_size=N[&page_token=T] returns one page of the results (also while running),
+    # ?format=ndjson streams the status and then one line per symbol
+    if request.args.get("format") == "ndjson":
+        return tradesignals_process_ndjson(process_id)
+    page_size = request.args.get("page_size", type=int)
+    if page_size:
+        try:
+            status = tradesignals.get_result_page(process_id, page_size=min(page_size, 1000),
+                                                  page_token=request.args.get("page_token"))
+        except ValueError as e:
+            return str(e), 400
+    else:
+        # Call get_backtest_status with the provided process_id
+        status = tradesignals.get_backtest_status(process_id)
     if status is None:
         return "Process ID not found", 404
     return status
 
+def tradesignals_process_ndjson(process_id):
+    import tradesignals
+    from result_store import iter_results
+    status = tradesignals.get_backtest_status(process_id, include_result=False)
+    if status is None:
+        return "Process ID not found", 404
+
+    def lines():
+        yield json.dumps(status) + "\n"
+        for symbol, signals in iter_results(process_id):
+            yield json.dumps({"symbol": symbol, "signals": signals}) + "\n"
+    return Response(lines(), mimetype="application/x-ndjson")
+
 @app.route('/get-tickers/<segment>', methods=['GET'])
 def get_tickers(segment):
     # Call get_all_tickers with the provided segment parameter
-    tickers = tickers_util.get_all_tickers(segment)
+    try:
+        tickers = tickers_util.get_all_tickers(segment)
+    except ValueError as e:
+        return str(e), 404
     # Return tickers as JSON if not already a string
     return tickers 
 
+@app.route('/universes', methods=['GET'])
+def universes():
+    # Version (content hash), size and age of the loaded ticker universes
+    return tickers_util.registry.describe()
+
 @app.route('/tradesignals/<segment>', methods=['POST'])
 def tradesignals_segment(segment):
+    import tradesignals
     # Call run_backtests with the provided segment parameter
-    signals = tradesignals.run_backtests(segment)
+    engine = request.args.get("engine", "backtrader")
+    executor = request.args.get("executor", "serial")
+    pool_size = request.args.get("pool_size", type=int)
+    # refresh=1 reruns the scan even when an identical one is cached
+    refresh = request.args.get("refresh", "0") == "1"
+    try:
+        tradesignals.check_run_options(engine, executor)
+    except ValueError as e:
+        return str(e), 400
+    try:
+        signals = tradesignals.run_backtests(segment, engine=engine, executor=executor, pool_size=pool_size,
+                                             refresh=refresh)
+    except ValueError as e:
+        return str(e), 404
     # Return signals as JSON if not already a string
     return signals 
 
 @app.route('/tradesignal-single/<symbol>', methods=['POST'])
 def tradesignal_single(symbol):
+    import tradesignals
     # Call run_backtests with the provided symbol parameter
     signals = tradesignals.run_backtests(symbol, single=True)
     # Return signals as JSON if not already a string
@@ -78,14 +139,79 @@ def tradesignal_single(symbol):
 
 @app.route('/savedata-single/<symbol>', methods=['POST'])
 def savedata_single(symbol):
+    from yf_to_firestore import yf_to_firestore
     # Call yf_to_firestore with the provided symbol parameter
     yf_to_firestore(symbol)
     # Return a success message
     return {"message": f"Data for {symbol} saved to Firestore."}
 
+@app.route('/savedata/<segment>', methods=['POST'])
+def savedata_segment(segment):
+    from yf_to_firestore import bulk_yf_to_firestore
+    # Refresh all stale symbols of the segment in grouped downloads; an interrupted refresh
+    # of today resumes from its checkpoint unless ?resume=false
+    try:
+        return bulk_yf_to_firestore(segment, resume=request.args.get("resume", "true").lower() != "false")
+    except ValueError as e:
+        return str(e), 404
+
+@app.route('/saveintraday/<segment>', methods=['POST'])
+def saveintraday_segment(segment):
+    from intraday_bars import bulk_intraday_to_firestore
+    # Refresh the intraday bars (stored at INTRADAY_BASE_INTERVAL) of all symbols of the segment
+    try:
+        return bulk_intraday_to_firestore(segment)
+    except ValueError as e:
+        return str(e), 404
+
+@app.route('/intraday-signals/<segment>', methods=['POST'])
+def intraday_signals(segment):
+    import signal_engine
+    # ?interval=15m|30m|1h resamples the stored bars on read, ?period=30d bounds the history
+    interval = request.args.get("interval", "15m")
+    period = request.args.get("period", "30d")
+    try:
+        signals = signal_engine.scan_intraday(tickers_util.get_all_tickers(segment), interval=interval, period=period)
+    except ValueError as e:
+        return str(e), 404
+    return {symbol: {strategy: result for strategy, result in by_strategy.items() if result}
+            for symbol, by_strategy in signals.items() if any(by_strategy.values())}
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    import ohlcv_cache
+    # Hit/miss counters of the local OHLCV cache in this instance
+    return ohlcv_cache.cache.stats()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_summary():
+    # Stage latency histograms and counters of this instance since it started
+    return metrics.metrics.summary()
+
 @app.route('/backtrade/<symbol>', methods=['POST'])
 def backtrade(symbol):
-    return back_trade.backtest(symbol)
+    import back_trade
+    # The plot is rendered by on_plot_requested; plot=0 skips it
+    plot = request.args.get("plot", "1") == "1"
+    return back_trade.backtest(symbol, plot=plot)
+
+@app.route('/portfolio-backtest/<segment>', methods=['POST'])
+def portfolio_backtest(segment):
+    import back_trade
+    # All symbols of the segment trade from one account; ?strategy, ?period and ?max_positions tune the run
+    strategy = request.args.get("strategy", "MovingAverageCrossoverStrategy")
+    period = request.args.get("period", "5y")
+    try:
+        max_positions = int(request.args.get("max_positions", back_trade.PORTFOLIO_MAX_POSITIONS))
+    except ValueError:
+        max_positions = 0
+    if max_positions < 1:
+        return "max_positions must be an integer of at least 1", 400
+    try:
+        return back_trade.portfolio_backtest(tickers_util.get_all_tickers(segment), strategy=strategy,
+                                             period=period, max_positions=max_positions)
+    except ValueError as e:
+        return str(e), 404
 
 
 @https_fn.on_request(
@@ -109,5 +235,49 @@ def on_process_list_created(event: firestore_fn.Event[firestore.DocumentSnapshot
     print(f"New process started with ID: {process_id}")
     print(f"Process data: {data}")
     
-    tradesignals.async_backtest(data["segment_or_symbol"], process_id, data["single"])
-    # You can also update the document or perform other actions as needed
\ No newline at end of file
+    import tradesignals
+    tradesignals.async_backtest(data["segment_or_symbol"], process_id, data["single"],
+                                engine=data.get("engine", "backtrader"),
+                                executor=data.get("executor", "serial"),
+                                pool_size=data.get("poolSize"))
+    # You can also update the document or perform other actions as needed
+
+@firestore_fn.on_document_created(document="process-list/{process_id}/shards/{shard_id}", timeout_sec=540, memory=2048)
+def on_shard_created(event: firestore_fn.Event[firestore.DocumentSnapshot]) -> None:
+    """
+    Triggered for every shard of a sharded scan (executor=sharded); the last shard to
+    finish merges all shard results into the parent process-list document.
+    """
+    process_id = event.params["process_id"]
+    shard_id = event.params["shard_id"]
+    print(f"Running shard {shard_id} of process {process_id}")
+    import tradesignals
+    tradesignals.run_shard(process_id, shard_id)
+
+@firestore_fn.on_document_written(document="plot-requests/{request_id}", timeout_sec=300, memory=1024)
+def on_plot_requested(event: firestore_fn.Event[firestore_fn.Change[firestore.DocumentSnapshot]]) -> None:
+    """
+    Renders the plot requested by /backtrade/<symbol> and uploads it to Cloud Storage.
+    The request returns before the plot exists; rendering on a thread of that instance
+    would run on the throttled CPU after the response, so it gets its own invocation.
+    Runs whenever a request turns pending, i.e. when it is created or retried.
+    """
+    before = event.data.before.to_dict() if event.data.before is not None else None
+    after = event.data.after.to_dict() if event.data.after is not None else None
+    if after is None or after.get("status") != "pending":
+        return
+    if before is not None and before.get("status") == "pending" and before.get("attempts") == after.get("attempts"):
+        return
+    print(f"Rendering plot {after['path']} (attempt {after.get('attempts', 1)})")
+    import back_trade
+    back_trade.render_plot(after["symbol"], after["path"])
+
+@scheduler_fn.on_schedule(schedule="every 10 minutes", timeout_sec=540, memory=2048)
+def redrive_shards(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Runs the shards of sharded scans whose trigger never fired or whose worker crashed,
+    so those scans still complete (see tradesignals.redrive_stale_shards).
+    """
+    import tradesignals
+    redriven = tradesignals.redrive_stale_jobs()
+    print(f"Re-drove {redriven} stale shards")
\ No newline at end of file
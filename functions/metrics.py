@@ -0,0 +1,163 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with count, sum and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for i, count in enumerate(other["buckets"].values()):
+            self.counts[i] += count
+        self.count += other["count"]
+        self.total += other["totalSeconds"]
+        self.max = max(self.max, other["maxSeconds"])
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at the observed max)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        labels = [f"le_{bound:g}" for bound in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "totalSeconds": round(self.total, 6),
+            "meanSeconds": round(self.total / self.count, 6) if self.count else None,
+            "maxSeconds": round(self.max, 6),
+            "p50Seconds": self.quantile(0.5),
+            "p90Seconds": self.quantile(0.9),
+            "p99Seconds": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe set of named counters and latency histograms.
+
+    One module-level instance aggregates everything this process has done since it
+    started (served by the /metrics endpoint); a separate instance is created per
+    backtest run and written as a summary into its process-list document.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def merge(self, summary):
+        """Adds the counters and histograms of another instance's summary (e.g. from a worker process)."""
+        with self._lock:
+            for name, value in summary.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in summary.get("stages", {}).items():
+                self.histograms.setdefault(name, Histogram()).merge(histogram)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "uptimeSeconds": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "stages": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+
+metrics = Metrics()
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+
+
+def increment(name, value=1):
+    """Increments a counter of the process and of the current run."""
+    metrics.increment(name, value)
+    run = _current_run.get()
+    if run is not None:
+        run.increment(name, value)
+
+
+def observe(name, seconds):
+    """Records a stage duration in the process and the current run histograms."""
+    metrics.observe(name, seconds)
+    run = _current_run.get()
+    if run is not None:
+        run.observe(name, seconds)
+
+
+def merge(summary):
+    """Adds a summary collected in another process (e.g. a pool worker) to the process and the current run."""
+    metrics.merge(summary)
+    run = _current_run.get()
+    if run is not None:
+        run.merge(summary)
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as stage `name`.
+
+    Example:
+        with span("cerebro_run"):
+            results = cerebro.run()
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def run_metrics():
+    """
+    Collects the spans and counters recorded in the enclosed block (in this thread or
+    context) into a fresh Metrics instance, in addition to the process totals.
+
+    Example:
+        with run_metrics() as run:
+            ...
+        update_document("process-list", process_id, {"metrics": run.summary()})
+    """
+    run = Metrics()
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
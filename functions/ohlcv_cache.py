@@ -0,0 +1,270 @@
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# Cloud Functions only allow writes below /tmp
+CACHE_DIR = os.environ.get("OHLCV_CACHE_DIR", "/tmp/ohlcv_cache")
+CACHE_MAX_MB = float(os.environ.get("OHLCV_CACHE_MAX_MB", "256"))
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+# Prices are kept in float64 by default. BAR_PRICE_DTYPE=float32 halves the memory of the
+# bars but keeps only ~7 significant digits, so prices like 2911.71 come back as
+# 2911.7099609375 and the indicators drift slightly; volume always stays float64 since
+# float32 is only exact up to 16.7M.
+PRICE_DTYPE = np.dtype(os.environ.get("BAR_PRICE_DTYPE", "float64"))
+COLUMN_DTYPES = {"open": PRICE_DTYPE, "high": PRICE_DTYPE, "low": PRICE_DTYPE, "close": PRICE_DTYPE,
+                 "volume": np.dtype("f8")}
+BAR_DTYPE = np.dtype([("Date", "datetime64[D]")] + [(column, COLUMN_DTYPES[column]) for column in COLUMNS])
+
+
+class OHLCVCache:
+    """
+    On-disk columnar cache of daily bars keyed by symbol.
+
+    Every symbol is stored as one structured .npy file that is memory-mapped on read.
+    An index file keeps the freshness watermark of each symbol (last cached bar and the
+    day the cache was last checked against Firestore) and its last access time, which
+    drives the size-bounded LRU eviction.
+
+    The cache directory is shared by the worker processes of an instance (see
+    tradesignals' process pool). Every change of the index runs under an exclusive
+    file lock on index.lock and re-reads the index from disk first, so processes never
+    overwrite each other's entries; readers pick up the entries of other processes
+    when the index file changes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock_path = os.path.join(cache_dir, "index.lock")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Reentrant: load() refreshes the index while holding it
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = {}
+        self._index_mtime = None
+        self._refresh()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _index_stamp(self):
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _merge_index(self, stored):
+        """Adopts the index on disk, keeping the newer access times recorded by this process."""
+        for symbol, entry in stored.items():
+            local = self._index.get(symbol)
+            if local is not None and local.get("accessed", 0) > entry.get("accessed", 0):
+                entry["accessed"] = local["accessed"]
+        self._index = stored
+
+    def _refresh(self):
+        # Picks up the changes of other processes; the index file is replaced atomically
+        with self._lock:
+            stamp = self._index_stamp()
+            if stamp != self._index_mtime:
+                self._merge_index(self._load_index())
+                self._index_mtime = stamp
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._index, file)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = self._index_stamp()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Read-modify-write of the index across threads and processes: holds the thread
+        lock and the file lock, re-reads the index from disk and saves it on success.
+        """
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._merge_index(self._load_index())
+                yield
+                self._save_index()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, symbol):
+        return os.path.join(self.cache_dir, f"{symbol}.npy")
+
+    def watermark(self, symbol):
+        """Returns the last cached bar date of the symbol as a Timestamp, or None."""
+        self._refresh()
+        entry = self._index.get(symbol)
+        if entry is None:
+            return None
+        return pd.Timestamp(entry["last_date"])
+
+    def is_fresh(self, symbol):
+        """
+        A symbol is fresh when its last bar reaches the last working day, or when it was
+        already checked against Firestore today (covers exchange holidays).
+        """
+        entry = self._index.get(symbol)
+        if entry is None:
+            return False
+        last_working_day = (pd.Timestamp.today() - pd.tseries.offsets.BDay(1)).normalize()
+        if pd.Timestamp(entry["last_date"]) >= last_working_day:
+            return True
+        return entry.get("checked_on") == pd.Timestamp.today().strftime("%Y-%m-%d")
+
+    def load(self, symbol):
+        """
+        Returns the cached bars as a DataFrame (Date index, OHLCV columns) or None.
+        Counts a hit only when the entry is also fresh.
+        """
+        with self._lock:
+            self._refresh()
+            df = self._read(symbol)
+            if df is not None and self.is_fresh(symbol):
+                self.hits += 1
+            else:
+                self.misses += 1
+            return df
+
+    def _read(self, symbol):
+        entry = self._index.get(symbol)
+        if entry is None or not os.path.exists(self._path(symbol)):
+            self._index.pop(symbol, None)
+            return None
+        bars = np.load(self._path(symbol), mmap_mode="r")
+        if bars.dtype["close"].itemsize < PRICE_DTYPE.itemsize:
+            # Written in float32 before; upcasting would not restore the lost digits
+            self._index.pop(symbol, None)
+            return None
+        entry["accessed"] = time.time()
+        return _to_frame(bars)
+
+    def covers(self, symbol, since):
+        """True when the cached bars of the symbol reach back to `since` (None means full history)."""
+        self._refresh()
+        entry = self._index.get(symbol)
+        if entry is None:
+            return False
+        cached_since = entry.get("since")
+        if cached_since is None:
+            return True
+        return since is not None and pd.Timestamp(since) >= pd.Timestamp(cached_since)
+
+    def store(self, symbol, df, since=None):
+        """
+        Replaces the cached bars of the symbol with `df` and marks it checked today.
+        `since` records how far back the bars were requested (None for the full history).
+        """
+        bars = _to_bars(df)
+        # The file is written under the lock too, so eviction never sees it without its entry
+        with self._transaction():
+            path = self._path(symbol)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, bars)
+            os.replace(tmp_path, path)
+            self._index[symbol] = {
+                "last_date": str(bars["Date"][-1]) if len(bars) else "1970-01-01",
+                "since": pd.Timestamp(since).strftime("%Y-%m-%d") if since is not None else None,
+                "checked_on": pd.Timestamp.today().strftime("%Y-%m-%d"),
+                "accessed": time.time(),
+                "bytes": os.path.getsize(path),
+            }
+            self._evict()
+
+    def append(self, symbol, df):
+        """Appends newer bars to the cached history, replacing overlapping dates. Returns the merged bars."""
+        with self._lock:
+            cached = self._read(symbol)
+            since = self._index.get(symbol, {}).get("since")
+        if cached is not None and not df.empty:
+            df = pd.concat([cached[cached.index < df.index.min()], df])
+        elif cached is not None:
+            df = cached
+        self.store(symbol, df, since=since)
+        return df
+
+    def mark_stale(self, symbol):
+        """Forces the next read of the symbol to check Firestore for bars after the watermark."""
+        with self._transaction():
+            entry = self._index.get(symbol)
+            if entry is not None:
+                entry["checked_on"] = None
+
+    def invalidate(self, symbol=None):
+        """Drops one symbol, or the whole cache when no symbol is given."""
+        with self._transaction():
+            symbols = [symbol] if symbol else list(self._index)
+            for name in symbols:
+                self._index.pop(name, None)
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    def _evict(self):
+        # Files without an index entry (e.g. left by a crashed process) are not counted; drop them
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy") and ".tmp" not in name and name[:-4] not in self._index:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        total = sum(entry["bytes"] for entry in self._index.values())
+        for symbol, entry in sorted(self._index.items(), key=lambda item: item[1]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["bytes"]
+            del self._index[symbol]
+            try:
+                os.remove(self._path(symbol))
+            except OSError:
+                pass
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters and current size of the cache."""
+        self._refresh()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "symbols": len(self._index),
+            "bytes": sum(entry["bytes"] for entry in self._index.values()),
+        }
+
+
+def _to_bars(df):
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars["Date"] = pd.DatetimeIndex(df.index).values.astype("datetime64[D]")
+    for column in COLUMNS:
+        bars[column] = df[column].to_numpy(dtype=COLUMN_DTYPES[column]) if column in df else np.nan
+    return bars
+
+
+def _to_frame(bars):
+    # Files written with float64 prices are narrowed for BAR_PRICE_DTYPE=float32; astype copies only then
+    df = pd.DataFrame({column: np.asarray(bars[column]).astype(COLUMN_DTYPES[column], copy=False)
+                       for column in COLUMNS},
+                      index=pd.DatetimeIndex(np.asarray(bars["Date"]).astype("datetime64[ns]"), name="Date"))
+    return df
+
+
+cache = OHLCVCache()
@@ -0,0 +1,182 @@
+import itertools
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import signal_engine
+
+# Parameter grids swept by default, one list of candidate values per strategy param.
+DEFAULT_GRIDS = {
+    "MovingAverageCrossoverStrategy": {
+        "short_period": [10, 20, 30, 50, 75, 100],
+        "long_period": [100, 150, 200, 250],
+    },
+    "MeanReversionStrategy": {
+        "boll_period": [10, 15, 20, 30],
+        "rsi_period": [7, 10, 14, 21],
+        "rsi_lower": [20, 25, 30, 35],
+        "rsi_upper": [70],
+    },
+}
+
+
+def parameter_sets(strategy, grid=None, sample=None, seed=0):
+    """
+    Expands a parameter grid into a list of parameter dicts.
+
+    Args:
+        strategy (str): Strategy name in signal_engine.STRATEGY_PARAMS.
+        grid (dict): {param: [values]}; defaults to DEFAULT_GRIDS[strategy].
+        sample (int): When given, a random sample of this many sets is drawn from the grid.
+        seed (int): Seed of the random sample.
+    """
+    grid = grid or DEFAULT_GRIDS[strategy]
+    names = list(grid)
+    sets = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if strategy == "MovingAverageCrossoverStrategy":
+        sets = [params for params in sets
+                if params.get("short_period", 50) < params.get("long_period", 200)]
+    if sample is not None and sample < len(sets):
+        sets = random.Random(seed).sample(sets, sample)
+    return sets
+
+
+def simulate(panel, entry, exit, start, stake=10, cash=100000.0, commission=0.001):
+    """
+    Broker simulation matching back_trade.backtest, vectorized over the symbols: the
+    long-only state machine of BaseStrategy places market orders of a fixed stake that
+    fill at the next bar's open with a commission on the traded value, equity marked to
+    the close. Each symbol trades its own `cash`.
+
+    Like backtrader's broker a buy is rejected when the cash does not cover it, either at
+    the close of the signal bar (the submit check) or at the fill price; the strategy
+    then stays flat and buys again on its next entry bar.
+
+    Args:
+        panel (dict): signal_engine panel.
+        entry, exit (numpy.ndarray): (bars, symbols) conditions of the strategy.
+        start (numpy.ndarray): First bar of each symbol the strategy acts on.
+
+    Returns:
+        tuple: (pnl, max_drawdown, trades) arrays with one value per symbol.
+    """
+    open_, close = panel["open"], panel["close"]
+    n_bars, n_symbols = entry.shape
+    balance = np.full(n_symbols, float(cash))
+    position = np.zeros(n_symbols)
+    trades = np.zeros(n_symbols, dtype=np.int64)
+    buy = np.zeros(n_symbols, dtype=bool)
+    sell = np.zeros(n_symbols, dtype=bool)
+    equity = np.empty((n_bars, n_symbols))
+    with np.errstate(invalid="ignore"):
+        for t in range(n_bars):
+            if t > 0:
+                cost = stake * open_[t] * (1 + commission)
+                filled = buy & (balance - stake * close[t - 1] * (1 + commission) >= 0) & (balance - cost >= 0)
+                balance = np.where(filled, balance - cost, balance)
+                position = np.where(filled, stake, position)
+                trades += filled
+                balance = np.where(sell, balance + position * open_[t] * (1 - commission), balance)
+                position = np.where(sell, 0.0, position)
+            active = start <= t
+            buy = active & (position == 0) & entry[t]
+            sell = active & (position != 0) & exit[t]
+            equity[t] = balance + np.where(position != 0, position * close[t], 0.0)
+    peak = np.fmax.accumulate(equity, axis=0)
+    drawdown = np.nanmax((peak - equity) / peak, axis=0)
+    pnl = equity[-1] - cash
+    return pnl, drawdown, trades
+
+
+def _sweep_worker(panel, strategy, sets, stake, cash, commission):
+    """
+    Pool worker: evaluates every parameter set on its share of the symbols. Indicators are
+    shared across sets through one cache, so each (type, period) is computed once.
+    """
+    indicators = {}
+    conditions = signal_engine.CONDITIONS[strategy]
+    rows = []
+    for params in sets:
+        entry, exit, start = conditions(panel, indicators=indicators, **params)
+        rows.append(simulate(panel, entry, exit, start, stake=stake, cash=cash, commission=commission))
+    return rows
+
+
+def _subpanel(panel, cols):
+    sub = {key: value[:, cols] for key, value in panel.items() if key not in ("symbols", "lengths")}
+    sub["symbols"] = [panel["symbols"][col] for col in cols]
+    sub["lengths"] = panel["lengths"][cols]
+    return sub
+
+
+def sweep(tickers, strategy="MovingAverageCrossoverStrategy", grid=None, sample=None, seed=0,
+          frames=None, period="1y", workers=None, stake=10, cash=100000.0, commission=0.001):
+    """
+    Parameter sweep over a ticker list.
+
+    The data is loaded once into a signal_engine panel and split by symbol across a pool
+    of worker processes; every worker evaluates all parameter sets on its symbols. With
+    a single worker the sweep runs in this process.
+
+    Args:
+        tickers (list): The stock symbols.
+        strategy (str): Strategy name in signal_engine.STRATEGY_PARAMS.
+        grid (dict): {param: [values]} to sweep; defaults to DEFAULT_GRIDS[strategy].
+        sample (int): Evaluate a random sample of this many parameter sets.
+        seed (int): Seed of the random sample.
+        frames (dict): Optional preloaded {symbol: DataFrame}.
+        period (str): History period when loading from Firestore.
+        workers (int): Worker processes, defaults to the CPU count.
+        stake, cash, commission: Broker settings, as in back_trade.backtest.
+
+    Returns:
+        pandas.DataFrame: One row per parameter set ranked by total P&L, with the
+        drawdown and trade count over all tickers.
+    """
+    sets = parameter_sets(strategy, grid, sample=sample, seed=seed)
+    panel = signal_engine.load_panel(tickers, frames=frames, period=period)
+    n_symbols = len(panel["symbols"])
+    if not sets or not n_symbols:
+        return pd.DataFrame()
+
+    workers = max(1, min(workers or os.cpu_count() or 1, n_symbols))
+    shards = [list(range(i, n_symbols, workers)) for i in range(workers)]
+    print(f"Sweeping {len(sets)} parameter sets of {strategy} over {n_symbols} symbols on {workers} workers")
+
+    if workers == 1:
+        shard_rows = [_sweep_worker(panel, strategy, sets, stake, cash, commission)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(_sweep_worker, _subpanel(panel, cols), strategy, sets, stake, cash, commission)
+                       for cols in shards]
+            shard_rows = [future.result() for future in futures]
+
+    rows = []
+    for i, params in enumerate(sets):
+        pnl = np.concatenate([rows_[i][0] for rows_ in shard_rows])
+        drawdown = np.concatenate([rows_[i][1] for rows_ in shard_rows])
+        trades = np.concatenate([rows_[i][2] for rows_ in shard_rows])
+        rows.append({
+            **params,
+            "profit_loss": float(np.nansum(pnl)),
+            "profitable_symbols": int((pnl > 0).sum()),
+            "avg_max_drawdown": float(np.nanmean(drawdown)),
+            "worst_max_drawdown": float(np.nanmax(drawdown)),
+            "trades": int(trades.sum()),
+        })
+    table = pd.DataFrame(rows).sort_values("profit_loss", ascending=False, ignore_index=True)
+    table.insert(0, "rank", range(1, len(table) + 1))
+    return table
+
+
+if __name__ == "__main__":
+    from back_trade import load_tickers, get_data
+
+    tickers = load_tickers("data/tickers_backtest.txt")
+    frames = {symbol: get_data(symbol) for symbol in tickers}
+    print(sweep(tickers, frames=frames).head(20).to_string())
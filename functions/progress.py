@@ -0,0 +1,87 @@
+import math
+import threading
+import time
+
+from firestore_util import update_document
+
+
+class ProgressReporter:
+    """
+    Write-behind progress of a run in its process-list document.
+
+    update() only records the counts in memory. A background thread coalesces them and
+    flushes a single merge write (no read) at most every `min_interval` seconds and only
+    after the run advanced by at least 1/max_updates of the symbols, so a run costs at
+    most max_updates progress writes whatever the universe size.
+
+    Without a process_id the progress is only printed.
+
+    Example:
+        with ProgressReporter(process_id, len(tickers)) as progress:
+            for symbol in tickers:
+                ...
+                progress.update(completed, failed)
+    """
+
+    def __init__(self, process_id, total, min_interval=5.0, max_updates=20, collection="process-list"):
+        self.process_id = process_id
+        self.total = total
+        self.min_interval = min_interval
+        self.step = max(1, math.ceil(total / max_updates))
+        self.collection = collection
+        self.completed = 0
+        self.failed = 0
+        self.writes = 0
+        self._flushed = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def update(self, completed, failed=0):
+        """Records the number of finished symbols (including failed ones); never blocks on Firestore."""
+        with self._lock:
+            self.completed = completed
+            self.failed = failed
+
+    def snapshot(self):
+        """The progress fields: percent, status, throughput in symbols/s and ETA in seconds."""
+        with self._lock:
+            completed, failed = self.completed, self.failed
+        elapsed = time.perf_counter() - self._started
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - completed
+        return {
+            "completionPercent": int((completed / self.total) * 100) if self.total else 100,
+            "completionStatus": f"In progress {completed}/{self.total}",
+            "failedCount": failed,
+            "symbolsPerSecond": round(rate, 2),
+            "etaSeconds": round(remaining / rate, 1) if rate else None,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.min_interval):
+            with self._lock:
+                due = self.completed - self._flushed >= self.step and self.completed < self.total
+            if due:
+                self.flush()
+
+    def flush(self):
+        """Writes the current progress as one merge write."""
+        content = self.snapshot()
+        with self._lock:
+            self._flushed = self.completed
+        if self.process_id:
+            update_document(self.collection, self.process_id, content)
+            self.writes += 1
+        print(f"Progress: {content['completionPercent']}% ({content['completionStatus']}), "
+              f"{content['symbolsPerSecond']} symbols/s, ETA {content['etaSeconds']} s, Process ID: {self.process_id}")
@@ -0,0 +1,136 @@
+import datetime
+import hashlib
+import json
+
+import pandas as pd
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import firestore_util
+from tickers_util import universe_version
+from firestore_util import run_transaction, update_document
+
+RESULT_COLLECTION = "scan-results"
+DEFAULT_STRATEGY = "MovingAverageCrossoverStrategy"
+# An in-flight run older than this is assumed dead (the trigger times out after 540 s).
+INFLIGHT_TIMEOUT = datetime.timedelta(minutes=30)
+# A claimed key whose process-list document does not exist yet (the claiming request
+# creates it right after the claim) is reused for this long.
+CLAIM_GRACE = datetime.timedelta(minutes=1)
+
+
+def data_watermark():
+    """The last trading bar a scan started now is computed on (the last working day)."""
+    return (pd.Timestamp.today() - pd.tseries.offsets.BDay(1)).strftime('%Y-%m-%d')
+
+
+def result_key(segment, single=False, engine="backtrader", strategy=DEFAULT_STRATEGY, params=None, watermark=None):
+    """
+    Builds the cache key of a scan: (segment, strategy, parameters, data watermark).
+    Segment scans also key on the universe version, so a changed constituent list
+    starts a new scan.
+
+    The executor and pool size only change how a scan runs, not its result, so they
+    are not part of the key.
+
+    Returns:
+        tuple: (document id, key fields)
+    """
+    # signal_engine imports yf_to_firestore, which invalidates through this module
+    import signal_engine
+    fields = {
+        "segment": segment,
+        "single": single,
+        "engine": engine,
+        "strategy": strategy,
+        "params": {**signal_engine.STRATEGY_PARAMS.get(strategy, {}), **(params or {}),
+                   "chk_last_weeks": 53 if single else 1},
+        "watermark": watermark or data_watermark(),
+        "universe": None if single else universe_version(segment),
+    }
+    digest = hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{segment}_{fields['watermark']}_{digest}", fields
+
+
+def _reusable(entry, status):
+    """
+    A cached run is reused while it is valid and either completed or still in flight.
+
+    Args:
+        entry (dict): The cache entry, None when there is none.
+        status (dict): The process-list document of its run, None when it does not exist.
+    """
+    if entry is None or entry.get("invalidated"):
+        return False
+    if status is None:
+        # Claimed, but the claiming request has not created its run yet
+        created = datetime.datetime.fromisoformat(entry["createdAt"])
+        return datetime.datetime.now() - created < CLAIM_GRACE
+    completion = status.get("completionStatus", "")
+    if completion.startswith("Error"):
+        return False
+    if status.get("completionPercent") == 100:
+        return True
+    started = datetime.datetime.fromisoformat(status["startTime"])
+    return datetime.datetime.now() - started < INFLIGHT_TIMEOUT
+
+
+def lookup_or_claim(key, fields, new_process_id, refresh=False):
+    """
+    Returns the process ID of a reusable run with this key, or claims the key for
+    `new_process_id` (always when `refresh` is set).
+
+    The reads of the entry and of its run's status, the check and the claim run in one
+    transaction, so of several concurrent identical requests only one claims the key
+    and the others attach to its run (a fresh claim counts as in flight, see
+    CLAIM_GRACE), and a run that fails meanwhile is not attached to.
+
+    Returns:
+        tuple: (process_id, reused)
+    """
+    client = firestore_util.get_client()
+    doc_ref = client.collection(RESULT_COLLECTION).document(key)
+    entry = {**fields, "processId": new_process_id, "invalidated": False,
+             "createdAt": datetime.datetime.now().isoformat()}
+
+    def claim(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        existing = snapshot.to_dict() if snapshot.exists and not refresh else None
+        status = None
+        if existing is not None and not existing.get("invalidated"):
+            status = client.collection("process-list").document(existing["processId"]).get(transaction=transaction)
+            status = status.to_dict() if status.exists else None
+        if _reusable(existing, status):
+            return existing["processId"], True
+        transaction.set(doc_ref, entry)
+        return new_process_id, False
+
+    process_id, reused = run_transaction(claim)
+    if reused:
+        print(f"Reusing scan {process_id} for {key}")
+    return process_id, reused
+
+
+def invalidate_results(watermark=None):
+    """
+    Invalidates the cached scans, e.g. after new bars were ingested, so the next
+    identical request runs again. The watermark of a key is a calendar date, not the
+    last stored bar, so by default every live entry is invalidated: a refresh later on
+    the same day (or one that stored a bar past the watermark) must not leave a scan on
+    the old bars in place.
+
+    Args:
+        watermark (str): Only invalidate the scans keyed on this watermark.
+
+    Returns:
+        int: The number of invalidated entries.
+    """
+    query = firestore_util.get_client().collection(RESULT_COLLECTION).where(filter=FieldFilter("invalidated", "==", False))
+    if watermark:
+        query = query.where(filter=FieldFilter("watermark", "==", watermark))
+    invalidated = 0
+    for doc in query.stream():
+        update_document(RESULT_COLLECTION, doc.id, {"invalidated": True})
+        invalidated += 1
+    if invalidated:
+        print(f"Invalidated {invalidated} cached scans" + (f" on {watermark}" if watermark else ""))
+    return invalidated
@@ -0,0 +1,125 @@
+import base64
+import datetime
+import time
+
+from firebase_admin import firestore
+
+import firestore_util
+
+RESULTS_SUBCOLLECTION = "results"
+
+
+def _results_ref(process_id):
+    return firestore_util.get_client().collection("process-list").document(process_id).collection(RESULTS_SUBCOLLECTION)
+
+
+class ResultWriter:
+    """
+    Appends the per-symbol results of a run to process-list/{process_id}/results as the
+    symbols complete, so clients can read partial results while the scan is running
+    and large results never hit the 1 MB limit of the parent document.
+
+    Results are buffered and committed in batches of `batch_size` or after `max_delay`
+    seconds, whichever comes first. Every document gets the server commit time, which
+    orders the results for pagination (see read_results). Symbols without signals are
+    skipped, like in the "result" map. Without a process_id nothing is written.
+
+    Example:
+        with ResultWriter(process_id) as writer:
+            for symbol in tickers:
+                writer.add(symbol, backtest(symbol))
+        update_document("process-list", process_id, {"resultCount": writer.count})
+    """
+
+    def __init__(self, process_id, batch_size=50, max_delay=2.0):
+        self.process_id = process_id
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.count = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def add(self, symbol, signals):
+        if not signals:
+            return
+        self._pending.append((symbol, signals))
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.max_delay:
+            self.flush()
+
+    def add_all(self, results):
+        for symbol, signals in results.items():
+            self.add(symbol, signals)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending or not self.process_id:
+            self._pending = []
+            return
+        batch = firestore_util.get_client().batch()
+        for symbol, signals in self._pending:
+            batch.set(_results_ref(self.process_id).document(symbol), {
+                "symbol": symbol,
+                "signals": signals,
+                "committedAt": firestore.SERVER_TIMESTAMP
+            })
+        batch.commit()
+        self.count += len(self._pending)
+        self._pending = []
+
+
+def _encode_token(doc):
+    # URL safe, the token is passed back as a query parameter
+    return base64.urlsafe_b64encode(f"{doc['committedAt'].isoformat()}|{doc['symbol']}".encode()).decode()
+
+
+def _decode_token(page_token):
+    # binascii.Error and UnicodeDecodeError are ValueErrors as well
+    try:
+        committed_at, symbol = base64.urlsafe_b64decode(page_token.encode()).decode().split("|", 1)
+        return {"committedAt": datetime.datetime.fromisoformat(committed_at), "symbol": symbol}
+    except ValueError:
+        raise ValueError(f"Invalid page token: {page_token}") from None
+
+
+def read_results(process_id, page_size=100, page_token=None):
+    """
+    Reads one page of the results of a run in commit order.
+
+    Results committed after a page was read always sort after it, so a client can poll
+    with the returned token while the run is in progress and sees every symbol once.
+
+    Args:
+        process_id (str): The process-list document.
+        page_size (int): Maximum number of symbols in the page.
+        page_token (str): The next_page_token of the previous page.
+
+    Returns:
+        tuple: ({symbol: signals}, next_page_token). The token is None when the page
+        is empty, i.e. the client should keep its previous token.
+
+    Raises:
+        ValueError: For a page_token that was not returned by read_results.
+    """
+    query = _results_ref(process_id).order_by("committedAt").order_by("symbol")
+    if page_token:
+        query = query.start_after(_decode_token(page_token))
+    docs = [doc.to_dict() for doc in query.limit(page_size).stream()]
+    page = {doc["symbol"]: doc["signals"] for doc in docs}
+    return page, (_encode_token(docs[-1]) if docs else None)
+
+
+def iter_results(process_id, page_size=500):
+    """Yields (symbol, signals) for all results stored so far, reading page by page."""
+    page_token = None
+    while True:
+        page, next_token = read_results(process_id, page_size=page_size, page_token=page_token)
+        yield from page.items()
+        if len(page) < page_size:
+            return
+        page_token = next_token
@@ -0,0 +1,422 @@
+import datetime as dt
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from yf_to_firestore import get_data_from_firestore, load_histories
+
+# Default parameters of the backtrader strategies in tradingstrategies/.
+# Keep these in sync with the `params` tuples of the strategy classes.
+STRATEGY_PARAMS = {
+    "MovingAverageCrossoverStrategy": {
+        "short_period": 50,
+        "long_period": 200,
+    },
+    "MeanReversionStrategy": {
+        "boll_period": 20,
+        "rsi_period": 14,
+        "rsi_lower": 30,
+        "rsi_upper": 70,
+    },
+    "KNNMovingAverageCrossoverStrategy": {
+        "short_period": 50,
+        "long_period": 200,
+        "n_neighbors": 5,
+    },
+}
+
+
+def load_panel(symbols, frames=None, period="1y", resolution="D"):
+    """
+    Loads the OHLC history of all symbols into aligned 2-D matrices.
+
+    Each matrix has shape (bars, symbols). Histories are right aligned, i.e. the last
+    bar of every symbol sits in the last row and shorter histories are padded with NaN
+    at the top. Aligning on the bar position (instead of the calendar date) keeps the
+    rolling windows identical to a per-symbol backtrader feed.
+
+    Args:
+        symbols (list): The stock symbols to load.
+        frames (dict): Optional {symbol: DataFrame} already loaded by the caller.
+            Symbols missing from it are bulk loaded with load_histories.
+        period (str): History period passed to load_histories.
+        resolution (str): numpy datetime unit of the bar dates, "D" for daily bars
+            or "s" for intraday bars (see scan_intraday).
+
+    Returns:
+        dict: {"symbols", "dates", "open", "close", "high", "low", "lengths"}
+    """
+    frames = dict(frames or {})
+    missing = [symbol for symbol in symbols if symbol not in frames]
+    if missing:
+        try:
+            frames.update(load_histories(missing, period=period))
+        except Exception as e:
+            # Fall back to reading the symbols one by one below
+            print(f"Error bulk loading {len(missing)} symbols: {e}")
+    loaded = []
+    for symbol in symbols:
+        df = frames.get(symbol)
+        if df is None:
+            try:
+                df = get_data_from_firestore(symbol, period=period)
+            except Exception as e:
+                print(f"Error loading {symbol}: {e}")
+                continue
+        if df is None or df.empty:
+            print(f"No data for {symbol}, skipping.")
+            continue
+        loaded.append((symbol, df))
+
+    n_bars = max((len(df) for _, df in loaded), default=0)
+    n_symbols = len(loaded)
+    panel = {
+        "symbols": [symbol for symbol, _ in loaded],
+        "dates": np.full((n_bars, n_symbols), np.datetime64("NaT"), dtype=f"datetime64[{resolution}]"),
+        "open": np.full((n_bars, n_symbols), np.nan),
+        "close": np.full((n_bars, n_symbols), np.nan),
+        "high": np.full((n_bars, n_symbols), np.nan),
+        "low": np.full((n_bars, n_symbols), np.nan),
+        "lengths": np.zeros(n_symbols, dtype=np.int64),
+    }
+    for col, (symbol, df) in enumerate(loaded):
+        first = n_bars - len(df)
+        panel["dates"][first:, col] = df.index.values.astype(f"datetime64[{resolution}]")
+        for field in ("open", "close", "high", "low"):
+            panel[field][first:, col] = df[field].to_numpy(dtype=np.float64)
+        panel["lengths"][col] = len(df)
+    return panel
+
+
+def _rolling_mean(values, period):
+    """Simple moving average down the bar axis, NaN until the window is full."""
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] >= period:
+        out[period - 1:] = sliding_window_view(values, period, axis=0).sum(axis=-1) / period
+    return out
+
+
+def _smoothed_mean(values, period, first_valid):
+    """
+    Wilder's smoothed moving average (backtrader SmoothedMovingAverage).
+
+    Seeded with the arithmetic mean of the first `period` valid values of each column,
+    then prev * (1 - alpha) + value * alpha with alpha = 1 / period.
+    """
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    out = np.full(values.shape, np.nan)
+    seed_row = first_valid + period - 1
+    prev = np.full(values.shape[1], np.nan)
+    for t in range(values.shape[0]):
+        seeding = seed_row == t
+        if seeding.any():
+            cols = np.flatnonzero(seeding)
+            prev[cols] = values[t - period + 1:t + 1, cols].sum(axis=0) / period
+        running = seed_row < t
+        prev[running] = prev[running] * alpha1 + values[t, running] * alpha
+        out[t] = np.where(seed_row <= t, prev, np.nan)
+    return out
+
+
+def _first_rows(panel):
+    return panel["close"].shape[0] - panel["lengths"]
+
+
+def _cached(indicators, key, compute):
+    """Returns indicators[key], computing it once. `indicators` may be None (no sharing)."""
+    if indicators is None:
+        return compute()
+    if key not in indicators:
+        indicators[key] = compute()
+    return indicators[key]
+
+
+def sma(panel, period, indicators=None):
+    """Simple moving average of the closes, shared under the ("sma", period) key."""
+    return _cached(indicators, ("sma", period), lambda: _rolling_mean(panel["close"], period))
+
+
+def bollinger_bands(panel, period, devfactor=2.0, indicators=None):
+    """(mid, bot) Bollinger lines of the closes, shared under the ("bollinger", period, devfactor) key."""
+    def compute():
+        mid = sma(panel, period, indicators)
+        mean_sq = _cached(indicators, ("sma_sq", period), lambda: _rolling_mean(panel["close"] ** 2, period))
+        stddev = devfactor * np.power(np.abs(mean_sq - mid ** 2), 0.5)
+        return mid, mid - stddev
+    return _cached(indicators, ("bollinger", period, devfactor), compute)
+
+
+def rsi(panel, period, indicators=None):
+    """Wilder RSI of the closes with a one bar lookback, shared under the ("rsi", period) key."""
+    def compute():
+        close = panel["close"]
+        first = _first_rows(panel)
+        change = np.full(close.shape, np.nan)
+        change[1:] = close[1:] - close[:-1]
+        upday = np.maximum(change, 0.0)
+        downday = np.maximum(-change, 0.0)
+        maup = _smoothed_mean(upday, period, first + 1)
+        madown = _smoothed_mean(downday, period, first + 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 100.0 - 100.0 / (1.0 + maup / madown)
+    return _cached(indicators, ("rsi", period), compute)
+
+
+def moving_average_crossover_conditions(panel, short_period=50, long_period=200, indicators=None):
+    """
+    Entry/exit conditions of MovingAverageCrossoverStrategy for the whole universe.
+
+    Pass the same `indicators` dict to several calls to compute each SMA period only once.
+
+    Returns:
+        tuple: (entry, exit, start) where entry/exit are boolean (bars, symbols) matrices
+        and start is the first row at which the strategy's next() runs per symbol.
+    """
+    sma_short = sma(panel, short_period, indicators)
+    sma_long = sma(panel, long_period, indicators)
+    entry = sma_short > sma_long
+    exit = sma_short < sma_long
+    start = _first_rows(panel) + max(short_period, long_period) - 1
+    return entry, exit, start
+
+
+def mean_reversion_conditions(panel, boll_period=20, boll_devfactor=2.0, rsi_period=14,
+                              rsi_lower=30, rsi_upper=70, indicators=None):
+    """
+    Entry/exit conditions of MeanReversionStrategy for the whole universe.
+
+    Bollinger Bands and RSI are computed exactly like the backtrader indicators
+    (safepow standard deviation, Wilder smoothed RSI with a one bar lookback).
+    """
+    close = panel["close"]
+    first = _first_rows(panel)
+    mid, bot = bollinger_bands(panel, boll_period, boll_devfactor, indicators)
+
+    entry = (close <= bot) & (rsi(panel, rsi_period, indicators) < rsi_lower)
+    exit = close > mid
+    start = first + max(boll_period, rsi_period + 1) - 1
+    return entry, exit, start
+
+
+def knn_predictions(panel, short_period=50, long_period=200, n_neighbors=5, indicators=None):
+    """
+    Walk-forward KNN predictions of KNNMovingAverageCrossoverStrategy per symbol, shared
+    under the ("knn", short_period, long_period, n_neighbors) key. The features reuse
+    the shared SMAs.
+    """
+    # The strategy module imports backtrader; only needed once a KNN scan runs
+    from tradingstrategies.KNNMovingAverageCrossoverStrategy import walk_forward_predictions
+
+    def compute():
+        sma_short = sma(panel, short_period, indicators)
+        sma_long = sma(panel, long_period, indicators)
+        predictions = np.full(panel["close"].shape, np.nan)
+        # The strategy collects feature rows from its first next(), i.e. once both SMAs are valid
+        offsets = _first_rows(panel) + max(short_period, long_period) - 1
+        for col, offset in enumerate(offsets):
+            features = np.column_stack([panel["close"][offset:, col], sma_short[offset:, col], sma_long[offset:, col]])
+            predictions[offset:, col] = walk_forward_predictions(features, long_period, n_neighbors)
+        return predictions
+    return _cached(indicators, ("knn", short_period, long_period, n_neighbors), compute)
+
+
+def knn_moving_average_crossover_conditions(panel, short_period=50, long_period=200, n_neighbors=5,
+                                            indicators=None):
+    """
+    Entry/exit conditions of KNNMovingAverageCrossoverStrategy for the whole universe:
+    the SMA crossover or the KNN predicted direction, from the first bar with a prediction.
+    """
+    sma_short = sma(panel, short_period, indicators)
+    sma_long = sma(panel, long_period, indicators)
+    prediction = knn_predictions(panel, short_period, long_period, n_neighbors, indicators)
+    entry = (sma_short > sma_long) | (prediction > 0)
+    exit = (sma_short < sma_long) | (prediction < 0)
+    start = _first_rows(panel) + max(short_period, long_period) - 1 + long_period
+    return entry, exit, start
+
+
+CONDITIONS = {
+    "MovingAverageCrossoverStrategy": moving_average_crossover_conditions,
+    "MeanReversionStrategy": mean_reversion_conditions,
+    "KNNMovingAverageCrossoverStrategy": knn_moving_average_crossover_conditions,
+}
+
+# Strategies that only depend on the bars themselves (the KNN model is trained on daily history)
+INTRADAY_STRATEGIES = ("MovingAverageCrossoverStrategy", "MeanReversionStrategy")
+
+
+def generate_events(entry, exit, start):
+    """
+    Runs the long-only position state machine of BaseStrategy over all symbols at once.
+
+    A market order placed on bar t fills on bar t + 1 before the strategy looks at that
+    bar, so the position flips immediately for the next decision.
+
+    Returns:
+        tuple: (buys, sells) boolean (bars, symbols) matrices marking signal bars.
+    """
+    n_bars, n_symbols = entry.shape
+    buys = np.zeros(entry.shape, dtype=bool)
+    sells = np.zeros(entry.shape, dtype=bool)
+    in_position = np.zeros(n_symbols, dtype=bool)
+    for t in range(n_bars):
+        active = start <= t
+        buys[t] = active & ~in_position & entry[t]
+        sells[t] = active & in_position & exit[t]
+        in_position = (in_position | buys[t]) & ~sells[t]
+    return buys, sells
+
+
+def collect_signals(panel, buys, sells, chk_last_weeks=1):
+    """
+    Converts the event matrices into the signal dicts BaseStrategy.stop emits.
+
+    A symbol without any signal maps to None (like the analyzer), otherwise to the
+    list of signals within `chk_last_weeks` of its last bar (which may be empty).
+    """
+    results = {}
+    dates, close = panel["dates"], panel["close"]
+    daily = dates.dtype == np.dtype("datetime64[D]")
+    for col, symbol in enumerate(panel["symbols"]):
+        rows = np.flatnonzero(buys[:, col] | sells[:, col])
+        if len(rows) == 0:
+            results[symbol] = None
+            continue
+        last_date = dates[-1, col].astype(dt.date if daily else dt.datetime)
+        cutoff_date = last_date - dt.timedelta(weeks=chk_last_weeks)
+        signals = []
+        for row in rows:
+            signal_date = dates[row, col].astype(dt.date if daily else dt.datetime)
+            if signal_date < cutoff_date:
+                continue
+            signals.append({
+                # Intraday signals carry the bar time, e.g. "2025-01-02 09:15:00"
+                "date": str(signal_date),
+                "signal_type": "BUY" if buys[row, col] else "SELL",
+                "price": float(close[row, col])
+            })
+        results[symbol] = signals
+    return results
+
+
+def scan(symbols, strategy="MovingAverageCrossoverStrategy", chk_last_weeks=1, frames=None, **params):
+    """
+    Vectorized segment scan: evaluates `strategy` for every symbol in batched array operations.
+
+    Args:
+        symbols (list): The stock symbols to scan.
+        strategy (str): Name of the strategy in STRATEGY_PARAMS.
+        chk_last_weeks (int): Only signals within this many weeks of the last bar are kept.
+        frames (dict): Optional preloaded {symbol: DataFrame}.
+        **params: Overrides for the strategy parameters.
+
+    Returns:
+        dict: {symbol: list of signal dicts or None}, same as tradesignals.backtest per symbol.
+    """
+    if strategy not in CONDITIONS:
+        raise ValueError(f"Unsupported strategy for vectorized scan: {strategy}")
+    strategy_params = {**STRATEGY_PARAMS[strategy], **params}
+
+    panel = load_panel(symbols, frames=frames)
+    if not panel["symbols"]:
+        return {}
+    entry, exit, start = CONDITIONS[strategy](panel, **strategy_params)
+    buys, sells = generate_events(entry, exit, start)
+    return collect_signals(panel, buys, sells, chk_last_weeks=chk_last_weeks)
+
+
+def scan_multi(symbols, strategies=None, chk_last_weeks=1, frames=None, period="1y", params=None, resolution="D"):
+    """
+    Multi-strategy scan: loads every symbol once and evaluates several strategies on the
+    same panel. Indicators are computed once and shared between the strategies by their
+    (type, period) key, e.g. the 50/200 SMAs of the crossover and the KNN strategy.
+
+    Args:
+        symbols (list): The stock symbols to scan.
+        strategies (list): Strategy names in CONDITIONS, defaults to all of them.
+        chk_last_weeks (int): Only signals within this many weeks of the last bar are kept.
+        frames (dict): Optional preloaded {symbol: DataFrame}.
+        period (str): History period when loading from Firestore.
+        params (dict): Optional {strategy: {param: value}} overrides.
+        resolution (str): Bar date resolution, see load_panel.
+
+    Returns:
+        dict: {symbol: {strategy: list of signal dicts or None}}
+    """
+    strategies = strategies or list(CONDITIONS)
+    unsupported = [strategy for strategy in strategies if strategy not in CONDITIONS]
+    if unsupported:
+        raise ValueError(f"Unsupported strategies for vectorized scan: {unsupported}")
+
+    panel = load_panel(symbols, frames=frames, period=period, resolution=resolution)
+    results = {symbol: {} for symbol in panel["symbols"]}
+    indicators = {}
+    for strategy in strategies:
+        strategy_params = {**STRATEGY_PARAMS[strategy], **(params or {}).get(strategy, {})}
+        entry, exit, start = CONDITIONS[strategy](panel, indicators=indicators, **strategy_params)
+        buys, sells = generate_events(entry, exit, start)
+        for symbol, signals in collect_signals(panel, buys, sells, chk_last_weeks=chk_last_weeks).items():
+            results[symbol][strategy] = signals
+    return results
+
+
+def scan_intraday(symbols, interval="15m", period="30d", strategies=INTRADAY_STRATEGIES, chk_last_weeks=1,
+                  frames=None, params=None):
+    """
+    Multi-strategy scan on intraday bars, read from the intraday buckets and resampled
+    to `interval` (see intraday_bars.load_intraday). The strategy parameters count bars,
+    so e.g. the 50/200 crossover on 15m bars spans 50/200 15-minute bars.
+
+    Returns:
+        dict: {symbol: {strategy: list of signal dicts or None}}; signal dates carry the bar time.
+    """
+    from intraday_bars import load_intraday
+    unsupported = [strategy for strategy in strategies if strategy not in INTRADAY_STRATEGIES]
+    if unsupported:
+        raise ValueError(f"Unsupported strategies for intraday scan: {unsupported}")
+    frames = dict(frames or {})
+    missing = [symbol for symbol in symbols if symbol not in frames]
+    if missing:
+        frames.update(load_intraday(missing, interval=interval, period=period))
+    return scan_multi(symbols, strategies=list(strategies), chk_last_weeks=chk_last_weeks, frames=frames,
+                      params=params, resolution="s")
+
+
+def verify_parity(symbols, strategy="MovingAverageCrossoverStrategy", chk_last_weeks=53, frames=None):
+    """
+    Parity check of the vectorized scan against the backtrader path in tradesignals.backtest.
+
+    Returns:
+        dict: {symbol: (vectorized, backtrader)} for every symbol whose signals differ.
+    """
+    from tradesignals import backtest, STRATEGIES
+
+    frames = dict(frames or {})
+    frames.update(load_histories([symbol for symbol in symbols if symbol not in frames]))
+
+    vectorized = scan(symbols, strategy=strategy, chk_last_weeks=chk_last_weeks, frames=frames)
+    mismatches = {}
+    for symbol in vectorized:
+        expected = backtest(symbol, chk_last_weeks=chk_last_weeks, strategy=STRATEGIES[strategy],
+                            df=frames[symbol])
+        if not same_signals(vectorized[symbol], expected):
+            mismatches[symbol] = (vectorized[symbol], expected)
+    return mismatches
+
+
+def same_signals(left, right):
+    if left is None or right is None:
+        return left is None and right is None
+    if len(left) != len(right):
+        return False
+    return all(
+        a["date"] == b["date"] and a["signal_type"] == b["signal_type"] and np.isclose(a["price"], b["price"])
+        for a, b in zip(left, right)
+    )
+
+
+if __name__ == "__main__":
+    symbols = ["RELIANCE.NS", "TCS.NS", "INFY.NS"]
+    for strategy in STRATEGY_PARAMS:
+        mismatches = verify_parity(symbols, strategy=strategy)
+        print(f"{strategy}: {len(mismatches)} mismatching symbols")
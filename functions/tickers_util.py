@@ -1,4 +1,20 @@
-from yahoo_fin import stock_info as si
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Universes older than this are reloaded from their source on the next access.
+UNIVERSE_TTL_SECONDS = float(os.environ.get("UNIVERSE_TTL_SECONDS", str(6 * 60 * 60)))
+# Last successfully loaded universes, used when a source is unreachable (Cloud Functions only allow writes below /tmp)
+SNAPSHOT_PATH = os.environ.get("UNIVERSE_SNAPSHOT_PATH", "/tmp/universe_snapshot.json")
+# /tmp is empty after a cold start, so the snapshot is also kept in Firestore (one document per segment)
+SNAPSHOT_COLLECTION = os.environ.get("UNIVERSE_SNAPSHOT_COLLECTION", "universe-snapshots")
+
+
+class UniverseUnavailableError(RuntimeError):
+    """The source of a segment failed and no earlier copy of its universe exists."""
 
 
 def load_tickers(file_path):
@@ -7,15 +23,149 @@ def load_tickers(file_path):
     return tickers
 
 
+def _stock_info():
+    # yahoo_fin is slow to import; only the scraped segments need it
+    from yahoo_fin import stock_info as si
+    return si
+
+
+SEGMENT_SOURCES = {
+    "nifty50": lambda: _stock_info().tickers_nifty50(),
+    "niftybank": lambda: _stock_info().tickers_niftybank(),
+    "nifty100": lambda: load_tickers("data/tickers_nifty100.txt"),
+    "nifty500": lambda: load_tickers("data/tickers_nifty500.txt"),
+}
+
+
+def universe_hash(tickers):
+    """Short content hash of a ticker list, independent of its order."""
+    return hashlib.sha1("\n".join(sorted(tickers)).encode()).hexdigest()[:12]
+
+
+class UniverseRegistry:
+    """
+    In-memory registry of the ticker universe of every segment.
+
+    Universes are loaded from SEGMENT_SOURCES, kept for UNIVERSE_TTL_SECONDS and saved
+    to a snapshot file and to Firestore. When a source fails (e.g. the yahoo_fin scrape)
+    the previous universe is kept, or the snapshot file or, after a cold start, the
+    Firestore copy is used. Every universe has a content hash (version) that caches of
+    segment results can key on.
+    """
+
+    def __init__(self, sources=SEGMENT_SOURCES, ttl=UNIVERSE_TTL_SECONDS, snapshot_path=SNAPSHOT_PATH,
+                 snapshot_collection=SNAPSHOT_COLLECTION):
+        self.sources = sources
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_collection = snapshot_collection
+        self._universes = {}
+        # Versions known to be in Firestore, so an unchanged universe is not written again
+        self._persisted = {}
+        self._lock = threading.Lock()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_snapshot(self):
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._universes, file)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _load_persisted(self, segment):
+        # firestore_util pulls in the Firestore client; only needed when a source fails
+        from firestore_util import get_document
+        entry = get_document(self.snapshot_collection, segment)
+        if entry is not None:
+            self._persisted[segment] = entry["version"]
+        return entry
+
+    def _persist(self, segment, entry):
+        if self._persisted.get(segment) == entry["version"]:
+            return
+        from firestore_util import update_document
+        update_document(self.snapshot_collection, segment,
+                        {"tickers": entry["tickers"], "version": entry["version"], "loadedAt": entry["loadedAt"],
+                         "source": entry["source"]})
+        self._persisted[segment] = entry["version"]
+
+    def _load(self, segment):
+        try:
+            tickers = list(self.sources[segment]())
+            if not tickers:
+                raise ValueError("empty universe")
+            entry = {"tickers": tickers, "version": universe_hash(tickers),
+                     "loadedAt": time.time(), "source": "live"}
+        except Exception as e:
+            entry = (self._universes.get(segment) or self._load_snapshot().get(segment)
+                     or self._load_persisted(segment))
+            if entry is None:
+                raise UniverseUnavailableError(f"Universe {segment} unavailable and not in the snapshot: {e}")
+            print(f"Loading universe {segment} failed ({e}), using the {entry['source']} copy of {entry['version']}")
+            # Retry the source after another TTL rather than on every call
+            entry = {**entry, "loadedAt": time.time(), "source": "snapshot"}
+        with self._lock:
+            self._universes[segment] = entry
+            if entry["source"] == "live":
+                try:
+                    self._save_snapshot()
+                except OSError as e:
+                    print(f"Could not write the universe snapshot: {e}")
+        if entry["source"] == "live":
+            self._persist(segment, entry)
+        return entry
+
+    def _entry(self, segment):
+        if segment not in self.sources:
+            raise ValueError(f"Unknown segment: {segment}")
+        entry = self._universes.get(segment)
+        if entry is None or time.time() - entry["loadedAt"] > self.ttl:
+            entry = self._load(segment)
+        return entry
+
+    def preload(self, max_workers=4):
+        """Loads all segments concurrently, e.g. from a warm-up script; get() otherwise loads a segment on first use."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for segment, future in [(segment, executor.submit(self._entry, segment)) for segment in self.sources]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error preloading universe {segment}: {e}")
+
+    def get(self, segment):
+        """Returns a copy of the tickers of the segment."""
+        return list(self._entry(segment)["tickers"])
+
+    def version(self, segment):
+        """Returns the content hash of the current universe of the segment."""
+        return self._entry(segment)["version"]
+
+    def describe(self):
+        """Version, size, source and age in seconds of every loaded universe."""
+        now = time.time()
+        return {segment: {"version": entry["version"], "count": len(entry["tickers"]), "source": entry["source"],
+                          "ageSeconds": round(now - entry["loadedAt"], 1)}
+                for segment, entry in self._universes.items()}
+
+
+registry = UniverseRegistry()
+
+
 def get_all_tickers(segment_or_symbol : str):
+    """
+    Returns the tickers of a segment from the universe registry.
+
+    Raises:
+        ValueError: For an unknown segment.
+        UniverseUnavailableError: When the segment cannot be loaded and has no snapshot.
+    """
+    return registry.get(segment_or_symbol)
 
-    if segment_or_symbol == "nifty50":
-        return si.tickers_nifty50()
-    elif segment_or_symbol == "niftybank":
-        return si.tickers_niftybank()
-    elif segment_or_symbol == "nifty100":
-        return load_tickers("data/tickers_nifty100.txt")
-    elif segment_or_symbol == "nifty500":
-        return load_tickers("data/tickers_nifty500.txt")
 
-    return si.tickers_nifty50()
\ No newline at end of file
+def universe_version(segment):
+    return registry.version(segment)
@@ -1,14 +1,18 @@
 from functools import wraps
 import time
 
+from metrics import observe
+
 def timeit(func):
     @wraps(func)
     def timeit_wrapper(*args, **kwargs):
         start_time = time.perf_counter()
-        result = func(*args, **kwargs)
-        end_time = time.perf_counter()
-        total_time = end_time - start_time
-        # first item in the args, ie `args[0]` is `self`
-        print(f'Function {func.__name__}{args} {kwargs} Took {total_time:.4f} seconds')
-        return result
-    return timeit_wrapper
\ No newline at end of file
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end_time = time.perf_counter()
+            total_time = end_time - start_time
+            # Recorded as a stage named after the function (see metrics.span)
+            observe(func.__name__, total_time)
+            print(f'Function {func.__name__} Took {total_time:.4f} seconds')
+    return timeit_wrapper
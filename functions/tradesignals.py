@@ -1,25 +1,54 @@
 import backtrader as bt
 import yfinance as yf
 import datetime
-import matplotlib
 import time
 import json
 import uuid
+import os
+import multiprocessing
 import psutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import firestore_util
 from firestore_util import create_document, update_document, get_collection, get_document, delete_document
 
 
 from TradeSignalsAnalyzer import TradeSignalsAnalyzer
 from timer_util import timeit
+import metrics
+from metrics import increment, span, run_metrics
 from tickers_util import get_all_tickers
-from yf_to_firestore import get_data_from_firestore
+from yf_to_firestore import get_data_from_firestore, iter_histories
+from ohlcv_cache import cache
 
 from tradingstrategies.MeanReversionStrategy import MeanReversionStrategy
 from tradingstrategies.MovingAverageCrossoverStrategy import MovingAverageCrossoverStrategy
+from tradingstrategies.KNNMovingAverageCrossoverStrategy import KNNMovingAverageCrossoverStrategy
+import signal_engine
+import incremental_signals
+import result_cache
+from progress import ProgressReporter
+from result_store import ResultWriter, iter_results, read_results
+
+# "trigger": every shard document starts its own Cloud Function invocation (main.on_shard_created)
+# "local": the shards run in this process on a thread pool, for local testing
+SHARD_RUNNER = os.environ.get("SHARD_RUNNER", "trigger")
 
-matplotlib.use("Agg")  # Use Agg backend for non-GUI environments
-import matplotlib.pyplot as plt
+# A shard that is still pending or running after this long is considered lost (the
+# trigger never fired or the worker crashed) and is taken over by redrive_stale_shards;
+# on_shard_created times out after 540 seconds
+SHARD_TIMEOUT = datetime.timedelta(minutes=15)
+# Runs of a shard before it is given up and its symbols are reported as errors
+MAX_SHARD_ATTEMPTS = 3
+
+STRATEGIES = {
+    "MovingAverageCrossoverStrategy": MovingAverageCrossoverStrategy,
+    "MeanReversionStrategy": MeanReversionStrategy,
+    "KNNMovingAverageCrossoverStrategy": KNNMovingAverageCrossoverStrategy,
+}
 
 # Download Historical Data from Yahoo Finance
 def get_data(symbol, period="1y", interval="1d"):
@@ -37,22 +66,25 @@ def get_data(symbol, period="1y", interval="1d"):
 # Custom analyzer to collect trade signals
 # Backtest Function modified to return JSON object with trade signals
 @timeit
-def backtest(symbol, chk_last_weeks=1):
+def backtest(symbol, chk_last_weeks=1, strategy=MovingAverageCrossoverStrategy, df=None):
     """
     Backtest function to run the Moving Average Crossover strategy.
     """     
     
     cerebro = bt.Cerebro()
-    cerebro.addstrategy(MovingAverageCrossoverStrategy, chk_last_weeks=chk_last_weeks, symbol=symbol)
+    cerebro.addstrategy(strategy, chk_last_weeks=chk_last_weeks, symbol=symbol)
     
     # Add custom analyzer
     cerebro.addanalyzer(TradeSignalsAnalyzer, _name="tradesignals")
     
     # Load Data
-    df = get_data_from_firestore(symbol)
+    if df is None:
+        with span("data_load"):
+            df = get_data_from_firestore(symbol)
    
     
-    data = bt.feeds.PandasData(dataname=df)
+    with span("feed_create"):
+        data = bt.feeds.PandasData(dataname=df)
     
     # Add data to Cerebro
     cerebro.adddata(data)
@@ -61,8 +93,11 @@ def backtest(symbol, chk_last_weeks=1):
     cerebro.addsizer(bt.sizers.PercentSizer, percents=10)  # Trade with 10% of the available cash per trade
 
     # Run backtest and get trade signals from the analyzer
-    results = cerebro.run()
+    with span("cerebro_run"):
+        results = cerebro.run()
     signals = results[0].analyzers.tradesignals.get_analysis()
+    increment("bars_processed", len(df))
+    increment("symbols_processed")
     
     # Optionally, generate plot image (commented out)
     # fig = cerebro.plot()[0][0]
@@ -70,55 +105,494 @@ def backtest(symbol, chk_last_weeks=1):
     return  signals
 
 
-def async_backtest(segment: str, process_id, single: bool = False):
+def vectorized_backtest(tickers, chk_last_weeks=1, strategy="MovingAverageCrossoverStrategy"):
+    """
+    Scan mode: evaluates the strategy for all tickers at once with the vectorized
+    signal engine instead of one Cerebro per symbol.
+    """
+    all_signals = signal_engine.scan(tickers, strategy=strategy, chk_last_weeks=chk_last_weeks)
+    return {symbol: result for symbol, result in all_signals.items() if result and result != []}
+
+
+def incremental_backtest(tickers, chk_last_weeks=1, strategy="MovingAverageCrossoverStrategy"):
+    """
+    Scan mode: updates the persisted per-symbol strategy state with the bars since the
+    last run only, instead of recomputing the indicators over the full history.
+    """
+    all_signals = incremental_signals.incremental_scan(tickers, strategy=strategy, chk_last_weeks=chk_last_weeks)
+    return {symbol: result for symbol, result in all_signals.items() if result and result != []}
+
+
+def multi_strategy_backtest(tickers, chk_last_weeks=1, strategy=None):
+    """
+    Scan mode: evaluates all vectorized strategies in one pass per segment, loading the
+    data once and sharing the indicators between strategies.
+
+    Returns:
+        dict: {symbol: {strategy: signals}} for the symbols with at least one recent signal.
+    """
+    all_signals = signal_engine.scan_multi(tickers, strategies=[strategy] if strategy else None,
+                                           chk_last_weeks=chk_last_weeks)
+    filtered = {}
+    for symbol, by_strategy in all_signals.items():
+        by_strategy = {name: result for name, result in by_strategy.items() if result and result != []}
+        if by_strategy:
+            filtered[symbol] = by_strategy
+    return filtered
+
+
+SCAN_ENGINES = {
+    "vectorized": vectorized_backtest,
+    "incremental": incremental_backtest,
+    "multi": multi_strategy_backtest,
+}
+# How a backtrader scan is run: in this instance, on a process pool or as shards
+EXECUTORS = ("serial", "process", "sharded")
+
+
+def check_run_options(engine, executor):
+    """Raises ValueError for an engine or executor a scan cannot run with."""
+    if engine != "backtrader" and engine not in SCAN_ENGINES:
+        raise ValueError(f"Unknown engine: {engine} (one of backtrader, {', '.join(SCAN_ENGINES)})")
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor} (one of {', '.join(EXECUTORS)})")
+
+
+def _run_symbols(symbols, chk_last_weeks):
+    """
+    Pool worker: bulk loads the data and runs the backtest for its share of symbols.
+
+    Returns the signals, the errors, a memory report of the worker process and the
+    metrics summary of the chunk.
+    """
+    process = psutil.Process()
+    results = {}
+    errors = {}
+    peak_rss = 0
+    with run_metrics() as run:
+        for symbol, df in iter_histories(symbols):
+            try:
+                results[symbol] = backtest(symbol, chk_last_weeks=chk_last_weeks, df=df)
+            except Exception as e:
+                print(f"Error processing {symbol}: {e}")
+                errors[symbol] = str(e)
+                increment("symbols_failed")
+            peak_rss = max(peak_rss, process.memory_info().rss)
+    memory = {"pid": process.pid, "symbols": len(symbols), "peakRssMb": round(peak_rss / (1024 * 1024), 2)}
+    return results, errors, memory, run.summary()
+
+
+def parallel_backtest(tickers, chk_last_weeks=1, pool_size=None, process_id=None, chunks_per_worker=4):
+    """
+    Runs the backtests for all tickers on a pool of worker processes.
+
+    Tickers are dealt out round-robin into `pool_size * chunks_per_worker` chunks so slow
+    symbols are spread across workers. Results and errors are returned in ticker order
+    regardless of completion order.
+
+    Args:
+        tickers (list): The stock symbols to backtest.
+        chk_last_weeks (int): Passed through to backtest.
+        pool_size (int): Number of worker processes, defaults to the CPU count.
+        process_id (str): Optional process-list document to report progress and append
+            the per-symbol results to.
+        chunks_per_worker (int): Work chunks per worker.
+
+    Returns:
+        tuple: (signals, errors, worker_memory) where worker_memory holds one report per
+        worker process with its peak RSS in MB.
+    """
+    pool_size = max(1, min(pool_size or os.cpu_count() or 1, len(tickers) or 1))
+    n_chunks = min(len(tickers), pool_size * chunks_per_worker)
+    chunks = [tickers[i::n_chunks] for i in range(n_chunks)]
+    total_count = len(tickers)
+    print(f"Running {total_count} symbols on {pool_size} workers in {n_chunks} chunks")
+
+    results = {}
+    errors = {}
+    memory_by_pid = {}
+    # spawn instead of fork: the gRPC channels of the Firestore clients are not fork safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=pool_size, mp_context=context) as executor, \
+            ProgressReporter(process_id, total_count) as progress, ResultWriter(process_id) as writer:
+        futures = [executor.submit(_run_symbols, chunk, chk_last_weeks) for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_results, chunk_errors, memory, chunk_metrics = future.result()
+            metrics.merge(chunk_metrics)
+            results.update(chunk_results)
+            errors.update(chunk_errors)
+            writer.add_all(chunk_results)
+            report = memory_by_pid.setdefault(memory["pid"], {"pid": memory["pid"], "symbols": 0, "peakRssMb": 0})
+            report["symbols"] += memory["symbols"]
+            report["peakRssMb"] = max(report["peakRssMb"], memory["peakRssMb"])
+
+            completed_count = len(results) + len(errors)
+            print(f"Completed {completed_count}/{total_count}, worker {memory['pid']} peak RSS {memory['peakRssMb']:.2f} MB")
+            progress.update(completed_count, len(errors))
+
+    worker_memory = sorted(memory_by_pid.values(), key=lambda report: report["pid"])
+    total_rss = sum(report["peakRssMb"] for report in worker_memory)
+    print(f"Worker peak RSS total: {total_rss:.2f} MB over {len(worker_memory)} workers")
+    signals = {symbol: results[symbol] for symbol in tickers if symbol in results}
+    errors = {symbol: errors[symbol] for symbol in tickers if symbol in errors}
+    return signals, errors, worker_memory
+
+
+def _shards_ref(process_id):
+    return firestore_util.get_client().collection("process-list").document(process_id).collection("shards")
+
+
+def fan_out_shards(process_id, tickers, chk_last_weeks=1, shard_size=50, shard_count=None):
+    """
+    Splits the tickers into shard documents under process-list/{process_id}/shards.
+
+    Each shard document triggers its own worker invocation (see run_shard); the parent
+    document is completed by the reducer when the last shard finishes.
+
+    Args:
+        process_id (str): The parent process-list document.
+        tickers (list): The stock symbols to backtest.
+        chk_last_weeks (int): Passed through to backtest.
+        shard_size (int): Symbols per shard.
+        shard_count (int): Number of shards instead; tickers are then dealt out
+            round-robin like in parallel_backtest.
+
+    Returns:
+        int: The number of shards.
+    """
+    if shard_count:
+        shard_count = min(shard_count, len(tickers))
+        shards = [tickers[i::shard_count] for i in range(shard_count)]
+    else:
+        shards = [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+    update_document("process-list", process_id, {
+        "shardCount": len(shards),
+        "tickers": tickers,
+        "completionStatus": f"Running {len(shards)} shards"
+    })
+    batch = firestore_util.get_client().batch()
+    for index, symbols in enumerate(shards):
+        batch.set(_shards_ref(process_id).document(f"{index:04d}"), {
+            "index": index,
+            "tickers": symbols,
+            "chkLastWeeks": chk_last_weeks,
+            "status": "pending",
+            "attempts": 0,
+            "createdAt": datetime.datetime.now().isoformat()
+        })
+    batch.commit()
+    print(f"Fanned out {len(tickers)} symbols into {len(shards)} shards, Process ID: {process_id}")
+    return len(shards)
+
+
+def run_shard(process_id, shard_id):
+    """
+    Worker of one shard: backtests its symbols, stores the shard result and, when it is
+    the last shard to finish, reduces all shards into the parent document.
+
+    The shard is claimed (pending -> running) in a transaction first, so a redelivered
+    trigger does not run it twice; a running shard is only taken over once it is stale.
+    """
+    shard_ref = _shards_ref(process_id).document(shard_id)
+    shard = firestore_util.run_transaction(_claim_shard, shard_ref)
+    if shard is None:
+        return
+    if shard["status"] == "running":
+        try:
+            results, errors, memory, shard_metrics = _run_symbols(shard["tickers"], shard["chkLastWeeks"])
+            with ResultWriter(process_id) as writer:
+                writer.add_all(results)
+            shard_ref.set({
+                "status": "done",
+                "resultCount": writer.count,
+                "errors": errors,
+                "workerMemory": memory,
+                "metrics": shard_metrics
+            }, merge=True)
+        except Exception as e:
+            print(f"Error in shard {shard_id} of {process_id}: {e}")
+            shard_ref.set({"status": "error", "errors": {symbol: str(e) for symbol in shard["tickers"]}}, merge=True)
+    _complete_shard(process_id)
+
+
+def _shard_stale(shard, now=None):
+    started = shard.get("claimedAt") or shard.get("createdAt")
+    if started is None:
+        return False
+    return (now or datetime.datetime.now()) - datetime.datetime.fromisoformat(started) > SHARD_TIMEOUT
+
+
+def _claim_shard(transaction, shard_ref):
+    """
+    Claims a pending or stale running shard for this worker. Returns the shard with its
+    new status ("running", or "error" when it ran out of attempts), or None when there
+    is nothing to do.
+    """
+    shard = shard_ref.get(transaction=transaction).to_dict()
+    if shard is None or shard.get("status") not in ("pending", "running"):
+        return None
+    if shard["status"] == "running" and not _shard_stale(shard):
+        return None
+    attempts = shard.get("attempts", 0)
+    if attempts >= MAX_SHARD_ATTEMPTS:
+        print(f"Giving up shard {shard_ref.id} after {attempts} attempts")
+        shard["status"] = "error"
+        transaction.update(shard_ref, {
+            "status": "error",
+            "errors": {symbol: f"Shard timed out after {attempts} attempts" for symbol in shard["tickers"]}
+        })
+        return shard
+    shard["status"] = "running"
+    transaction.update(shard_ref, {
+        "status": "running",
+        "attempts": attempts + 1,
+        "claimedAt": datetime.datetime.now().isoformat()
+    })
+    return shard
+
+
+def _write_progress(transaction, process_ref, progress):
+    # Shards finish in any order and the reducer may have completed the job already;
+    # never move the parent back to a lower percentage
+    parent = process_ref.get(transaction=transaction).to_dict() or {}
+    if parent.get("completionPercent", 0) >= progress["completionPercent"]:
+        return
+    transaction.update(process_ref, progress)
+
+
+def _complete_shard(process_id):
+    shards = [doc.to_dict() for doc in _shards_ref(process_id).select(["status", "tickers"]).stream()]
+    finished = [shard for shard in shards if shard.get("status") in ("done", "error")]
+    completed_count = sum(len(shard["tickers"]) for shard in finished)
+    total_count = sum(len(shard["tickers"]) for shard in shards)
+    if len(finished) < len(shards):
+        process_ref = firestore_util.get_client().collection("process-list").document(process_id)
+        firestore_util.run_transaction(_write_progress, process_ref, {
+            "completionPercent": int((completed_count / total_count) * 100),
+            "completionStatus": f"In progress {completed_count}/{total_count} ({len(finished)}/{len(shards)} shards)"
+        })
+        return
+    # Several shards can see all shards finished; the one that creates the marker reduces.
+    try:
+        firestore_util.get_client().collection("process-list").document(process_id) \
+            .collection("reducer").document("claim").create({"claimedAt": datetime.datetime.now().isoformat()})
+    except AlreadyExists:
+        return
+    _reduce_shards(process_id)
+
+
+def redrive_stale_shards(process_id, max_workers=None):
+    """
+    Runs the shards of a job whose trigger never fired or whose worker died: shards
+    still pending or running SHARD_TIMEOUT after they were created or claimed. Each one
+    is claimed again (see _claim_shard), so a shard that keeps failing is reported as an
+    error after MAX_SHARD_ATTEMPTS runs and the job still completes.
+
+    Returns:
+        int: The number of shards re-driven.
+    """
+    now = datetime.datetime.now()
+    stale = [doc.id for doc in _shards_ref(process_id).stream()
+             if doc.to_dict().get("status") in ("pending", "running") and _shard_stale(doc.to_dict(), now)]
+    if stale:
+        print(f"Re-driving {len(stale)} stale shards, Process ID: {process_id}")
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            for future in as_completed([executor.submit(run_shard, process_id, shard_id) for shard_id in stale]):
+                future.result()
+    return len(stale)
+
+
+def _reduce_shards(process_id):
+    """
+    Merges the shard errors and metrics into the parent process-list document; the
+    shards appended their results to the results subcollection already.
+    """
+    parent = get_document("process-list", process_id)
+    shards = [doc.to_dict() for doc in _shards_ref(process_id).order_by("index").stream()]
+    errors = {}
+    shard_metrics = metrics.Metrics()
+    for shard in shards:
+        errors.update(shard.get("errors", {}))
+        shard_metrics.merge(shard.get("metrics", {}))
+    tickers = parent.get("tickers", list(errors))
+    update_document("process-list", process_id, {
+        "completionPercent": 100,
+        "completionStatus": "Backtest completed",
+        "resultCount": sum(shard.get("resultCount", 0) for shard in shards),
+        "errors": {symbol: errors[symbol] for symbol in tickers if symbol in errors},
+        "workerMemory": [shard["workerMemory"] for shard in shards if "workerMemory" in shard],
+        "shardMetrics": shard_metrics.summary()
+    })
+    print(f"Reduced {len(shards)} shards, Process ID: {process_id}")
+
+
+def redrive_stale_jobs(since=datetime.timedelta(days=1)):
+    """
+    Re-drives the stale shards of every sharded job started within `since` that has not
+    completed yet. Called periodically (main.redrive_shards).
+
+    Returns:
+        int: The number of shards re-driven.
+    """
+    cutoff = (datetime.datetime.now() - since).isoformat()
+    # A single-field range filter needs no composite index; the rest is filtered here
+    query = firestore_util.get_client().collection("process-list") \
+        .where(filter=FieldFilter("startTime", ">=", cutoff))
+    redriven = 0
+    for doc in query.stream():
+        job = doc.to_dict()
+        if job.get("executor") == "sharded" and job.get("completionPercent", 0) < 100:
+            redriven += redrive_stale_shards(doc.id)
+    return redriven
+
+
+def run_shards_locally(process_id, max_workers=None):
+    """In-process runner: executes the pending shards of a job on a thread pool."""
+    shard_ids = [doc.id for doc in _shards_ref(process_id).select(["status"]).stream()]
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        for future in as_completed([executor.submit(run_shard, process_id, shard_id) for shard_id in shard_ids]):
+            future.result()
+
+
+def async_backtest(segment: str, process_id, single: bool = False, engine: str = "backtrader",
+                   executor: str = "serial", pool_size: int = None):
     """
     Asynchronous backtest function to run in a separate thread.
+
+    The stage timings and counters of the run are written to the process-list document
+    as "metrics" when it finishes.
     """
+    with run_metrics() as run:
+        with span("run_total"):
+            _run_backtest(segment, process_id, single, engine, executor, pool_size)
+    summary = run.summary()
+    print(f"Run metrics: {summary['counters']}")
+    update_document("process-list", process_id, {"metrics": summary})
+
+
+def _run_backtest(segment, process_id, single, engine, executor, pool_size):
+    try:
+        check_run_options(engine, executor)
+    except ValueError as e:
+        print(f"Error in async_backtest: {e}")
+        update_document("process-list", process_id, {
+            "completionStatus": f"Error: {str(e)}"
+        })
+        return
     if single:
         tickers = [segment]
     else:
-        tickers = get_all_tickers(segment)
+        try:
+            tickers = get_all_tickers(segment)
+        except Exception as e:
+            print(f"Error in async_backtest: {e}")
+            update_document("process-list", process_id, {
+                "completionStatus": f"Error: {str(e)}"
+            })
+            return
     print(f"Running backtest for {len(tickers)} symbols in segment: {segment}")    
+    if engine in SCAN_ENGINES:
+        try:
+            with span(f"{engine}_scan"):
+                filtered_signals = SCAN_ENGINES[engine](tickers, chk_last_weeks=53 if single else 1)
+            increment("symbols_processed", len(tickers))
+            with span("result_upload"):
+                with ResultWriter(process_id, batch_size=500) as writer:
+                    writer.add_all(filtered_signals)
+                update_document("process-list", process_id, {
+                    "completionPercent": 100,
+                    "completionStatus": "Backtest completed",
+                    "resultCount": writer.count
+                })
+            print(f"{engine.capitalize()} backtest completed for all symbols. Process ID: {process_id}")
+        except Exception as e:
+            print(f"Error in async_backtest: {e}")
+            update_document("process-list", process_id, {
+                "completionStatus": f"Error: {str(e)}"
+            })
+        return
+    if executor == "sharded":
+        try:
+            with span("fan_out"):
+                # pool_size is the number of shards (worker instances) here
+                fan_out_shards(process_id, tickers, chk_last_weeks=53 if single else 1, shard_count=pool_size)
+            if SHARD_RUNNER == "local":
+                run_shards_locally(process_id)
+        except Exception as e:
+            print(f"Error in async_backtest: {e}")
+            update_document("process-list", process_id, {
+                "completionStatus": f"Error: {str(e)}"
+            })
+        return
+    if executor == "process":
+        try:
+            all_signals, errors, worker_memory = parallel_backtest(
+                tickers, chk_last_weeks=53 if single else 1, pool_size=pool_size, process_id=process_id)
+            filtered_signals = {symbol: result for symbol, result in all_signals.items() if result and result != []}
+            with span("result_upload"):
+                update_document("process-list", process_id, {
+                    "completionPercent": 100,
+                    "completionStatus": "Backtest completed",
+                    "resultCount": len(filtered_signals),
+                    "errors": errors,
+                    "workerMemory": worker_memory
+                })
+            print(f"Backtest completed for all symbols. Process ID: {process_id}")
+        except Exception as e:
+            print(f"Error in async_backtest: {e}")
+            update_document("process-list", process_id, {
+                "completionStatus": f"Error: {str(e)}"
+            })
+        return
     try:
         all_signals = {}
+        failed_count = 0
         total_count = len(tickers)
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        peak_rss = rss_before
         print(f"Total symbols to process: {total_count}")
-        for symbol in tickers:
-            print(f"Processing symbol: {symbol}")
-            try:
-                result = backtest(symbol, chk_last_weeks=53 if single else 1)
-                print(f"Backtest complete for {symbol}")
-                process = psutil.Process()
-                mem_usage_mb = process.memory_info().rss / (1024 * 1024)
-                print(f"Memory utilization: {mem_usage_mb:.2f} MB")
-                # Save the result to Firestore
-                all_signals[symbol] = result
-                completed_count = len(all_signals)
-                completion_percent = int((completed_count / total_count) * 100)
-                if completion_percent in {5, 25, 50, 75}:
-                    current_doc = get_document("process-list", process_id)
-                    if current_doc.get("completionPercent") != completion_percent:
-                        update_document("process-list", process_id, {
-                            "completionPercent": completion_percent,
-                            "completionStatus": f"In progress {completed_count}/{total_count}"
-                        })
-                        print(f"Progress: {completion_percent}% ({completed_count}/{total_count}), Process ID: {process_id}")
-                
-            except Exception as e:
-                print(f"Error processing {symbol}: {e}")
+        with ProgressReporter(process_id, total_count) as progress, ResultWriter(process_id) as writer:
+            for symbol, df in iter_histories(tickers):
+                print(f"Processing symbol: {symbol}")
+                try:
+                    result = backtest(symbol, chk_last_weeks=53 if single else 1, df=df)
+                    print(f"Backtest complete for {symbol}")
+                    peak_rss = max(peak_rss, process.memory_info().rss)
+                    # Save the result to Firestore
+                    all_signals[symbol] = result
+                    writer.add(symbol, result)
+                except Exception as e:
+                    print(f"Error processing {symbol}: {e}")
+                    increment("symbols_failed")
+                    failed_count += 1
+                # Coalesced in memory, flushed by the reporter's thread
+                progress.update(len(all_signals) + failed_count, failed_count)
+        rss_after = process.memory_info().rss
+        completed_count = len(all_signals) + failed_count
         filtered_signals = {symbol: result for symbol, result in all_signals.items() if result and result != []}
 
         # Update Firestore with completion status and result
         update_content = {
             "completionPercent": 100,
             "completionStatus": "Backtest completed",
-            "result": filtered_signals
+            "resultCount": writer.count,
+            "failedCount": failed_count,
+            "symbolsPerSecond": progress.snapshot()["symbolsPerSecond"],
+            "etaSeconds": 0,
+            "workerMemory": [{"pid": process.pid, "symbols": total_count, "peakRssMb": round(peak_rss / (1024 * 1024), 2),
+                              "rssBeforeMb": round(rss_before / (1024 * 1024), 2),
+                              "rssAfterMb": round(rss_after / (1024 * 1024), 2)}]
         }
         
+        print(f"Memory utilization: {rss_before / (1024 * 1024):.2f} MB before, "
+              f"peak {peak_rss / (1024 * 1024):.2f} MB, {rss_after / (1024 * 1024):.2f} MB after")
         print(f"Progress: {100}% ({completed_count}/{total_count}), Process ID: {process_id}")
+        print(f"OHLCV cache: {cache.stats()}")
 
         process_list_collection = "process-list"
-        update_document(process_list_collection, process_id, update_content)
+        with span("result_upload"):
+            update_document(process_list_collection, process_id, update_content)
         print(f"Backtest completed for all symbols. Process ID: {process_id}")
         
     except Exception as e:
@@ -128,18 +602,33 @@ def async_backtest(segment: str, process_id, single: bool = False):
         })
 
 
-def run_backtests(segment: str, single: bool = False):
+def run_backtests(segment: str, single: bool = False, engine: str = "backtrader",
+                  executor: str = "serial", pool_size: int = None, refresh: bool = False):
     """
     Run backtests for a given segment and return the process ID.
+
+    An identical scan (same segment, strategy, parameters and data watermark) that
+    already completed or is still running is reused instead of starting a new run,
+    unless `refresh` is set.
+
+    Raises:
+        ValueError: For an unknown engine or executor (see check_run_options), or an
+            unknown segment.
     """
-   
+    check_run_options(engine, executor)
+    key, fields = result_cache.result_key(segment, single=single, engine=engine)
+    process_id, reused = result_cache.lookup_or_claim(key, fields, str(uuid.uuid4()), refresh=refresh)
+    if reused:
+        return process_id
     
-    process_id = get_process_id(segment, single)
+    process_id = get_process_id(segment, single, engine, executor, pool_size, process_id=process_id, cache_key=key)
     
     return process_id
 
-def get_process_id(segment, single: bool = False):
-    process_id = str(uuid.uuid4())
+def get_process_id(segment, single: bool = False, engine: str = "backtrader",
+                   executor: str = "serial", pool_size: int = None, process_id: str = None,
+                   cache_key: str = None):
+    process_id = process_id or str(uuid.uuid4())
     # Update Firestore with initial status
     create_document("process-list", process_id, {
         "completionPercent": 0,
@@ -148,24 +637,53 @@ def get_process_id(segment, single: bool = False):
         "segment_or_symbol": segment,
         "startTime": datetime.datetime.now().isoformat(),
         "single": single,
-        "result": {}
+        "engine": engine,
+        "executor": executor,
+        "poolSize": pool_size,
+        "cacheKey": cache_key,
+        # Results are appended to the results subcollection (see result_store)
+        "resultCount": 0
     })
     
     return process_id
 
-def get_backtest_status(process_id):
+def get_backtest_status(process_id, include_result=True):
     data = get_document("process-list", process_id)
     if data is None:
         return None
     
-    return {
+    status = {
         "completionPercent": data.get("completionPercent"),
         "completionStatus": data.get("completionStatus"),
         "processId": data.get("processId"),
         "segment_or_symbol": data.get("segment_or_symbol"),
         "startTime": data.get("startTime"),
-        "result": data.get("result")
+        "resultCount": data.get("resultCount")
     }
+    if include_result:
+        # Runs before the results subcollection kept the whole map in the document
+        if "resultCount" in data:
+            status["result"] = dict(iter_results(process_id))
+        else:
+            status["result"] = data.get("result")
+    return status
+
+def get_result_page(process_id, page_size=100, page_token=None):
+    """
+    One page of the results of a run, readable while the run is in progress.
+
+    Returns:
+        dict: The run status with "result" ({symbol: signals}) and "next_page_token",
+        or None for an unknown process ID.
+    """
+    status = get_backtest_status(process_id, include_result=False)
+    if status is None:
+        return None
+    page, next_token = read_results(process_id, page_size=page_size, page_token=page_token)
+    status["result"] = page
+    # An empty page keeps the caller's token, so polling resumes where it stopped
+    status["next_page_token"] = next_token or page_token
+    return status
     
 
 # Load tickers from a file
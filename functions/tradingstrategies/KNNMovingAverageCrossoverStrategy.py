@@ -1,40 +1,140 @@
 import backtrader as bt
-from sklearn.neighbors import KNeighborsClassifier
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from .BaseStrategy import BaseStrategy  # new import
 
+
+def _sklearn_predict(train_X, train_y, query, n_neighbors):
+    # sklearn is slow to import and only needed for tied neighbours
+    from sklearn.neighbors import KNeighborsClassifier
+    return KNeighborsClassifier(n_neighbors=n_neighbors).fit(train_X, train_y).predict([query])[0]
+
+
+def _boundary_tie(sorted_distances, n_neighbors):
+    """True where the k-th and the (k+1)-th nearest distance are equal (up to rounding)."""
+    if sorted_distances.shape[-1] <= n_neighbors:
+        return np.zeros(sorted_distances.shape[:-1], dtype=bool)
+    kth = sorted_distances[..., n_neighbors - 1]
+    following = sorted_distances[..., n_neighbors]
+    return np.isclose(kth, following, rtol=1e-9, atol=1e-12)
+
+
+def knn_predict(train_X, train_y, query, n_neighbors):
+    """
+    Majority vote of the `n_neighbors` training rows closest to `query` (euclidean).
+
+    Same result as KNeighborsClassifier(n_neighbors).fit(train_X, train_y).predict([query]):
+    ties in the vote go to the smallest label. Which of several equally distant rows
+    sklearn includes at the k-th place depends on its tree and heap internals (it is
+    not the training order), so those queries are answered by sklearn itself. They only
+    occur with repeated feature values, e.g. flat stretches of rounded prices.
+    """
+    distances = ((train_X - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")
+    if _boundary_tie(distances[order], n_neighbors):
+        return _sklearn_predict(train_X, train_y, query, n_neighbors)
+    labels, counts = np.unique(train_y[order[:n_neighbors]], return_counts=True)
+    return labels[np.argmax(counts)]
+
+
+def walk_forward_predictions(features, window, n_neighbors):
+    """
+    Batch walk-forward mode: the KNN prediction of every row in one vectorized pass.
+
+    Row i is predicted from a model trained on rows i-window+1 .. i-1, each labelled with
+    the direction of the next close, exactly like the per-bar refit in next(). Rows with
+    tied neighbours at the k-th place are predicted one by one (see knn_predict).
+
+    Args:
+        features (np.ndarray): (rows, 3) array of [close, sma_short, sma_long].
+        window (int): Training window including the predicted row (long_period).
+        n_neighbors (int): Neighbours in the vote.
+
+    Returns:
+        np.ndarray: Predictions per row, NaN where fewer than window + 1 rows are available.
+    """
+    n_rows = len(features)
+    predictions = np.full(n_rows, np.nan)
+    if n_rows <= window:
+        return predictions
+    labels = np.sign(np.diff(features[:, 0]))
+    # Window w spans rows w .. w+window-1 and predicts its last row; the first window is skipped
+    windows = sliding_window_view(features, window, axis=0)[1:]         # (m, 3, window)
+    label_windows = sliding_window_view(labels, window - 1)[1:n_rows - window + 1]  # (m, window-1)
+    train = windows[:, :, :-1]
+    queries = windows[:, :, -1:]
+    distances = ((train - queries) ** 2).sum(axis=1)                   # (m, window-1)
+    order = np.argsort(distances, axis=1, kind="stable")
+    nearest = order[:, :n_neighbors]
+    votes = np.take_along_axis(label_windows, nearest, axis=1)
+    classes = np.array([-1.0, 0.0, 1.0])
+    counts = (votes[:, :, None] == classes).sum(axis=1)
+    predictions[window:] = classes[np.argmax(counts, axis=1)]
+    tied = np.flatnonzero(_boundary_tie(np.take_along_axis(distances, order, axis=1), n_neighbors))
+    for w in tied:
+        predictions[window + w] = _sklearn_predict(train[w].T, label_windows[w], queries[w][:, 0], n_neighbors)
+    return predictions
+
+
 class KNNMovingAverageCrossoverStrategy(BaseStrategy):  # changed inheritance
     params = (
         ("short_period", 50),
         ("long_period", 200),
         ("n_neighbors", 5),
+        ("batch", False),
     )
 
-    def __init__(self):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         # Short and Long Moving Averages
         self.sma_short = bt.indicators.SimpleMovingAverage(period=self.params.short_period)
         self.sma_long = bt.indicators.SimpleMovingAverage(period=self.params.long_period)
-        # KNN Classifier
-        self.knn = KNeighborsClassifier(n_neighbors=self.params.n_neighbors)
-        self.data_points = []
+        # Sliding window of the last long_period feature rows, stored as a ring buffer
+        self.window = np.empty((self.params.long_period, 3))
+        self.count = 0
+        self.predictions = None
+
+    def _batch_predictions(self):
+        # Only possible when the feed is preloaded and the indicators were computed in runonce mode
+        if len(self.data.close.array) != self.data.buflen() or len(self.sma_long.array) != self.data.buflen():
+            return None
+        first = len(self) - 1
+        features = np.column_stack([
+            np.asarray(self.data.close.array[first:]),
+            np.asarray(self.sma_short.array[first:]),
+            np.asarray(self.sma_long.array[first:]),
+        ])
+        return walk_forward_predictions(features, self.params.long_period, self.params.n_neighbors)
+
+    def _next_prediction(self):
+        window = self.params.long_period
+        self.window[self.count % window] = (self.data.close[0], self.sma_short[0], self.sma_long[0])
+        self.count += 1
+        if self.params.batch:
+            if self.predictions is None:
+                self.predictions = self._batch_predictions()
+            if self.predictions is not None:
+                prediction = self.predictions[self.count - 1]
+                return None if np.isnan(prediction) else prediction
+        if self.count <= window:
+            return None
+        # Oldest to newest, the last row is the current bar
+        X = np.roll(self.window, -(self.count % window), axis=0)
+        y = np.sign(np.diff(X[:, 0]))  # Target: price movement direction
+        return knn_predict(X[:-1], y, X[-1], self.params.n_neighbors)  # Predict next movement
 
     def next(self):
-        # Collect data points for KNN
-        self.data_points.append([self.data.close[0], self.sma_short[0], self.sma_long[0]])
-        if len(self.data_points) > self.params.long_period:
-            X = np.array(self.data_points[-self.params.long_period:])
-            y = np.sign(np.diff(X[:, 0]))  # Target: price movement direction
-            self.knn.fit(X[:-1], y)  # Train KNN
-
-            prediction = self.knn.predict([X[-1]])  # Predict next movement
-
-            if self.position:
-                # Exit condition: Short MA crosses below Long MA or KNN predicts downward movement
-                if self.sma_short[0] < self.sma_long[0] or prediction < 0:
-                    self.close()
-                    self.log(f"SELL: Price: {self.data.close[0]}")
-            else:
-                # Buy condition: Short MA crosses above Long MA or KNN predicts upward movement
-                if self.sma_short[0] > self.sma_long[0] or prediction > 0:
-                    self.buy()
-                    self.log(f"BUY: Price: {self.data.close[0]}")
+        prediction = self._next_prediction()
+        if prediction is None:
+            return
+
+        if self.position:
+            # Exit condition: Short MA crosses below Long MA or KNN predicts downward movement
+            if self.sma_short[0] < self.sma_long[0] or prediction < 0:
+                self.close()
+                self.log(f"SELL: Price: {self.data.close[0]}")
+        else:
+            # Buy condition: Short MA crosses above Long MA or KNN predicts upward movement
+            if self.sma_short[0] > self.sma_long[0] or prediction > 0:
+                self.buy()
+                self.log(f"BUY: Price: {self.data.close[0]}")
@@ -1,18 +1,31 @@
+import contextvars
+import gc
+import os
 import re
 import yfinance as yf
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from firebase_admin import initialize_app, credentials, firestore
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+import numpy as np
 import pandas as pd
-from firebase_admin import get_app
 
-try:
-    get_app()
-except ValueError:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    initialize_app(cred)
-    
-db = firestore.client()
+from download_scheduler import RefreshCheckpoint, _is_rate_limit, scheduler
+from firestore_util import bulk_write, gather_bounded, get_async_client, get_client, get_documents, run_async
+from metrics import increment, span
+from ohlcv_cache import COLUMN_DTYPES, cache
+from result_cache import invalidate_results
+from tickers_util import get_all_tickers
+
+BAR_FIELDS = ["Date", "open", "high", "low", "close", "volume"]
+
+# "daily": one document per bar under stocks/{symbol}/daily/{YYYY-MM-DD}
+# "yearly": one document per symbol-year under stocks/{symbol}/yearly/{YYYY} holding columnar arrays
+STORAGE_LAYOUT = os.environ.get("STOCKS_STORAGE_LAYOUT", "daily")
+
+# Bound (MB) of the bar data a scan holds at a time, 0 keeps whole blocks (see iter_histories)
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", "0"))
 
 def get_timedelta_from_period(period: str):
     """
@@ -49,9 +62,18 @@ def get_timedelta_from_period(period: str):
     else:
         raise ValueError(f"Unsupported time unit: {unit}")
 
+_YF_COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Volume": "volume"
+}
+
 def get_data(symbol, start=None, end=None, interval="1d"):
     """
-    Fetches historical data for a given stock symbol from Yahoo Finance.
+    Fetches historical data for a given stock symbol from Yahoo Finance, through the
+    shared download scheduler (rate limit, concurrency bound and jittered retries).
     
     Args:
         symbol (str): The stock symbol to fetch data for.
@@ -60,47 +82,177 @@ def get_data(symbol, start=None, end=None, interval="1d"):
         interval (str): The data interval (e.g., '1d', '1wk', '1mo').
     
     Returns:
-        pandas.DataFrame: DataFrame containing the historical data.
+        pandas.DataFrame: DataFrame containing the historical data, empty when the
+        download was still rate-limited after all retries.
     """
-    for attempt in range(5):
-        try:
-            data = yf.download(symbol, start=start, end=end, interval=interval, multi_level_index=False, progress=False)
-            data = data.rename(columns={
-                "Open": "open",
-                "High": "high",
-                "Low": "low",
-                "Close": "close",
-                "Volume": "volume"
-            })
-            break
-        except yf.shared._exceptions.YFRateLimitError:
-            wait = 2 ** attempt
-            print(f"Rate-limited; sleeping {wait}s")
-            time.sleep(wait)
-    
+    try:
+        data = scheduler.call(yf.download, symbol, start=start, end=end, interval=interval,
+                              multi_level_index=False, progress=False)
+    except yf.shared._exceptions.YFRateLimitError as e:
+        print(f"Download of {symbol} failed: {e}")
+        return pd.DataFrame(columns=list(_YF_COLUMNS.values()))
+    return data.rename(columns=_YF_COLUMNS)
+
+def _download_multi(symbols, start=None, end=None, interval="1d"):
+    """
+    One grouped yf.download call. yf.download records the errors of single tickers,
+    rate limits included, instead of raising them and leaves those tickers out, so a
+    missing symbol may have failed; see _confirm_history.
+    """
+    data = yf.download(symbols, start=start, end=end, interval=interval, group_by="ticker",
+                       multi_level_index=True, progress=False, threads=True)
+    if data is None or data.empty:
+        return {}
+
+    frames = {}
+    downloaded = set(data.columns.get_level_values(0))
+    for symbol in symbols:
+        if symbol not in downloaded:
+            continue
+        df = data[symbol].dropna(how="all")
+        if df.empty:
+            continue
+        frames[symbol] = df.rename(columns=_YF_COLUMNS)
+    return frames
+
+def _confirm_history(symbol, start=None, end=None, interval="1d"):
+    """
+    Downloads one symbol that a grouped download returned no bars for, with the errors
+    raised: a rate limit is raised to the scheduler, any other failure to the caller.
+
+    Returns:
+        pandas.DataFrame: The bars in the format of get_data; empty when Yahoo Finance
+        confirmed that there are no bars in the range.
+    """
+    try:
+        data = yf.Ticker(symbol).history(start=start, end=end, interval=interval, raise_errors=True)
+    except Exception as e:
+        # yfinance is matched by name like in download_scheduler._is_rate_limit
+        if type(e).__name__ != "YFPricesMissingError":
+            raise
+        data = None
+    if data is None or data.empty:
+        return pd.DataFrame(columns=list(_YF_COLUMNS.values()))
+    data = data[list(_YF_COLUMNS)].rename(columns=_YF_COLUMNS)
+    # Exchange dates like yf.download, without the timezone
+    if data.index.tz is not None:
+        data.index = data.index.tz_localize(None)
     return data
 
-def save_to_firestore(data, symbol):
+def get_data_multi(symbols, start=None, end=None, interval="1d"):
+    """
+    Fetches historical data for several stock symbols with a single grouped yf.download
+    call, through the shared download scheduler.
+    
+    Args:
+        symbols (list): The stock symbols to fetch data for.
+        start (str): The start date in 'YYYY-MM-DD' format.
+        end (str): The end date in 'YYYY-MM-DD' format.
+        interval (str): The data interval (e.g., '1d', '1wk', '1mo').
+    
+    Returns:
+        dict: {symbol: DataFrame} in the same format as get_data. Symbols without data
+        (or all of them when the download was still rate-limited after all retries) are left out.
+    """
+    try:
+        return scheduler.call(_download_multi, symbols, start=start, end=end, interval=interval)
+    except yf.shared._exceptions.YFRateLimitError as e:
+        print(f"Download of {len(symbols)} symbols failed: {e}")
+        return {}
+
+def _bar_writes(data, symbol):
+    """Builds the (document, data) writes of the bars in the configured STORAGE_LAYOUT."""
+    if STORAGE_LAYOUT == "yearly":
+        return _chunk_writes(data, symbol)
     data.reset_index(inplace=True)
     data['Date'] = data['Date'].dt.strftime('%Y-%m-%d')
-    records = data.to_dict(orient="records")      # list[dict]
-    batch = db.batch()
-    print(f"Saving {len(records)} records to Firestore for {symbol}...")
-    # Firestore batch limit is 500 writes per batch. Write in chunks.
-    for i, row in enumerate(records, 1):
-        doc = (
-            db.collection("stocks")
-            .document(symbol)
-            .collection("daily")
-            .document(row["Date"])
-        )
-        batch.set(doc, row)
-        if i % 500 == 0:
-            batch.commit()
-            batch = db.batch()       # start fresh
-
-    # commit any leftovers
-    batch.commit()
+    daily_ref = get_client().collection("stocks").document(symbol).collection("daily")
+    return [(daily_ref.document(row["Date"]), row) for row in data.to_dict(orient="records")]
+
+def _chunk_ref(symbol, year):
+    return get_client().collection("stocks").document(symbol).collection("yearly").document(str(year))
+
+def _columns_to_frame(dates, columns):
+    """
+    Builds the yfinance shaped DataFrame (Date index, OHLCV columns) straight from
+    column lists: the ISO date strings are parsed by numpy into a datetime64 index and
+    every column is converted once into its bar dtype (see ohlcv_cache.COLUMN_DTYPES),
+    without a list of row dicts or object columns in between.
+    """
+    index = pd.DatetimeIndex(np.array(dates, dtype="datetime64[D]").astype("datetime64[ns]"), name="Date")
+    df = pd.DataFrame({field: np.array(columns[field], dtype=COLUMN_DTYPES[field]) for field in BAR_FIELDS[1:]},
+                      index=index, copy=False)
+    if not index.is_monotonic_increasing:
+        df = df.sort_index()
+    return df
+
+def _chunk_to_frame(chunk):
+    """Builds the bars of one yearly chunk document as a DataFrame (Date index, OHLCV columns)."""
+    return _columns_to_frame(chunk.get("Date", []), {field: chunk.get(field, []) for field in BAR_FIELDS[1:]})
+
+def _frame_to_chunk(df, year):
+    df = df.sort_index()
+    chunk = {"year": year, "Date": df.index.strftime('%Y-%m-%d').tolist()}
+    for field in BAR_FIELDS[1:]:
+        chunk[field] = df[field].astype(float).tolist()
+    chunk["last_date"] = chunk["Date"][-1]
+    chunk["count"] = len(df)
+    return chunk
+
+def _chunk_writes(data, symbol, merge_existing=True):
+    """
+    Packs the bars into one columnar document per year. Bars are merged into the
+    existing chunk of that year (one read per touched year, normally only the current one).
+    """
+    data = data.reindex(columns=BAR_FIELDS[1:])
+    data.index = pd.DatetimeIndex(data.index)
+    writes = []
+    for year, bars in data.groupby(data.index.year):
+        doc = _chunk_ref(symbol, int(year))
+        if merge_existing:
+            existing = doc.get()
+            if existing.exists:
+                stored = _chunk_to_frame(existing.to_dict())
+                bars = pd.concat([stored[~stored.index.isin(bars.index)], bars])
+        writes.append((doc, _frame_to_chunk(bars, int(year))))
+    return writes
+
+def migrate_daily_to_yearly(symbols):
+    """
+    Migration tool: rewrites the stocks/{symbol}/daily documents of each symbol into
+    yearly chunks. Existing chunks are replaced and the daily documents are kept, so
+    the migration can be re-run and STOCKS_STORAGE_LAYOUT switched afterwards.
+    
+    Args:
+        symbols (list): The stock symbols to migrate.
+        
+    Returns:
+        dict: {symbol: number of bars migrated}
+    """
+    migrated = {}
+    for symbol in symbols:
+        df = _read_daily(symbol)
+        if df.empty:
+            print(f"No daily documents for {symbol}, skipping.")
+            continue
+        if bulk_write(_chunk_writes(df, symbol, merge_existing=False)):
+            print(f"Migration of {symbol} incomplete, re-run it.")
+            continue
+        migrated[symbol] = len(df)
+        print(f"Migrated {len(df)} bars of {symbol} into {df.index.year.nunique()} yearly chunks.")
+    return migrated
+
+def save_to_firestore(data, symbol):
+    """
+    Writes the bars of a symbol with the shared bulk writer.
+
+    Raises:
+        RuntimeError: When some bars could not be written.
+    """
+    print(f"Saving {len(data)} records to Firestore for {symbol}...")
+    failures = bulk_write(_bar_writes(data, symbol))
+    if failures:
+        raise RuntimeError(f"{len(failures)} writes of {symbol} failed")
     
 def yf_to_firestore(symbol):
     """
@@ -110,20 +262,9 @@ def yf_to_firestore(symbol):
         symbol (str): The stock symbol to fetch data for.
     """
     # Check the last available date in Firestore
-    collection_ref = db.collection("stocks").document(symbol).collection("daily")
-    docs = collection_ref.order_by("Date", direction=firestore.Query.DESCENDING).limit(1).stream()
-    
-    last_date = None
-    for doc in docs:
-        last_date = pd.to_datetime(doc.to_dict().get("Date"))
-        break  # Only need the first document
+    last_date = get_last_stored_date(symbol)
     
-    if last_date:
-        # If data exists, download data from the day after the last available date to today.
-        start_date = (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
-    else:
-        # If no data exists, download the last 1 year of data.
-        start_date = (pd.Timestamp.today() - pd.Timedelta(days=365)).strftime('%Y-%m-%d')
+    start_date = _download_start(last_date)
     
     end_date = pd.Timestamp.today().strftime('%Y-%m-%d')
     
@@ -142,15 +283,571 @@ def yf_to_firestore(symbol):
     
     if not data.empty:
         save_to_firestore(data, symbol)
+        cache.mark_stale(symbol)
+        invalidate_results()
         print(f"Data for {symbol} saved to Firestore.")
     else:
         print(f"No new data to save for {symbol}.")
 
-def get_data_from_firestore(symbol, dwnld_frm_yf=False, period="1y"):
+def _download_start(last_date):
+    if last_date:
+        # If data exists, download data from the day after the last available date to today.
+        return (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    # If no data exists, download the last 1 year of data.
+    return (pd.Timestamp.today() - pd.Timedelta(days=365)).strftime('%Y-%m-%d')
+
+def bulk_yf_to_firestore(segment, group_size=50, concurrency=16, resume=True):
+    """
+    Refreshes all symbols of a segment from Yahoo Finance into Firestore.
+
+    The watermark (last stored date) of every symbol is read concurrently on the async
+    client. Stale symbols sharing the same download start date are fetched together in
+    grouped multi-ticker yf.download calls. The groups run concurrently on the shared
+    download scheduler, which keeps all downloads under one rate limit, and each group
+    is written with the bulk writer.
+
+    Every finished group is recorded in a checkpoint (refresh-checkpoints/{segment}_{date}),
+    so a refresh that was interrupted resumes with the symbols it had not completed.
+    Symbols the grouped download returned no bars for are downloaded one by one to tell
+    "no new bars" from a swallowed error; only saved symbols and symbols confirmed to
+    have no new bars are checkpointed. Symbols whose download was still rate-limited
+    after all retries stay pending.
+    
+    Args:
+        segment (str): The segment passed to tickers_util.get_all_tickers.
+        group_size (int): Maximum number of symbols per yf.download call.
+        concurrency (int): Concurrent watermark reads.
+        resume (bool): Skip the symbols completed by an earlier run of today; False
+            starts over.
+        
+    Returns:
+        dict: Summary with the saved, up to date, resumed, pending and failed symbols
+        and the achieved downloads per minute.
+    """
+    tickers = get_all_tickers(segment)
+    end_date = pd.Timestamp.today().strftime('%Y-%m-%d')
+    checkpoint = RefreshCheckpoint(f"{segment}_{end_date}")
+    if not resume:
+        checkpoint.clear()
+    completed = checkpoint.load()
+    pending = [symbol for symbol in tickers if symbol not in completed]
+    if completed:
+        print(f"Resuming the refresh of {segment}: {len(tickers) - len(pending)} symbols already completed")
+
+    last_dates = get_last_stored_dates(pending, concurrency=concurrency)
+
+    groups = []
+    up_to_date = []
+    by_start = {}
+    for symbol in pending:
+        start_date = _download_start(last_dates[symbol])
+        if len(pd.bdate_range(start=start_date, end=end_date)) == 0:
+            up_to_date.append(symbol)
+            continue
+        by_start.setdefault(start_date, []).append(symbol)
+    for start_date, symbols in by_start.items():
+        groups += [(start_date, symbols[i:i + group_size]) for i in range(0, len(symbols), group_size)]
+    checkpoint.mark(up_to_date)
+    print(f"{len(pending) - len(up_to_date)}/{len(tickers)} symbols of {segment} are stale, "
+          f"{len(by_start)} distinct start dates")
+
+    def refresh_group(group):
+        start_date, chunk = group
+        try:
+            frames = scheduler.call(_download_multi, chunk, start=start_date, end=end_date, interval="1d")
+        except Exception as e:
+            print(f"Download of {len(chunk)} symbols from {start_date} failed: {e}")
+            return {"saved": [], "failed": {}, "pending": chunk, "writes": 0, "downloads": 0}
+        downloads = 1
+        failed = {}
+        pending = []
+        for symbol in [symbol for symbol in chunk if symbol not in frames]:
+            try:
+                df = scheduler.call(_confirm_history, symbol, start=start_date, end=end_date, interval="1d")
+            except Exception as e:
+                print(f"Download of {symbol} from {start_date} failed: {e}")
+                if _is_rate_limit(e):
+                    pending.append(symbol)
+                else:
+                    failed[symbol] = str(e)
+                continue
+            downloads += 1
+            if df.empty:
+                print(f"No new data to save for {symbol}.")
+            else:
+                frames[symbol] = df
+        writes = [write for symbol in chunk if symbol in frames for write in _bar_writes(frames[symbol], symbol)]
+        for path, message in bulk_write(writes).items():
+            # stocks/{symbol}/...
+            failed.setdefault(path.split("/")[1], message)
+        # Symbols confirmed to have no new data are done for today as well
+        checkpoint.mark([symbol for symbol in chunk if symbol not in failed and symbol not in pending])
+        return {"saved": [symbol for symbol in chunk if symbol in frames and symbol not in failed],
+                "failed": failed, "pending": pending, "writes": len(writes), "downloads": downloads}
+
+    started = time.perf_counter()
+    results = scheduler.map(refresh_group, groups)
+    elapsed = time.perf_counter() - started
+
+    saved = {symbol for result in results for symbol in result["saved"]}
+    saved = [symbol for symbol in tickers if symbol in saved]
+    failed = {symbol: message for result in results for symbol, message in result["failed"].items()}
+    still_pending = [symbol for result in results for symbol in result["pending"]]
+    writes = sum(result["writes"] for result in results)
+    downloads = sum(result["downloads"] for result in results)
+    for symbol in saved:
+        cache.mark_stale(symbol)
+    if saved:
+        invalidate_results()
+    summary = {
+        "segment": segment,
+        "saved": saved,
+        "upToDate": up_to_date,
+        "resumed": len(tickers) - len(pending),
+        "pending": still_pending,
+        "failed": failed,
+        "downloads": downloads,
+        "writes": writes,
+        "downloadsPerMinute": round(downloads / elapsed * 60, 2) if elapsed else 0.0,
+        "scheduler": scheduler.stats()
+    }
+    if not still_pending and not failed:
+        checkpoint.finish({key: summary[key] for key in ("downloads", "writes", "downloadsPerMinute")})
+    print(f"Bulk ingest of {segment}: {len(saved)} saved with {downloads} downloads "
+          f"({summary['downloadsPerMinute']} downloads/min) and {writes} bulk writes, {len(still_pending)} pending")
+    return summary
+
+def _records_to_frame(records):
+    """Builds the yfinance shaped DataFrame (Date index, OHLCV columns) from Firestore records."""
+    return _columns_to_frame([record["Date"] for record in records],
+                             {field: [record.get(field) for record in records] for field in BAR_FIELDS[1:]})
+
+def _history_query(symbol, since=None, after=None, client=None):
+    """
+    Builds the history query of a symbol ordered by Date and projected to the OHLCV fields.
+
+    Args:
+        symbol (str): The stock symbol.
+        since (pandas.Timestamp): Only bars on or after this date.
+        after (pandas.Timestamp): Only bars strictly after this date.
+        client: The Firestore client to query with (default: the shared sync client).
+    """
+    query = (client or get_client()).collection("stocks").document(symbol).collection("daily")
+    if since is not None:
+        query = query.where(filter=FieldFilter("Date", ">=", since.strftime('%Y-%m-%d')))
+    if after is not None:
+        query = query.where(filter=FieldFilter("Date", ">", after.strftime('%Y-%m-%d')))
+    return query.order_by("Date").select(BAR_FIELDS)
+
+def _period_start(period):
+    try:
+        return pd.Timestamp.today() - get_timedelta_from_period(period)
+    except ValueError as e:
+        print(f"Error parsing period: {e}")
+        return None
+
+def _read_daily(symbol, since=None, after=None):
+    with span("firestore_read"):
+        records = [doc.to_dict() for doc in _history_query(symbol, since=since, after=after).stream()]
+    increment("documents_read", len(records))
+    print(f"Read {len(records)} daily documents of {symbol} from Firestore")
+    with span("frame_build"):
+        return _records_to_frame(records)
+
+def _chunk_query(symbol, since=None, after=None, client=None):
+    """Builds the query of the yearly chunks of a symbol covering the bars since/after a date."""
+    query = (client or get_client()).collection("stocks").document(symbol).collection("yearly")
+    start = after if after is not None else since
+    if start is not None:
+        query = query.where(filter=FieldFilter("year", ">=", start.year))
+    return query.order_by("year")
+
+def _read_yearly(symbol, since=None, after=None):
+    with span("firestore_read"):
+        chunks = [doc.to_dict() for doc in _chunk_query(symbol, since=since, after=after).stream()]
+    increment("documents_read", len(chunks))
+    print(f"Read {len(chunks)} yearly chunks of {symbol} from Firestore")
+    if not chunks:
+        return _records_to_frame([])
+    with span("frame_build"):
+        # One frame from the concatenated chunk columns instead of a frame per chunk
+        df = _columns_to_frame([date for chunk in chunks for date in chunk["Date"]],
+                               {field: [value for chunk in chunks for value in chunk[field]]
+                                for field in BAR_FIELDS[1:]})
+    if since is not None:
+        df = df[df.index >= since.normalize()]
+    if after is not None:
+        df = df[df.index > after]
+    return df
+
+def read_history(symbol, since=None, after=None):
+    """
+    Reads the stored bars of a symbol in the configured STORAGE_LAYOUT.
+    
+    Args:
+        symbol (str): The stock symbol.
+        since (pandas.Timestamp): Only bars on or after this date.
+        after (pandas.Timestamp): Only bars strictly after this date.
+        
+    Returns:
+        pandas.DataFrame: Date index with OHLCV columns, sorted by date.
+    """
+    if STORAGE_LAYOUT == "yearly":
+        return _read_yearly(symbol, since=since, after=after)
+    return _read_daily(symbol, since=since, after=after)
+
+def get_last_stored_date(symbol):
+    """Returns the date of the newest stored bar of the symbol, reading a single document."""
+    if STORAGE_LAYOUT == "yearly":
+        collection_ref = get_client().collection("stocks").document(symbol).collection("yearly")
+        docs = collection_ref.order_by("year", direction=firestore.Query.DESCENDING).limit(1).select(["last_date"]).stream()
+        for doc in docs:
+            return pd.to_datetime(doc.to_dict().get("last_date"))
+        return None
+    collection_ref = get_client().collection("stocks").document(symbol).collection("daily")
+    docs = collection_ref.order_by("Date", direction=firestore.Query.DESCENDING).limit(1).select(["Date"]).stream()
+    for doc in docs:
+        return pd.to_datetime(doc.to_dict().get("Date"))
+    return None
+
+async def _last_stored_date_async(symbol):
+    client = get_async_client()
+    if STORAGE_LAYOUT == "yearly":
+        query = (client.collection("stocks").document(symbol).collection("yearly")
+                 .order_by("year", direction=firestore.Query.DESCENDING).limit(1).select(["last_date"]))
+        field = "last_date"
+    else:
+        query = (client.collection("stocks").document(symbol).collection("daily")
+                 .order_by("Date", direction=firestore.Query.DESCENDING).limit(1).select(["Date"]))
+        field = "Date"
+    async for doc in query.stream():
+        return pd.to_datetime(doc.to_dict().get(field))
+    return None
+
+def get_last_stored_dates(symbols, concurrency=16):
+    """
+    Returns {symbol: date of the newest stored bar or None} for many symbols. The
+    single-document queries run on the async client with `concurrency` in flight, so
+    the round-trips of a whole segment overlap.
+    """
+    dates = run_async(gather_bounded((_last_stored_date_async(symbol) for symbol in symbols), concurrency))
+    return dict(zip(symbols, dates))
+
+def _refresh_if_stale(symbol, last_date):
+    last_working_day = (pd.Timestamp.today() - pd.tseries.offsets.BDay(1)).normalize()
+    if last_date is None or last_date < last_working_day:
+        print("Data not available until last working day. Updating Firestore data...")
+        yf_to_firestore(symbol)
+
+def _cached_bars(symbol, since):
+    """Returns (cached bars or None, fresh) of a symbol whose cache reaches back to `since`."""
+    with span("cache_load"):
+        cached = cache.load(symbol)
+    if cached is not None and not cache.covers(symbol, since):
+        cached = None
+    fresh = cached is not None and cache.is_fresh(symbol)
+    increment("cache_hits" if fresh else "cache_misses")
+    return cached, fresh
+
+def _update_cache(symbol, cached, new_bars, since):
+    """Stores the bars read on a cache miss (or appends them to the stale entry) and returns the full history."""
+    if cached is None:
+        if not new_bars.empty:
+            cache.store(symbol, new_bars, since=since)
+        return new_bars
+    return cache.append(symbol, new_bars)
+
+def get_cached_history(symbol, dwnld_frm_yf=False, since=None):
+    """
+    Returns the stored history of a symbol through the local OHLCV cache.
+
+    On a fresh cache hit no Firestore documents are read. Otherwise only the documents
+    after the cached watermark are fetched and appended to the cache.
+    
+    Args:
+        symbol (str): The stock symbol to fetch data for.
+        dwnld_frm_yf (bool): Update Firestore from Yahoo Finance first when the stored
+            data does not reach the last working day.
+        since (pandas.Timestamp): Oldest bar the caller needs. A cache that does not
+            reach back that far is refilled from this date.
+        
+    Returns:
+        pandas.DataFrame: DataFrame containing the cached historical data.
+    """
+    cached, fresh = _cached_bars(symbol, since)
+    if fresh:
+        return cached
+
+    if dwnld_frm_yf:
+        _refresh_if_stale(symbol, cached.index.max() if cached is not None else get_last_stored_date(symbol))
+
+    print(f"Cache miss for {symbol}")
+    if cached is not None:
+        new_bars = read_history(symbol, after=cache.watermark(symbol))
+    else:
+        new_bars = read_history(symbol, since=since)
+    return _update_cache(symbol, cached, new_bars, since)
+
+async def _read_bars_async(symbol, since=None, after=None):
+    """Raw bar documents of a symbol on the async client: daily records or yearly chunks."""
+    client = get_async_client()
+    if STORAGE_LAYOUT == "yearly":
+        query = _chunk_query(symbol, since=since, after=after, client=client)
+    else:
+        query = _history_query(symbol, since=since, after=after, client=client)
+    return [doc.to_dict() async for doc in query.stream()]
+
+def read_histories_long(ranges, concurrency=16):
+    """
+    Reads the stored bars of many symbols concurrently into one long-format DataFrame.
+
+    The queries run on the async client with at most `concurrency` in flight. The bars
+    of all symbols are collected into flat columns and the dates are parsed once for
+    the whole frame, instead of once per symbol.
+
+    Args:
+        ranges (dict): {symbol: (since, after)} with the bounds of read_history.
+        concurrency (int): Maximum number of queries in flight.
+
+    Returns:
+        pandas.DataFrame: Columns symbol (categorical), Date and OHLCV, sorted by
+        symbol and Date (see split_long).
+    """
+    symbols = list(ranges)
+    with span("firestore_read"):
+        documents = run_async(gather_bounded(
+            (_read_bars_async(symbol, *ranges[symbol]) for symbol in symbols), concurrency))
+    increment("documents_read", sum(len(docs) for docs in documents))
+
+    with span("frame_build"):
+        columns = {field: [] for field in BAR_FIELDS}
+        symbol_column = []
+        for symbol, docs in zip(symbols, documents):
+            if STORAGE_LAYOUT == "yearly":
+                for chunk in docs:
+                    for field in BAR_FIELDS:
+                        columns[field].extend(chunk.get(field, []))
+                    symbol_column.extend([symbol] * len(chunk["Date"]))
+            else:
+                for record in docs:
+                    for field in BAR_FIELDS:
+                        columns[field].append(record.get(field))
+                symbol_column.extend([symbol] * len(docs))
+        long = pd.DataFrame({
+            "symbol": pd.Categorical(symbol_column, categories=symbols),
+            "Date": np.array(columns["Date"], dtype="datetime64[D]").astype("datetime64[ns]"),
+            **{field: np.array(columns[field], dtype=COLUMN_DTYPES[field]) for field in BAR_FIELDS[1:]},
+        }, copy=False)
+        if STORAGE_LAYOUT == "yearly" and len(long):
+            # Chunks hold whole years; apply the exact bounds in one vectorized pass
+            since = long["symbol"].map({symbol: bounds[0] for symbol, bounds in ranges.items()}).astype("datetime64[ns]")
+            after = long["symbol"].map({symbol: bounds[1] for symbol, bounds in ranges.items()}).astype("datetime64[ns]")
+            keep = ~(long["Date"] < since.dt.normalize()) & ~(long["Date"] <= after)
+            long = long[keep.to_numpy()]
+        return long.sort_values(["symbol", "Date"], kind="stable").reset_index(drop=True)
+
+def split_long(long):
+    """
+    Splits a long-format frame of read_histories_long into {symbol: DataFrame} in the
+    format of read_history (Date index, OHLCV columns). Every symbol of the categorical
+    is returned, with an empty frame when it has no bars.
+    """
+    codes = long["symbol"].cat.codes.to_numpy()
+    bounds = np.searchsorted(codes, np.arange(len(long["symbol"].cat.categories) + 1))
+    bars = long.set_index("Date")[BAR_FIELDS[1:]]
+    return {symbol: bars.iloc[bounds[i]:bounds[i + 1]]
+            for i, symbol in enumerate(long["symbol"].cat.categories)}
+
+def load_histories(symbols, period="1y", concurrency=16, use_cache=True):
+    """
+    Bulk counterpart of get_data_from_firestore for many symbols.
+
+    Fresh cache entries are used as is. The histories of all other symbols (or only
+    their bars after the cached watermark) are read concurrently with
+    read_histories_long and split into per-symbol frames whose dates are already
+    parsed, then written back to the cache. Firestore is not refreshed from Yahoo
+    Finance here.
+    
+    Args:
+        symbols (list): The stock symbols to load.
+        period (str): Period as a string (e.g., '1y', '30d') to filter the data.
+        concurrency (int): Maximum number of Firestore queries in flight.
+        use_cache (bool): Read through the local OHLCV cache.
+        
+    Returns:
+        dict: {symbol: DataFrame} in the order of `symbols`; symbols without stored
+        bars map to an empty frame.
+    """
+    since = _period_start(period)
+    frames = {}
+    stale = {}
+    ranges = {}
+    for symbol in symbols:
+        if use_cache:
+            cached, fresh = _cached_bars(symbol, since)
+            if fresh:
+                frames[symbol] = cached
+                continue
+            if cached is not None:
+                stale[symbol] = cached
+                ranges[symbol] = (None, cache.watermark(symbol))
+                continue
+        ranges[symbol] = (since, None)
+
+    if ranges:
+        print(f"Bulk loading {len(ranges)}/{len(symbols)} histories from Firestore")
+        for symbol, new_bars in split_long(read_histories_long(ranges, concurrency=concurrency)).items():
+            frames[symbol] = _update_cache(symbol, stale.get(symbol), new_bars, since) if use_cache else new_bars
+
+    if since is None:
+        return {symbol: frames[symbol] for symbol in symbols}
+    # The range query works on whole days; trim to the exact threshold like get_data_from_firestore.
+    return {symbol: frames[symbol][frames[symbol].index >= since] for symbol in symbols}
+
+def load_new_bars(watermarks, concurrency=16):
+    """
+    Reads only the bars after a per-symbol watermark, e.g. the last date an incremental
+    state has seen, with the concurrent range queries of read_histories_long. The local
+    cache is bypassed.
+
+    Args:
+        watermarks (dict): {symbol: pandas.Timestamp of the last bar already processed}.
+        concurrency (int): Maximum number of Firestore queries in flight.
+
+    Returns:
+        dict: {symbol: DataFrame} of the newer bars (empty frame when there are none).
+    """
+    if not watermarks:
+        return {}
+    return split_long(read_histories_long({symbol: (None, after) for symbol, after in watermarks.items()},
+                                          concurrency=concurrency))
+
+def backfill_histories(frames, period, group_size=50, tolerance_days=7):
+    """
+    Extends loaded histories that start later than the period with older bars from
+    Yahoo Finance, and stores those bars so the next load has them. Ingestion only
+    downloads the last 365 days of a new symbol (see _download_start), so a longer
+    period, e.g. the 5 years of a portfolio backtest, needs this once per symbol.
+
+    Args:
+        frames (dict): {symbol: DataFrame} as returned by load_histories; updated in place.
+        period (str): The period the histories should cover.
+        group_size (int): Maximum number of symbols per yf.download call.
+        tolerance_days (int): Histories starting at most this long after the period
+            start (weekends, holidays) are complete.
+
+    A symbol listed after the period start stays short however often it is backfilled,
+    so the earliest date Yahoo Finance has for it is kept as `history_start` on
+    stocks/{symbol}; symbols whose stored bars already reach it are not downloaded again.
+
+    Returns:
+        dict: The frames. Symbols listed after the period start keep their history.
+    """
+    since = _period_start(period)
+    if since is None:
+        return frames
+    short = {symbol: (df.index.min() if not df.empty else None) for symbol, df in frames.items()
+             if df.empty or df.index.min() > since + pd.Timedelta(days=tolerance_days)}
+    if short:
+        markers = get_documents("stocks", list(short), field_paths=["history_start"])
+        for symbol, marker in markers.items():
+            history_start = (marker or {}).get("history_start")
+            if history_start and short[symbol] is not None and pd.Timestamp(history_start) <= short[symbol]:
+                del short[symbol]
+    symbols = list(short)
+    history_starts = {}
+    for i in range(0, len(symbols), group_size):
+        group = symbols[i:i + group_size]
+        firsts = [short[symbol] for symbol in group if short[symbol] is not None]
+        end = (max(firsts) if len(firsts) == len(group) else pd.Timestamp.today()) + pd.Timedelta(days=1)
+        print(f"Backfilling {len(group)} symbols from {since:%Y-%m-%d}")
+        downloaded = get_data_multi(group, start=since.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'))
+        for symbol in group:
+            older = downloaded.get(symbol)
+            if older is None:
+                continue
+            if short[symbol] is not None:
+                older = older[older.index < short[symbol]]
+            older = older.dropna(subset=["close"]).reindex(columns=BAR_FIELDS[1:]).astype(COLUMN_DTYPES)
+            # Everything from the period start was asked for, so nothing older exists
+            if older.empty:
+                if short[symbol] is not None:
+                    history_starts[symbol] = short[symbol]
+                continue
+            try:
+                save_to_firestore(older.copy(), symbol)
+                history_starts[symbol] = older.index.min()
+            except Exception as e:
+                print(f"Error storing the backfill of {symbol}: {e}")
+            cache.invalidate(symbol)
+            frames[symbol] = pd.concat([older, frames[symbol]]) if not frames[symbol].empty else older
+    stocks_ref = get_client().collection("stocks")
+    bulk_write(((stocks_ref.document(symbol), {"history_start": first.strftime('%Y-%m-%d')})
+                for symbol, first in history_starts.items()), merge=True)
+    return frames
+
+def iter_histories(symbols, period="1y", block_size=100, concurrency=16, memory_budget_mb=None):
+    """
+    Yields (symbol, DataFrame) for all symbols, bulk loading them in blocks of
+    `block_size` with load_histories. The next block is read in the background while
+    the caller works on the current one, so computation starts after the first block
+    and overlaps the remaining Firestore I/O.
+
+    With a memory budget (default MEMORY_BUDGET_MB, 0 disables it) the bar data held
+    at a time stays bounded: the block size shrinks so that the current and the
+    prefetched block fit the budget (measured on the loaded frames), every frame is
+    dropped by the loader as soon as it is yielded, and a garbage collection after each
+    block returns the memory of the finished symbols (backtrader feeds and strategies
+    hold reference cycles).
+
+    A block that fails to load yields None for each of its symbols, so the caller
+    loads them one by one (backtest and _advance_state do when no frame is passed)
+    inside its per-symbol error handling.
+    """
+    budget_mb = MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    symbols = list(symbols)
+    position = 0
+
+    def next_block():
+        nonlocal position
+        block = symbols[position:position + block_size]
+        position += len(block)
+        return block
+
+    def submit(block):
+        # Run in a copy of the caller's context, so the spans and counters of the load
+        # are recorded in the caller's run_metrics
+        return executor.submit(contextvars.copy_context().run, load_histories, block, period, concurrency)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        block = next_block()
+        future = submit(block) if block else None
+        while future is not None:
+            try:
+                frames = future.result()
+            except Exception as e:
+                print(f"Error bulk loading {len(block)} symbols: {e}")
+                increment("bulk_load_failures")
+                frames = dict.fromkeys(block)
+            if budget_mb:
+                sizes = [df.memory_usage(index=True).sum() for df in frames.values() if df is not None]
+                if sizes:
+                    per_symbol = sum(sizes) / len(sizes)
+                    block_size = max(1, min(block_size, int(budget_mb * 1024 * 1024 / 2 / max(per_symbol, 1))))
+            block = next_block()
+            future = submit(block) if block else None
+            for symbol in list(frames):
+                yield symbol, frames.pop(symbol)
+            if budget_mb:
+                gc.collect()
+
+def get_data_from_firestore(symbol, dwnld_frm_yf=False, period="1y", use_cache=True):
     """
     Fetches historical data for a given stock symbol from Firestore and returns it as a
     DataFrame in the same format as yfinance.download (Date as index with columns: open, high, low, close, volume).
-    The data is filtered to retain only records within the specified period relative to today.
+    Only records within the specified period relative to today are read, using a range
+    query on the ordered Date field projected to the OHLCV fields (or the yearly chunks
+    covering the period when STOCKS_STORAGE_LAYOUT is "yearly").
     
     Additionally, if the stored data is not updated until the last working day, it calls yf_to_firestore to
     update Firestore.
@@ -158,63 +855,24 @@ def get_data_from_firestore(symbol, dwnld_frm_yf=False, period="1y"):
     Args:
         symbol (str): The stock symbol to fetch data for.
         period (str): Period as a string (e.g., '1y', '6mo', '30d') to filter the data.
+        use_cache (bool): Read through the local OHLCV cache (see get_cached_history).
         
     Returns:
         pandas.DataFrame: DataFrame containing the filtered historical data.
     """
-    collection_ref = db.collection("stocks").document(symbol).collection("daily")
-    docs = collection_ref.stream()
-    
-    records = []
-    for doc in docs:
-        records.append(doc.to_dict())
-    
-    df = pd.DataFrame(records)
-
-    if dwnld_frm_yf:
-        # If no data exists in Firestore, update Firestore.
-        if df.empty:
-            yf_to_firestore(symbol)
-            docs = collection_ref.stream()
-            records = [doc.to_dict() for doc in docs]
-            df = pd.DataFrame(records)
-            if df.empty:
-                return df
+    since = _period_start(period)
+    if use_cache:
+        df = get_cached_history(symbol, dwnld_frm_yf, since=since)
+    else:
+        if dwnld_frm_yf:
+            # Staleness check reads only the newest document.
+            _refresh_if_stale(symbol, get_last_stored_date(symbol))
+        df = read_history(symbol, since=since)
 
-        # Convert 'Date' back to datetime and set as index.
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        df.sort_index(inplace=True)
-        
-        # Determine the last working day using business day offset.
-        last_working_day = (pd.Timestamp.today() - pd.tseries.offsets.BDay(1)).normalize()
-        if df.index.max() < last_working_day:
-            print("Data not available until last working day. Updating Firestore data...")
-            yf_to_firestore(symbol)
-            docs = collection_ref.stream()
-            records = [doc.to_dict() for doc in docs]
-            df = pd.DataFrame(records)
-            if df.empty:
-                return df
-            
-    df['Date'] = pd.to_datetime(df['Date'])
-    df.set_index('Date', inplace=True)
-    df.sort_index(inplace=True)
-        
-    # Ensure the DataFrame has the same columns as yfinance returns.
-    desired_columns = ["open", "high", "low", "close", "volume"]
-    df = df.reindex(columns=desired_columns)
-    
-    # Filter data based on the specified period.
-    try:
-        delta = get_timedelta_from_period(period)
-    except ValueError as e:
-        print(f"Error parsing period: {e}")
+    if since is None:
         return df
-    threshold_date = pd.Timestamp.today() - delta
-    df = df[df.index >= threshold_date]
-    
-    return df
+    # The range query works on whole days; trim to the exact threshold like before.
+    return df[df.index >= since]
 
 if __name__ == "__main__":
     
@@ -0,0 +1,42 @@
+"""
+Shared setup of the test suite: the app modules in functions/ run against the
+in-memory Firestore of the benchmarks, so no credentials or network are needed.
+
+Run from the repository root:
+  python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from run_benchmarks import setup_backend, synthetic_history  # noqa: E402
+
+store = setup_backend("memory")
+
+
+@pytest.fixture
+def memory_store():
+    """The in-memory Firestore, emptied before the test together with the local OHLCV cache."""
+    from ohlcv_cache import cache
+
+    store._collections.clear()
+    store.reset_counters()
+    cache.invalidate()
+    return store
+
+
+@pytest.fixture
+def synthetic_frames():
+    """Seeded daily histories of 6 symbols, of different lengths like real listings."""
+    return {f"S{i}.NS": synthetic_history(i, bars=400 - 40 * i) for i in range(6)}
+
+
+def rounded_history(symbol_index, bars=300, decimals=2):
+    """A synthetic history with prices rounded like exchange ticks."""
+    return synthetic_history(symbol_index, bars=bars).round({"open": decimals, "high": decimals,
+                                                               "low": decimals, "close": decimals})
+
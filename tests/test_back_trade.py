@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+
+import back_trade
+import cloud_storage_util
+from conftest import synthetic_history
+
+
+@pytest.fixture
+def plot_backend(memory_store, monkeypatch):
+    """back_trade on synthetic data, with the Storage uploads recorded instead of sent."""
+    uploads = {}
+    monkeypatch.setattr(back_trade, "get_data", lambda symbol: synthetic_history(0, bars=300))
+    monkeypatch.setattr(back_trade, "_plots_uploaded", set())
+    monkeypatch.setattr(cloud_storage_util, "file_exists", lambda path: path in uploads)
+    monkeypatch.setattr(cloud_storage_util, "upload_bytes",
+                        lambda path, content, content_type: uploads.__setitem__(path, content))
+    return uploads
+
+
+def _requests(store):
+    return [doc.to_dict() for doc in store.collection(back_trade.PLOT_REQUESTS).stream()]
+
+
+def test_plot_is_requested_once_and_rendered_by_the_worker(plot_backend, memory_store):
+    first = back_trade.backtest("S0.NS")
+    second = back_trade.backtest("S0.NS")
+    assert first["plot_status"] == second["plot_status"] == "queued"
+    assert first["plot_url"].endswith("?alt=media")
+    assert plot_backend == {}
+
+    (request,) = _requests(memory_store)
+    back_trade.render_plot(request["symbol"], request["path"])
+
+    assert plot_backend[request["path"]].startswith(b"\x89PNG")
+    assert _requests(memory_store)[0]["status"] == "done"
+    assert back_trade.backtest("S0.NS")["plot_status"] == "cached"
+
+
+def test_without_a_bucket_the_result_has_no_plot(plot_backend, memory_store, monkeypatch):
+    monkeypatch.setattr(cloud_storage_util, "bucket", None)
+
+    result = back_trade.backtest("S0.NS")
+
+    assert "plot_url" not in result and "profit_loss" in result
+    assert _requests(memory_store) == []
+
+
+def test_failed_and_stale_requests_are_requested_again(plot_backend, memory_store, monkeypatch):
+    back_trade.backtest("S0.NS")
+    (request,) = _requests(memory_store)
+    monkeypatch.setattr(back_trade, "_render_plot", lambda cerebro, path: 1 / 0)
+    back_trade.render_plot(request["symbol"], request["path"])
+    assert _requests(memory_store)[0]["status"] == "error"
+
+    assert back_trade.backtest("S0.NS")["plot_status"] == "queued"
+    (retried,) = _requests(memory_store)
+    assert retried["status"] == "pending" and retried["attempts"] == 2
+
+    # Pending within PLOT_TIMEOUT: the trigger is still on it
+    back_trade.backtest("S0.NS")
+    assert _requests(memory_store)[0]["attempts"] == 2
+
+    old = (datetime.datetime.now() - back_trade.PLOT_TIMEOUT * 2).isoformat()
+    ref = memory_store.collection(back_trade.PLOT_REQUESTS).document(back_trade._plot_request_id(request["path"]))
+    ref.update({"requestedAt": old})
+    back_trade.backtest("S0.NS")
+    assert _requests(memory_store)[0]["attempts"] == 3
@@ -0,0 +1,24 @@
+import numpy as np
+
+import tradesignals
+from conftest import synthetic_history
+from yf_to_firestore import get_data_from_firestore, save_to_firestore
+
+PRICES = ["open", "high", "low", "close"]
+
+
+def test_loaded_bars_and_signals_match_the_float64_source(memory_store):
+    # Exchange tick prices in the thousands (e.g. 2911.71) must come back unchanged
+    df = synthetic_history(1, bars=400)
+    df[PRICES] = (df[PRICES] * 30).round(2)
+    save_to_firestore(df.copy(), "S1.NS")
+
+    for _ in range(2):  # Firestore, then the local cache
+        loaded = get_data_from_firestore("S1.NS")
+        assert (loaded.dtypes == np.float64).all()
+        assert np.array_equal(loaded[PRICES].to_numpy(), df.loc[loaded.index, PRICES].to_numpy())
+
+    for strategy in (tradesignals.MovingAverageCrossoverStrategy, tradesignals.MeanReversionStrategy):
+        expected = tradesignals.backtest("S1.NS", chk_last_weeks=53, strategy=strategy, df=df.loc[loaded.index])
+        assert expected
+        assert tradesignals.backtest("S1.NS", chk_last_weeks=53, strategy=strategy) == expected
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+import yf_to_firestore
+from conftest import synthetic_history
+from download_scheduler import DownloadScheduler, RefreshCheckpoint
+from yf_to_firestore import bulk_yf_to_firestore, save_to_firestore
+
+SYMBOLS = ["A.NS", "B.NS", "LIMITED.NS", "QUIET.NS", "BROKEN.NS"]
+
+
+class YFRateLimitError(Exception):
+    pass
+
+
+class YFPricesMissingError(Exception):
+    pass
+
+
+class FakeTicker:
+    """Ticker.history with raise_errors: the outcomes yf.download hid for the missing symbols."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def history(self, start=None, end=None, interval="1d", raise_errors=False):
+        assert raise_errors
+        if self.symbol == "LIMITED.NS":
+            raise YFRateLimitError("Too Many Requests. Rate limited. Try after a while.")
+        if self.symbol == "QUIET.NS":
+            raise YFPricesMissingError(f"{self.symbol}: possibly delisted; no price data found")
+        raise RuntimeError("Expecting value: line 1 column 1 (char 0)")
+
+
+def fake_download(symbols, start=None, end=None, **kwargs):
+    """Grouped yf.download: only A and B come back, the errors of the others are swallowed."""
+    index = pd.bdate_range(start=start, end=pd.Timestamp(end) - pd.Timedelta(days=1), name="Date")
+    frames = {symbol: synthetic_history(i, bars=len(index)).set_axis(index).rename(columns=str.capitalize)
+              for i, symbol in enumerate(["A.NS", "B.NS"])}
+    return pd.concat(frames, axis=1)
+
+
+@pytest.fixture
+def stale_segment(memory_store, monkeypatch):
+    for i, symbol in enumerate(SYMBOLS):
+        save_to_firestore(synthetic_history(i, bars=30).iloc[:-5].copy(), symbol)
+    monkeypatch.setattr(yf_to_firestore, "get_all_tickers", lambda segment: list(SYMBOLS))
+    monkeypatch.setattr(yf_to_firestore.yf, "download", fake_download)
+    monkeypatch.setattr(yf_to_firestore.yf, "Ticker", FakeTicker)
+    monkeypatch.setattr(yf_to_firestore, "scheduler", DownloadScheduler(rate_per_minute=6000, burst=100,
+                                                                        max_attempts=1))
+
+
+def test_swallowed_download_errors_are_not_checkpointed(stale_segment):
+    summary = bulk_yf_to_firestore("test")
+
+    assert summary["saved"] == ["A.NS", "B.NS"]
+    assert summary["pending"] == ["LIMITED.NS"]
+    assert list(summary["failed"]) == ["BROKEN.NS"]
+    completed = RefreshCheckpoint(f"test_{pd.Timestamp.today():%Y-%m-%d}").load()
+    assert completed == {"A.NS", "B.NS", "QUIET.NS"}
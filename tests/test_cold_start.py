@@ -0,0 +1,9 @@
+from import_profile import profile
+
+
+def test_light_route_does_not_load_heavy_modules():
+    # main is imported in a fresh interpreter, like on a cold start
+    report = profile("/")
+
+    assert report["status"] == 200
+    assert report["heavyModulesLoaded"] == []
@@ -0,0 +1,41 @@
+import incremental_signals
+from conftest import synthetic_history
+from yf_to_firestore import save_to_firestore
+
+
+def test_existing_states_only_read_the_new_bars(memory_store):
+    symbols = [f"S{i}.NS" for i in range(4)]
+    histories = {symbol: synthetic_history(i, bars=300) for i, symbol in enumerate(symbols)}
+    for symbol, df in histories.items():
+        save_to_firestore(df.iloc[:-10].copy(), symbol)
+    for strategy in incremental_signals.INCREMENTAL_STRATEGIES:
+        incremental_signals.incremental_scan(symbols, strategy=strategy)
+
+    for symbol, df in histories.items():
+        save_to_firestore(df.iloc[-10:].copy(), symbol)
+    for strategy in incremental_signals.INCREMENTAL_STRATEGIES:
+        memory_store.reset_counters()
+        signals = incremental_signals.incremental_scan(symbols, strategy=strategy, chk_last_weeks=60)
+        # One state document and the 10 new bars per symbol
+        assert memory_store.reads == len(symbols) * 11
+
+        for symbol in symbols:
+            state = incremental_signals.load_state(strategy, symbol)
+            assert state["last_date"] == histories[symbol].index[-1].strftime("%Y-%m-%d")
+            assert signals[symbol] == incremental_signals.recent_signals(state, 60)
+            # Same signals as a full recompute over the bars the state has seen
+            assert incremental_signals.verify_symbol(symbol, strategy)[0], symbol
+
+
+def test_evaluate_symbol_advances_from_the_new_bars(memory_store):
+    df = synthetic_history(7, bars=300)
+    save_to_firestore(df.iloc[:-5].copy(), "S7.NS")
+    incremental_signals.evaluate_symbol("S7.NS")
+    save_to_firestore(df.iloc[-5:].copy(), "S7.NS")
+
+    memory_store.reset_counters()
+    incremental_signals.evaluate_symbol("S7.NS")
+    assert memory_store.reads == 1 + 5
+    state = incremental_signals.load_state("MovingAverageCrossoverStrategy", "S7.NS")
+    assert state["last_date"] == df.index[-1].strftime("%Y-%m-%d")
+    assert incremental_signals.verify_symbol("S7.NS")[0]
@@ -0,0 +1,41 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import intraday_bars
+
+
+def _bars(index):
+    rng = np.random.default_rng(0)
+    close = 100 + rng.normal(0, 1, len(index)).cumsum()
+    return pd.DataFrame({"open": close, "high": close + 1, "low": close - 1, "close": close,
+                         "volume": np.full(len(index), 1000.0)}, index=index)
+
+
+def test_daily_bins_are_calendar_days_without_warnings():
+    sessions = [pd.date_range(f"2026-10-{day} 09:15", periods=75, freq="5min") for day in (12, 13, 15)]
+    df = _bars(sessions[0].append(sessions[1]).append(sessions[2]))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        daily = intraday_bars.resample_bars(df, "1d")
+        hourly = intraday_bars.resample_bars(df, "1h")
+
+    assert list(daily.index) == [pd.Timestamp(f"2026-10-{day}") for day in (12, 13, 15)]
+    assert daily["volume"].tolist() == [75000.0] * 3
+    assert hourly.index[0] == pd.Timestamp("2026-10-12 09:15")
+
+
+def test_period_cutoff_is_taken_in_exchange_time(memory_store):
+    now = intraday_bars._exchange_now()
+    index = pd.date_range(end=now.floor("5min"), periods=12 * 36, freq="5min")
+    intraday_bars.save_intraday(_bars(index), "S0.NS", interval=intraday_bars.INTRADAY_BASE_INTERVAL)
+
+    df = intraday_bars.get_intraday_from_firestore("S0.NS", interval=intraday_bars.INTRADAY_BASE_INTERVAL,
+                                                   period="1d")
+
+    assert df.index.max() == index[-1]
+    # A cutoff on the server's UTC clock would reach 5:30 hours further back
+    assert df.index.min() >= now - pd.Timedelta(days=1) - pd.Timedelta(minutes=5)
+    assert df.index.min() <= now - pd.Timedelta(hours=23)
@@ -0,0 +1,43 @@
+import pytest
+
+import tradesignals
+import yf_to_firestore
+from conftest import synthetic_history
+from metrics import run_metrics
+from yf_to_firestore import iter_histories, save_to_firestore
+
+SYMBOLS = [f"S{i}.NS" for i in range(5)]
+
+
+@pytest.fixture
+def stored_histories(memory_store):
+    for i, symbol in enumerate(SYMBOLS):
+        save_to_firestore(synthetic_history(i, bars=200), symbol)
+    memory_store.reset_counters()
+
+
+def test_prefetched_loads_are_counted_in_the_callers_run(stored_histories):
+    with run_metrics() as run:
+        loaded = dict(iter_histories(SYMBOLS, block_size=2))
+
+    assert sorted(loaded) == SYMBOLS
+    summary = run.summary()
+    assert summary["counters"]["cache_misses"] == len(SYMBOLS)
+    assert "firestore_read" in summary["stages"]
+
+
+def test_failed_block_falls_back_to_per_symbol_loads(stored_histories, monkeypatch):
+    load_histories = yf_to_firestore.load_histories
+
+    def failing_first_block(symbols, *args):
+        if "S0.NS" in symbols:
+            raise RuntimeError("deadline exceeded")
+        return load_histories(symbols, *args)
+
+    monkeypatch.setattr(yf_to_firestore, "load_histories", failing_first_block)
+    loaded = dict(iter_histories(SYMBOLS, block_size=2))
+    assert loaded["S0.NS"] is None and loaded["S1.NS"] is None
+    assert all(loaded[symbol] is not None for symbol in SYMBOLS[2:])
+
+    results, errors, _, _ = tradesignals._run_symbols(SYMBOLS, chk_last_weeks=53)
+    assert sorted(results) == SYMBOLS and errors == {}
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import KNeighborsClassifier
+
+from tradingstrategies.KNNMovingAverageCrossoverStrategy import knn_predict, walk_forward_predictions
+
+
+def tied_features(seed, rows):
+    """[close, sma_short, sma_long] of a rounded random walk: many equally distant neighbours."""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.choice([-1, 0, 1], rows)) * 0.5, 1)
+    sma_short = np.round(np.convolve(close, np.ones(5) / 5, "same"), 0)
+    sma_long = np.round(np.convolve(close, np.ones(10) / 10, "same"), 0)
+    return np.column_stack([close, sma_short, sma_long])
+
+
+def sklearn_predict(train_X, train_y, query, n_neighbors):
+    return KNeighborsClassifier(n_neighbors=n_neighbors).fit(train_X, train_y).predict([query])[0]
+
+
+def test_knn_predict_matches_sklearn_on_tied_data():
+    for seed in range(350):
+        X = tied_features(seed, 51)
+        y = np.sign(np.diff(X[:, 0]))
+        assert knn_predict(X[:-1], y, X[-1], 5) == sklearn_predict(X[:-1], y, X[-1], 5), seed
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_walk_forward_predictions_match_a_refit_per_row(seed):
+    window, n_neighbors = 30, 5
+    features = tied_features(seed, 200)
+    predictions = walk_forward_predictions(features, window, n_neighbors)
+
+    assert np.isnan(predictions[:window]).all()
+    for row in range(window, len(features)):
+        X = features[row - window + 1:row + 1]
+        y = np.sign(np.diff(X[:, 0]))
+        assert predictions[row] == sklearn_predict(X[:-1], y, X[-1], n_neighbors), row
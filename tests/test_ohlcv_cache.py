@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+from conftest import synthetic_history
+from ohlcv_cache import OHLCVCache
+
+
+def _store_symbols(cache_dir, worker, count):
+    cache = OHLCVCache(cache_dir=cache_dir, max_mb=64)
+    for i in range(count):
+        cache.store(f"W{worker}S{i}.NS", synthetic_history(i, bars=50))
+
+
+def test_processes_sharing_the_cache_keep_all_entries(tmp_path):
+    cache_dir = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_store_symbols, args=(cache_dir, worker, 20)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = OHLCVCache(cache_dir=cache_dir, max_mb=64)
+    assert cache.stats()["symbols"] == 80
+    assert len([name for name in os.listdir(cache_dir) if name.endswith(".npy")]) == 80
+    assert cache.load("W3S19.NS") is not None
+
+
+def test_entries_of_other_instances_are_visible_and_evicted_within_bound(tmp_path):
+    first = OHLCVCache(cache_dir=str(tmp_path), max_mb=64)
+    second = OHLCVCache(cache_dir=str(tmp_path), max_mb=64)
+    first.store("A.NS", synthetic_history(1, bars=50))
+    second.store("B.NS", synthetic_history(2, bars=50))
+    assert first.watermark("B.NS") is not None
+    assert second.watermark("A.NS") is not None
+
+    # An orphaned file (no index entry) is dropped on the next store
+    open(os.path.join(str(tmp_path), "C.NS.npy"), "wb").close()
+    bytes_per_symbol = first.stats()["bytes"] // 2
+    small = OHLCVCache(cache_dir=str(tmp_path), max_mb=bytes_per_symbol * 2.5 / 1024 / 1024)
+    small.store("D.NS", synthetic_history(3, bars=50))
+    assert not os.path.exists(os.path.join(str(tmp_path), "C.NS.npy"))
+    assert small.stats()["symbols"] == 2
+    assert small.stats()["bytes"] <= small.max_bytes
+
+
+def test_float32_cache_files_are_reloaded_at_full_precision(tmp_path, monkeypatch):
+    import ohlcv_cache
+    cache = OHLCVCache(cache_dir=str(tmp_path), max_mb=64)
+    float32_dtypes = {**ohlcv_cache.COLUMN_DTYPES,
+                      **{column: np.dtype("f4") for column in ("open", "high", "low", "close")}}
+    float32_bars = np.dtype([("Date", "datetime64[D]")]
+                            + [(column, float32_dtypes[column]) for column in ohlcv_cache.COLUMNS])
+    with monkeypatch.context() as patch:
+        patch.setattr(ohlcv_cache, "COLUMN_DTYPES", float32_dtypes)
+        patch.setattr(ohlcv_cache, "BAR_DTYPE", float32_bars)
+        cache.store("OLD.NS", synthetic_history(0, bars=50))
+    cache.store("NEW.NS", synthetic_history(1, bars=50))
+
+    assert cache.load("OLD.NS") is None
+    assert cache.load("NEW.NS")["close"].dtype == np.float64
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+import back_trade
+import param_sweep
+from conftest import synthetic_history
+
+GRID = {"short_period": [20, 50], "long_period": [150, 200]}
+
+
+@pytest.mark.parametrize("symbol_index,scale", [(0, 1), (3, 80), (0, 100), (3, 100)])
+def test_sweep_matches_backtest(memory_store, monkeypatch, symbol_index, scale):
+    # Scaled up, 10 shares cost about the 100000 of cash: the broker rejects some of the buys
+    df = synthetic_history(symbol_index, bars=500)
+    df[["open", "high", "low", "close"]] *= scale
+    monkeypatch.setattr(back_trade, "get_data", lambda symbol: df)
+    expected = back_trade.backtest("S0.NS", plot=False)["profit_loss"]
+
+    table = param_sweep.sweep(["S0.NS"], grid=GRID, frames={"S0.NS": df}, workers=1)
+    row = table[(table["short_period"] == 50) & (table["long_period"] == 200)].iloc[0]
+    assert row["profit_loss"] == pytest.approx(expected, abs=1e-6)
+
+
+def test_process_pool_matches_serial_sweep(synthetic_frames):
+    symbols = list(synthetic_frames)
+    serial = param_sweep.sweep(symbols, grid=GRID, frames=synthetic_frames, workers=1)
+    pooled = param_sweep.sweep(symbols, grid=GRID, frames=synthetic_frames, workers=2)
+
+    assert len(serial) == 4
+    pd.testing.assert_frame_equal(serial, pooled)
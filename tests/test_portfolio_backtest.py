@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+import back_trade
+import yf_to_firestore
+from conftest import synthetic_history
+from yf_to_firestore import save_to_firestore
+
+SYMBOLS = [f"S{i}.NS" for i in range(3)]
+
+
+@pytest.fixture
+def one_stored_year(memory_store, monkeypatch):
+    """Two years of bars at Yahoo Finance, of which ingestion stored the last 260."""
+    histories = {symbol: synthetic_history(i, bars=520) for i, symbol in enumerate(SYMBOLS)}
+    for symbol, df in histories.items():
+        save_to_firestore(df.iloc[-260:].copy(), symbol)
+    downloads = []
+
+    def fake_download(symbols, start=None, end=None, **kwargs):
+        downloads.append(list(symbols))
+        return pd.concat({symbol: histories[symbol].loc[start:pd.Timestamp(end) - pd.Timedelta(days=1)]
+                         .rename(columns=str.capitalize) for symbol in symbols}, axis=1)
+
+    monkeypatch.setattr(yf_to_firestore.yf, "download", fake_download)
+    return histories, downloads
+
+
+def test_longer_period_is_backfilled_once(one_stored_year):
+    histories, downloads = one_stored_year
+    report = back_trade.portfolio_backtest(SYMBOLS, period="2y")
+
+    assert downloads == [SYMBOLS]
+    assert pd.Timestamp(report["start"]) < histories["S0.NS"].index[-260]
+
+    again = back_trade.portfolio_backtest(SYMBOLS, period="2y")
+    assert downloads == [SYMBOLS]
+    assert again["start"] == report["start"]
+    assert again["ending_capital"] == report["ending_capital"]
+
+
+def test_max_positions_must_be_positive(one_stored_year):
+    with pytest.raises(ValueError, match="max_positions"):
+        back_trade.portfolio_backtest(SYMBOLS, period="1y", max_positions=0)
+
+
+def test_symbol_listed_after_the_period_start_is_backfilled_once(one_stored_year):
+    histories, downloads = one_stored_year
+    # Listed about a year and a half ago: Yahoo Finance has no bars older than these
+    histories["S2.NS"] = histories["S2.NS"].iloc[-380:]
+
+    back_trade.portfolio_backtest(SYMBOLS, period="2y")
+    assert downloads == [SYMBOLS]
+
+    back_trade.portfolio_backtest(SYMBOLS, period="2y")
+    assert downloads == [SYMBOLS]
+    marker = yf_to_firestore.get_client().collection("stocks").document("S2.NS").get().to_dict()
+    assert pd.Timestamp(marker["history_start"]) == histories["S2.NS"].index[0]
@@ -0,0 +1,65 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import result_cache
+from firestore_util import create_document, get_document
+
+FIELDS = {"segment": "nifty50", "strategy": "MovingAverageCrossoverStrategy", "watermark": "2026-01-02"}
+
+
+def test_concurrent_identical_requests_share_one_run(memory_store):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        claims = list(executor.map(lambda i: result_cache.lookup_or_claim("key", FIELDS, f"run-{i}"), range(8)))
+
+    assert len({process_id for process_id, _ in claims}) == 1
+    assert sum(not reused for _, reused in claims) == 1
+    assert get_document(result_cache.RESULT_COLLECTION, "key")["processId"] == claims[0][0]
+
+
+def test_fresh_claim_without_process_document_is_reused(memory_store):
+    assert result_cache.lookup_or_claim("key", FIELDS, "first") == ("first", False)
+    # The first request has not created process-list/first yet
+    assert result_cache.lookup_or_claim("key", FIELDS, "second") == ("first", True)
+
+
+def test_stale_claim_invalidated_entry_and_refresh_start_a_new_run(memory_store):
+    result_cache.lookup_or_claim("key", FIELDS, "first")
+    old = (datetime.datetime.now() - result_cache.CLAIM_GRACE * 2).isoformat()
+    memory_store.collection(result_cache.RESULT_COLLECTION).document("key").update({"createdAt": old})
+    assert result_cache.lookup_or_claim("key", FIELDS, "second") == ("second", False)
+
+    create_document("process-list", "second", {"completionPercent": 100, "completionStatus": "Backtest completed",
+                                               "startTime": datetime.datetime.now().isoformat()})
+    assert result_cache.lookup_or_claim("key", FIELDS, "third") == ("second", True)
+    assert result_cache.lookup_or_claim("key", FIELDS, "fourth", refresh=True) == ("fourth", False)
+
+    memory_store.collection(result_cache.RESULT_COLLECTION).document("key").update({"invalidated": True})
+    assert result_cache.lookup_or_claim("key", FIELDS, "fifth") == ("fifth", False)
+
+
+def test_ingestion_invalidates_scans_of_any_watermark(memory_store):
+    result_cache.lookup_or_claim("key", FIELDS, "first")
+    create_document("process-list", "first", {"completionPercent": 100, "completionStatus": "Backtest completed",
+                                              "startTime": datetime.datetime.now().isoformat()})
+    assert result_cache.lookup_or_claim("key", FIELDS, "second") == ("first", True)
+
+    # FIELDS is keyed on a watermark other than today's calendar one
+    assert result_cache.invalidate_results() == 1
+    assert result_cache.lookup_or_claim("key", FIELDS, "third") == ("third", False)
+    assert result_cache.invalidate_results(watermark="2025-12-31") == 0
+
+
+def test_run_status_is_read_in_the_claiming_transaction(memory_store, monkeypatch):
+    result_cache.lookup_or_claim("key", FIELDS, "first")
+    create_document("process-list", "first", {"completionStatus": "Error: boom",
+                                              "startTime": datetime.datetime.now().isoformat()})
+    reads = []
+    get = type(memory_store.collection("process-list").document("first")).get
+
+    def recording_get(self, field_paths=None, transaction=None):
+        reads.append((self.path[0], transaction is not None))
+        return get(self, field_paths=field_paths, transaction=transaction)
+
+    monkeypatch.setattr(type(memory_store.collection("process-list").document("first")), "get", recording_get)
+    assert result_cache.lookup_or_claim("key", FIELDS, "second") == ("second", False)
+    assert ("process-list", True) in reads and ("process-list", False) not in reads
@@ -0,0 +1,27 @@
+import base64
+
+import pytest
+
+from result_store import ResultWriter, read_results
+
+
+def test_pages_cover_every_result_once(memory_store):
+    with ResultWriter("job") as writer:
+        writer.add_all({f"S{i}.NS": [{"signal": "Buy"}] for i in range(7)})
+
+    symbols, token = [], None
+    while True:
+        page, next_token = read_results("job", page_size=3, page_token=token)
+        if not page:
+            break
+        symbols += list(page)
+        token = next_token
+    assert sorted(symbols) == [f"S{i}.NS" for i in range(7)]
+
+
+@pytest.mark.parametrize("token", ["%%%", "abc", base64.urlsafe_b64encode(b"no separator").decode(),
+                                   base64.urlsafe_b64encode(b"yesterday|S0.NS").decode(),
+                                   base64.urlsafe_b64encode(b"\xff\xfe|x").decode()])
+def test_malformed_page_token_is_a_value_error(memory_store, token):
+    with pytest.raises(ValueError, match="Invalid page token"):
+        read_results("job", page_token=token)
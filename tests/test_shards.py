@@ -0,0 +1,77 @@
+import datetime
+
+import pytest
+
+import tradesignals
+from firestore_util import create_document, get_document
+
+TICKERS = [f"S{i}.NS" for i in range(6)]
+
+
+@pytest.fixture
+def sharded_job(memory_store, monkeypatch):
+    """A sharded job of 3 shards whose workers record the symbols they ran."""
+    runs = []
+
+    def run_symbols(tickers, chk_last_weeks):
+        runs.append(list(tickers))
+        return {symbol: [] for symbol in tickers}, {}, [], {}
+
+    monkeypatch.setattr(tradesignals, "_run_symbols", run_symbols)
+    create_document("process-list", "job", {"completionPercent": 0, "executor": "sharded",
+                                            "startTime": datetime.datetime.now().isoformat()})
+    tradesignals.fan_out_shards("job", TICKERS, shard_count=3)
+    return runs
+
+
+def _age(shard_id, field, age):
+    old = (datetime.datetime.now() - age).isoformat()
+    tradesignals._shards_ref("job").document(shard_id).update({field: old})
+
+
+def test_redelivered_trigger_runs_the_shard_once(sharded_job):
+    tradesignals.run_shard("job", "0000")
+    tradesignals.run_shard("job", "0000")
+
+    assert sharded_job == [["S0.NS", "S3.NS"]]
+    shard = tradesignals._shards_ref("job").document("0000").get().to_dict()
+    assert shard["status"] == "done" and shard["attempts"] == 1
+
+
+def test_late_progress_write_does_not_regress_a_completed_job(sharded_job):
+    for shard_id in ("0000", "0001", "0002"):
+        tradesignals.run_shard("job", shard_id)
+    assert get_document("process-list", "job")["completionPercent"] == 100
+
+    # A shard that read 2 of 3 shards finished only writes its progress now
+    tradesignals._shards_ref("job").document("0002").update({"status": "running"})
+    tradesignals._complete_shard("job")
+
+    job = get_document("process-list", "job")
+    assert job["completionPercent"] == 100 and job["completionStatus"] == "Backtest completed"
+
+
+def test_stale_shards_are_redriven_and_given_up_after_max_attempts(sharded_job):
+    tradesignals.run_shard("job", "0000")
+    # 0001 never got its trigger, 0002's worker crashed on its last attempt
+    _age("0001", "createdAt", tradesignals.SHARD_TIMEOUT * 2)
+    tradesignals._shards_ref("job").document("0002").update({"status": "running",
+                                                            "attempts": tradesignals.MAX_SHARD_ATTEMPTS})
+    _age("0002", "claimedAt", tradesignals.SHARD_TIMEOUT * 2)
+
+    assert tradesignals.redrive_stale_jobs() == 2
+
+    assert sharded_job == [["S0.NS", "S3.NS"], ["S1.NS", "S4.NS"]]
+    job = get_document("process-list", "job")
+    assert job["completionPercent"] == 100
+    assert set(job["errors"]) == {"S2.NS", "S5.NS"}
+    assert tradesignals.redrive_stale_jobs() == 0
+
+
+def test_running_shard_within_timeout_is_left_alone(sharded_job):
+    tradesignals._shards_ref("job").document("0000").update({
+        "status": "running", "attempts": 1, "claimedAt": datetime.datetime.now().isoformat()})
+
+    assert tradesignals.redrive_stale_shards("job") == 0
+    tradesignals.run_shard("job", "0000")
+    assert sharded_job == []
@@ -0,0 +1,24 @@
+import pytest
+
+import signal_engine
+from tradesignals import STRATEGIES, backtest
+
+
+@pytest.mark.parametrize("strategy", ["MovingAverageCrossoverStrategy", "MeanReversionStrategy",
+                                      "KNNMovingAverageCrossoverStrategy"])
+def test_scan_matches_backtrader(synthetic_frames, strategy):
+    symbols = list(synthetic_frames)
+    vectorized = signal_engine.scan(symbols, strategy=strategy, chk_last_weeks=999, frames=synthetic_frames)
+    # The multi-strategy scan shares indicators (the KNN features reuse the crossover SMAs)
+    multi = signal_engine.scan_multi(symbols, chk_last_weeks=999, frames=synthetic_frames)
+
+    assert sorted(vectorized) == sorted(symbols)
+    assert any(vectorized.values())
+    for symbol in symbols:
+        expected = backtest(symbol, chk_last_weeks=999, strategy=STRATEGIES[strategy], df=synthetic_frames[symbol])
+        assert signal_engine.same_signals(vectorized[symbol], expected), symbol
+        assert signal_engine.same_signals(multi[symbol][strategy], expected), symbol
+
+
+def test_verify_parity_reports_no_mismatches(synthetic_frames):
+    assert signal_engine.verify_parity(list(synthetic_frames), frames=synthetic_frames) == {}
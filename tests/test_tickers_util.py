@@ -0,0 +1,36 @@
+import pytest
+
+from tickers_util import UniverseRegistry, UniverseUnavailableError, universe_hash
+
+TICKERS = ["A.NS", "B.NS", "C.NS"]
+
+
+def _failing_source():
+    raise ConnectionError("scrape failed")
+
+
+def test_cold_start_falls_back_to_the_firestore_snapshot(memory_store, tmp_path):
+    warm = UniverseRegistry(sources={"nifty50": lambda: TICKERS}, snapshot_path=str(tmp_path / "warm.json"))
+    assert warm.get("nifty50") == TICKERS
+
+    # A new instance: empty /tmp and the scrape is down
+    cold = UniverseRegistry(sources={"nifty50": _failing_source}, snapshot_path=str(tmp_path / "cold.json"))
+    assert cold.get("nifty50") == TICKERS
+    assert cold.version("nifty50") == universe_hash(TICKERS)
+    assert cold.describe()["nifty50"]["source"] == "snapshot"
+
+
+def test_unchanged_universe_is_not_written_again(memory_store, tmp_path):
+    registry = UniverseRegistry(sources={"nifty50": lambda: TICKERS}, ttl=0, snapshot_path=str(tmp_path / "s.json"))
+    registry.get("nifty50")
+    writes = memory_store.writes
+    registry.get("nifty50")
+    assert memory_store.writes == writes
+
+
+def test_unavailable_universe_raises_its_own_error(memory_store, tmp_path):
+    registry = UniverseRegistry(sources={"nifty50": _failing_source}, snapshot_path=str(tmp_path / "s.json"))
+    with pytest.raises(UniverseUnavailableError):
+        registry.get("nifty50")
+    with pytest.raises(ValueError):
+        registry.get("unknown")
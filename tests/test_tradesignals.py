@@ -0,0 +1,18 @@
+import datetime
+
+import pytest
+
+import tradesignals
+from firestore_util import create_document, get_document
+
+
+@pytest.mark.parametrize("options", [{"engine": "vectorised"}, {"executor": "threads"}])
+def test_unknown_engine_or_executor_is_rejected(memory_store, options):
+    with pytest.raises(ValueError, match="Unknown"):
+        tradesignals.run_backtests("S0.NS", single=True, **options)
+    assert memory_store.collection("process-list").get() == []
+
+    # A run created elsewhere fails instead of falling back to the serial backtrader scan
+    create_document("process-list", "run", {"startTime": datetime.datetime.now().isoformat()})
+    tradesignals.async_backtest("S0.NS", "run", single=True, **options)
+    assert get_document("process-list", "run")["completionStatus"].startswith("Error: Unknown")